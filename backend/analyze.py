@@ -0,0 +1,286 @@
+"""Offline video analytics: process recorded footage as fast as possible.
+
+Usage:
+    python analyze.py footage/*.mp4 --output-dir analytics --workers 4
+    python analyze.py footage/ --backend onnx --option model_path=yolov8n.onnx --option num_threads=2
+    python analyze.py footage/ --format parquet --zones zones/camera_0.json --tracking --skip-existing
+
+Each video goes through VehicleDetector without pacing, drawing or JPEG
+encoding. Videos are spread across a process pool, and each worker loads the
+model once. Per video the output is:
+
+  <name>.npz (or <name>_frames.parquet and <name>_detections.parquet)
+      per-frame columns: frame, time_s, zone counts, total, occupied cells, grid counts
+      per-detection columns: frame plus every DETECTION_DTYPE field
+  <name>_summary.json
+      frames, speed, detections and per-zone mean/p95/max
+
+A combined analytics_summary.json is written for the whole run.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from backends import create_backend
+from detection import VehicleDetector, DETECTION_DTYPE
+from zones import ZoneLayout
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.mpg', '.ts')
+
+# Per-process state set up once by init_worker
+_worker = {}
+
+def init_worker(backend, options, zones, tracking, threads):
+    """Load the model once per worker process"""
+    cv2.setNumThreads(threads)
+    _worker['backend'] = create_backend(backend, **options)
+    _worker['zones'] = zones
+    _worker['tracking'] = tracking
+
+def read_batches(capture, batch_size, stride):
+    """Yield (frame_indices, frames) batches, grabbing but not decoding skipped frames"""
+    index = 0
+    indices, frames = [], []
+    while True:
+        if index % stride:
+            if not capture.grab():
+                break
+            index += 1
+            continue
+        ok, frame = capture.read()
+        if not ok:
+            break
+        indices.append(index)
+        frames.append(frame)
+        index += 1
+        if len(frames) == batch_size:
+            yield indices, frames
+            indices, frames = [], []
+    if frames:
+        yield indices, frames
+
+def analyze_file(path, output_path, batch_size=8, stride=1, output_format='npz'):
+    """Detect vehicles in every (stride-th) frame of one video and write columnar results"""
+    zones = _worker['zones']
+    detector = VehicleDetector(_worker['backend'], zone_layout=ZoneLayout.load(zones) if zones else None)
+    if _worker['tracking']:
+        detector.tracker = detector.create_tracker()
+    zone_names = detector.zone_layout.zone_names
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    frame_index, zone_counts, grids, detection_chunks, detection_frames = [], [], [], [], []
+    started = time.perf_counter()
+    for indices, frames in read_batches(capture, batch_size, stride):
+        for index, frame, boxes in zip(indices, frames, detector.infer_batch(frames)):
+            height, width = frame.shape[:2]
+            detections = detector.apply_detections(boxes, width, height, now=index / fps)  # Video time
+            frame_index.append(index)
+            zone_counts.append([detector.zone_counts[name] for name in zone_names])
+            grids.append(detector.grid_density.ravel())
+            detection_chunks.append(detections)
+            detection_frames.append(np.full(len(detections), index, dtype=np.int64))
+    capture.release()
+    elapsed = time.perf_counter() - started
+
+    frame_index = np.array(frame_index, dtype=np.int64)
+    cells = detector.grid_rows * detector.grid_cols
+    columns = {
+        "frame": frame_index,
+        "time_s": frame_index / fps,
+        "zone_counts": np.array(zone_counts, dtype=np.int16).reshape(-1, len(zone_names)),
+        "grid": np.array(grids, dtype=np.int16).reshape(-1, cells)
+    }
+    # Lane zones overlap the bands, so the total only counts primary-layer zones
+    columns["total"] = columns["zone_counts"][:, detector.zone_layout.primary_zones].sum(axis=1, dtype=np.int32)
+    columns["occupied_cells"] = np.count_nonzero(columns["grid"], axis=1).astype(np.int16)
+    detections = np.concatenate(detection_chunks) if detection_chunks else np.empty(0, dtype=DETECTION_DTYPE)
+    detection_frame = np.concatenate(detection_frames) if detection_frames else np.empty(0, dtype=np.int64)
+
+    if output_format == 'parquet':
+        write_parquet(output_path, columns, zone_names, detection_frame, detections)
+    else:
+        write_npz(output_path, columns, zone_names, (detector.grid_rows, detector.grid_cols),
+                  detection_frame, detections)
+
+    summary = summarize(path, columns, zone_names, detections, fps, elapsed)
+    if detector.tracker is not None:
+        tracking = detector.tracker.get_stats(zone_names, now=frame_index[-1] / fps if len(frame_index) else 0.0)
+        summary["unique_vehicles"] = tracking["unique_vehicles"]
+        summary["line_crossings"] = tracking["line_crossings"]
+    with open(output_path + "_summary.json", "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return summary
+
+def write_npz(output_path, columns, zone_names, grid_shape, detection_frame, detections):
+    """One compressed NPZ per video: frame columns plus det_* detection columns"""
+    arrays = dict(columns, zone_names=np.array(zone_names), grid_shape=np.array(grid_shape),
+                  det_frame=detection_frame)
+    for field in DETECTION_DTYPE.names:
+        arrays[f"det_{field}"] = detections[field]
+    np.savez_compressed(output_path + ".npz", **arrays)
+
+def write_parquet(output_path, columns, zone_names, detection_frame, detections):
+    """Frame and detection tables as Parquet (needs pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    frame_columns = {"frame": columns["frame"], "time_s": columns["time_s"]}
+    for i, name in enumerate(zone_names):
+        frame_columns[name] = columns["zone_counts"][:, i]
+    frame_columns["total"] = columns["total"]
+    frame_columns["occupied_cells"] = columns["occupied_cells"]
+    for cell in range(columns["grid"].shape[1]):
+        frame_columns[f"cell_{cell}"] = columns["grid"][:, cell]
+    pq.write_table(pa.table(frame_columns), output_path + "_frames.parquet", compression="zstd")
+
+    detection_columns = {"frame": detection_frame}
+    detection_columns.update({field: detections[field] for field in DETECTION_DTYPE.names})
+    pq.write_table(pa.table(detection_columns), output_path + "_detections.parquet", compression="zstd")
+
+def summarize(path, columns, zone_names, detections, fps, elapsed):
+    """Summary statistics for one video"""
+    frames = len(columns["frame"])
+    summary = {
+        "file": path,
+        "frames_processed": frames,
+        "video_seconds": round(float(columns["time_s"][-1]) if frames else 0.0, 2),
+        "wall_seconds": round(elapsed, 2),
+        "fps": round(frames / elapsed, 1) if elapsed else 0.0,
+        "detections": int(len(detections)),
+        "zones": {}
+    }
+    if not frames:
+        return summary
+
+    for i, name in enumerate(zone_names):
+        counts = columns["zone_counts"][:, i]
+        summary["zones"][name] = {
+            "mean": round(float(counts.mean()), 2),
+            "p95": round(float(np.percentile(counts, 95)), 2),
+            "max": int(counts.max())
+        }
+    totals = columns["total"]
+    summary["total_vehicles"] = {"mean": round(float(totals.mean()), 2), "max": int(totals.max())}
+    summary["peak_time_s"] = round(float(columns["time_s"][int(totals.argmax())]), 2)
+    summary["occupied_cells_mean"] = round(float(columns["occupied_cells"].mean()), 2)
+    return summary
+
+def find_videos(inputs):
+    """Expand files, directories and glob patterns into a sorted list of videos"""
+    videos = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                videos.extend(os.path.join(root, name) for name in files
+                              if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.extend(glob.glob(item) or [item])
+    return sorted(dict.fromkeys(videos))
+
+def output_names(videos, output_dir):
+    """Unique output path prefix per video"""
+    names, used = {}, set()
+    for video in videos:
+        stem = os.path.splitext(os.path.basename(video))[0]
+        name, suffix = stem, 1
+        while name in used:
+            suffix += 1
+            name = f"{stem}_{suffix}"
+        used.add(name)
+        names[video] = os.path.join(output_dir, name)
+    return names
+
+def parse_options(items):
+    """key=value backend options (numbers are converted)"""
+    options = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        options[key] = value
+    return options
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch vehicle analytics for recorded video")
+    parser.add_argument("inputs", nargs="+", help="Video files, directories or glob patterns")
+    parser.add_argument("--output-dir", default="analytics")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="OpenCV threads per worker")
+    parser.add_argument("--backend", default="ultralytics", help="ultralytics, onnx, onnx-int8 or synthetic")
+    parser.add_argument("--option", action="append", default=[], help="Backend option key=value (repeatable)")
+    parser.add_argument("--zones", help="Zone layout JSON (default: the three horizontal bands)")
+    parser.add_argument("--tracking", action="store_true", help="Track vehicles for unique counts and crossings")
+    parser.add_argument("--batch-size", type=int, default=8, help="Frames per model call")
+    parser.add_argument("--stride", type=int, default=1, help="Analyse every n-th frame")
+    parser.add_argument("--format", choices=("npz", "parquet"), default="npz")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip videos that already have a summary")
+    args = parser.parse_args()
+
+    videos = find_videos(args.inputs)
+    os.makedirs(args.output_dir, exist_ok=True)
+    names = output_names(videos, args.output_dir)
+    if args.skip_existing:
+        videos = [video for video in videos if not os.path.exists(names[video] + "_summary.json")]
+    if not videos:
+        print("No videos to process")
+        return
+
+    init_args = (args.backend, parse_options(args.option), args.zones, args.tracking, args.threads)
+    task_args = (args.batch_size, args.stride, args.format)
+    summaries, failures = [], {}
+    started = time.perf_counter()
+    print(f"Processing {len(videos)} video(s) with {min(args.workers, len(videos))} worker(s)...")
+
+    if args.workers <= 1 or len(videos) == 1:
+        init_worker(*init_args)
+        for video in videos:
+            try:
+                summaries.append(analyze_file(video, names[video], *task_args))
+                print(f"{video}: {summaries[-1]['frames_processed']} frames at {summaries[-1]['fps']} FPS")
+            except Exception as e:
+                failures[video] = str(e)
+                print(f"Error processing {video}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=init_args) as pool:
+            futures = {pool.submit(analyze_file, video, names[video], *task_args): video for video in videos}
+            for future in as_completed(futures):
+                video = futures[future]
+                try:
+                    summaries.append(future.result())
+                    print(f"{video}: {summaries[-1]['frames_processed']} frames at {summaries[-1]['fps']} FPS")
+                except Exception as e:
+                    failures[video] = str(e)
+                    print(f"Error processing {video}: {e}")
+
+    elapsed = time.perf_counter() - started
+    frames = sum(summary["frames_processed"] for summary in summaries)
+    video_seconds = sum(summary["video_seconds"] for summary in summaries)
+    run_summary = {
+        "videos": len(summaries),
+        "failed": failures,
+        "frames_processed": frames,
+        "video_hours": round(video_seconds / 3600, 3),
+        "wall_seconds": round(elapsed, 2),
+        "fps": round(frames / elapsed, 1) if elapsed else 0.0,
+        "speedup_vs_realtime": round(video_seconds / elapsed, 1) if elapsed else 0.0,
+        "files": sorted(summaries, key=lambda summary: summary["file"])
+    }
+    with open(os.path.join(args.output_dir, "analytics_summary.json"), "w") as summary_file:
+        json.dump(run_summary, summary_file, indent=2)
+    print(f"Processed {frames} frames ({run_summary['video_hours']} h of video) in {elapsed:.1f} s "
+          f"({run_summary['speedup_vs_realtime']}x real time)")
+
+if __name__ == '__main__':
+    main()
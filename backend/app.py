@@ -2,25 +2,57 @@ from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import cv2
 import json
+import logging
 import threading
 import time
 from detection import VehicleDetector
 from signal_logic import TrafficSignalController
-import mysql.connector
-from datetime import datetime
+from pipeline import FramePipeline, LATEST
+from batching import BatchInferenceEngine
+from backends import shared_backend
+from motion import MotionGate
+from zones import ZoneLayout
+from storage import HistoryWriter, create_store_factory, rollup_points, ROLLUP_SECONDS
+from history import CongestionHistory
+from broadcast import SnapshotBroadcaster
+from corridor import CorridorController
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, VIEWERS
+from datetime import datetime, timedelta
 import os
+import sys
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize components
-detector = VehicleDetector()
-signal_controller = TrafficSignalController()
+# Detector backend: ultralytics, onnx, onnx-int8 or synthetic
+DETECTOR_CONFIG = {
+    'backend': os.environ.get('DETECTOR_BACKEND', 'ultralytics'),
+    'options': {},  # e.g. {'model_path': 'yolov8n.onnx', 'num_threads': 4}
+    'regions': None,  # e.g. FAR_ZONE_REGIONS: full frame at 320 px, far-zone tiles at the backend's input_size
+    'warm_up': os.environ.get('MODEL_WARM_UP', '1') != '0'  # Load the model in the background when pipelines start
+}
+
+# Dynamic green timing thresholds; overrides of signal_logic.DEFAULT_TIMING_POLICY
+# (evaluate candidates offline with simulator.py)
+SIGNAL_CONFIG = {
+    'timing_policy': {}  # e.g. {'red_threshold': 6, 'red_green': 70}
+}
+
+# Components are created by create_app(), so importing this module stays cheap
+model = None       # Shared lazily loaded model handle
+detector = None
+signal_controller = None
+started_at = time.monotonic()
 
 # Global variables
-camera = None
-current_frame = None
-congestion_history = []
+camera = None      # Primary camera
+pipeline = None    # Primary camera pipeline
+cameras = {}       # camera_id -> cv2.VideoCapture
+pipelines = {}     # camera_id -> FramePipeline
+camera_detectors = {}  # camera_id -> per-camera detector state
+primary_camera_id = None
+batch_engine = None
+congestion_history = CongestionHistory(capacity=3600 * 30)  # ~1 hour at 30 FPS
 
 # Database configuration (optional)
 DB_CONFIG = {
@@ -30,102 +62,278 @@ DB_CONFIG = {
     'database': 'traffic_management'
 }
 
-def init_camera():
-    """Initialize camera (webcam first, then fallback to video file)"""
-    global camera
-    
-    # Try webcam first
-    camera = cv2.VideoCapture(0)
-    if not camera.isOpened():
-        print("Webcam not available, trying video file...")
-        # Fallback to video file if available
-        if os.path.exists("traffic.mp4"):
-            camera = cv2.VideoCapture("traffic.mp4")
-        else:
-            print("No video source available!")
-            return False
+# Live pipeline configuration
+PIPELINE_CONFIG = {
+    'queue_size': 2,
+    'overflow_policy': LATEST,  # block, drop_oldest, drop_newest or latest
+    'max_fps': None,            # Defaults to the source FPS
+    'jpeg_quality': 80,
+    'render': True              # False for headless / API-only deployments
+}
+
+# Camera sources and cross-camera batching
+CAMERA_CONFIG = {
+    'sources': [],          # Webcam indices or video files; empty = webcam, then traffic.mp4
+    'batch_size': 8,        # Max frames per model call
+    'max_batch_wait': 0.01, # Seconds to wait for a batch to fill
+    'zones_dir': 'zones'    # Per-camera zone/grid layouts: <zones_dir>/<camera_id>.json
+}
+
+# Motion-gated / adaptive-rate inference
+MOTION_CONFIG = {
+    'enabled': True,
+    'adaptive': True,       # Lower the inference rate under low activity
+    'max_interval': 0.5,    # Slowest inference interval (seconds)
+    'max_staleness': 1.0    # Detections are always refreshed at least this often
+}
+
+# Multi-object tracking (unique counts, flow rate, dwell time, queue length)
+TRACKING_CONFIG = {
+    'enabled': True,
+    'max_age': 1.0,   # Seconds a lost vehicle keeps its ID
+    'min_hits': 3     # Matches before a track counts as a vehicle
+}
+
+def create_app():
+    """Application factory: create the shared components and return the Flask app.
+    
+    Nothing heavy happens here: the model handle loads its weights on first
+    inference, or on a background thread once start_pipeline() runs with
+    warm-up enabled. Cameras, pipelines and persistence are started
+    separately by the server entry point, so `gunicorn 'app:create_app()'`
+    serves only the API and never imports torch or loads weights.
+    """
+    global model, detector, signal_controller
+    if signal_controller is not None:
+        return app
+    
+    model = shared_backend(DETECTOR_CONFIG['backend'], regions=DETECTOR_CONFIG['regions'],
+                           **DETECTOR_CONFIG['options'])
+    detector = VehicleDetector(model)
+    signal_controller = TrafficSignalController(timing_policy=SIGNAL_CONFIG['timing_policy'])
+    return app
+
+def create_motion_gate():
+    """Create a motion gate for one camera, or None when gating is disabled"""
+    if not MOTION_CONFIG['enabled']:
+        return None
+    options = {key: value for key, value in MOTION_CONFIG.items() if key != 'enabled'}
+    return MotionGate(**options)
+
+def open_camera(source):
+    """Open a webcam index or video file, returning None if unavailable"""
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        return None
     
     # Set camera properties for better performance
-    camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    camera.set(cv2.CAP_PROP_FPS, 30)
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    capture.set(cv2.CAP_PROP_FPS, 30)
+    return capture
+
+def init_camera():
+    """Initialize cameras (configured sources, else webcam then video file)"""
+    global camera, primary_camera_id
     
+    sources = CAMERA_CONFIG['sources']
+    if sources:
+        for index, source in enumerate(sources):
+            capture = open_camera(source)
+            if capture is None:
+                print(f"Could not open video source: {source}")
+                continue
+            cameras[f"camera_{index}"] = capture
+    else:
+        # Try webcam first
+        capture = open_camera(0)
+        if capture is None:
+            print("Webcam not available, trying video file...")
+            # Fallback to video file if available
+            if os.path.exists("traffic.mp4"):
+                capture = open_camera("traffic.mp4")
+        if capture is not None:
+            cameras["camera_0"] = capture
+    
+    if not cameras:
+        print("No video source available!")
+        return False
+    
+    primary_camera_id = next(iter(cameras))
+    camera = cameras[primary_camera_id]
     return True
 
+# Coordinated corridor of intersections (green wave); each entry maps an
+# intersection to the camera watching its approach and its distance in metres
+CORRIDOR_CONFIG = {
+    'enabled': False,
+    'speed_kmh': 50,        # Progression speed of the green wave
+    'min_cycle': 60,
+    'max_cycle': 120,
+    'intersections': []     # e.g. [{'id': 'main_1', 'camera': 'camera_0', 'distance': 0},
+                            #       {'id': 'main_2', 'camera': 'camera_1', 'distance': 400}]
+}
+
+corridor = None
+
+def init_corridor():
+    """Create the corridor controller and log its signal changes"""
+    global corridor
+    if not CORRIDOR_CONFIG['enabled'] or not CORRIDOR_CONFIG['intersections']:
+        return
+    
+    corridor = CorridorController(CORRIDOR_CONFIG['intersections'],
+                                  speed_kmh=CORRIDOR_CONFIG['speed_kmh'],
+                                  min_cycle=CORRIDOR_CONFIG['min_cycle'],
+                                  max_cycle=CORRIDOR_CONFIG['max_cycle'])
+    if history_writer is not None:
+        corridor.add_listener(lambda intersection_id, signal, duration, reason:
+                              history_writer.record_signal_change(signal, duration, reason, intersection_id))
+    
+    # A coordinated primary junction is timed by the corridor alone
+    if corridor.has_camera(primary_camera_id):
+        signal_controller.stop()
+    print(f"Corridor controller managing {len(corridor.intersections)} intersections")
+
+def primary_signal():
+    """Signal of the primary camera's junction: its corridor intersection when
+    coordinated, otherwise the isolated signal controller"""
+    if corridor is not None and corridor.has_camera(primary_camera_id):
+        return corridor.by_camera[primary_camera_id][0]
+    return signal_controller
+
+# Write-behind persistence of congestion and signal history
+PERSISTENCE_CONFIG = {
+    'enabled': True,
+    'backend': os.environ.get('HISTORY_BACKEND', 'mysql'),  # mysql or sqlite
+    'sqlite_path': 'traffic_history.db',
+    'pool_size': 4,
+    'batch_size': 200,        # Rows per multi-row INSERT
+    'flush_interval': 2.0,    # Seconds between flushes
+    'spill_path': 'history_spill.jsonl',  # Used while the database is unavailable
+    'rollups': True,          # Maintain per-minute/hour/day rollups and system_stats
+    'range_max_points': 1000  # Default point budget of /api/history/range
+}
+
+history_writer = None
+history_store = None   # Read-side store for range queries (the writer keeps its own)
+history_store_lock = threading.Lock()
+
+def create_history_store_factory():
+    """Callable that opens the configured history store"""
+    return create_store_factory(PERSISTENCE_CONFIG['backend'],
+                                mysql_config=DB_CONFIG,
+                                sqlite_path=PERSISTENCE_CONFIG['sqlite_path'],
+                                pool_size=PERSISTENCE_CONFIG['pool_size'])
+
+def init_history_writer():
+    """Start the background history writer and record signal changes"""
+    global history_writer
+    if not PERSISTENCE_CONFIG['enabled']:
+        return
+    
+    history_writer = HistoryWriter(create_history_store_factory(),
+                                   batch_size=PERSISTENCE_CONFIG['batch_size'],
+                                   flush_interval=PERSISTENCE_CONFIG['flush_interval'],
+                                   spill_path=PERSISTENCE_CONFIG['spill_path'],
+                                   rollups=PERSISTENCE_CONFIG['rollups'])
+    history_writer.start()
+    signal_controller.add_listener(history_writer.record_signal_change)
+
 def save_to_database(congestion_data):
-    """Save congestion data to MySQL database (optional)"""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        query = """
-        INSERT INTO congestion_data 
-        (timestamp, green_zone_count, yellow_zone_count, red_zone_count, signal_status)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        
-        values = (
-            datetime.now(),
-            congestion_data['zone_counts']['green_zone'],
-            congestion_data['zone_counts']['yellow_zone'],
-            congestion_data['zone_counts']['red_zone'],
-            signal_controller.current_signal
-        )
-        
-        cursor.execute(query, values)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-    except mysql.connector.Error as e:
-        print(f"Database error: {e}")
-    except Exception as e:
-        print(f"Error saving to database: {e}")
-
-def generate_frames():
-    """Generate video frames with vehicle detection"""
-    global current_frame, congestion_history
-    
-    while True:
-        if camera is None or not camera.isOpened():
-            break
-            
-        success, frame = camera.read()
-        if not success:
-            # If using video file, loop it
-            if hasattr(camera, 'get') and camera.get(cv2.CAP_PROP_POS_FRAMES) == camera.get(cv2.CAP_PROP_FRAME_COUNT):
-                camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
-        
-        # Detect vehicles and get annotated frame
-        annotated_frame = detector.detect_vehicles(frame)
-        current_frame = annotated_frame
-        
-        # Get congestion data
-        congestion_data = detector.get_congestion_data()
-        
-        # Update signal timing based on congestion
+    """Queue congestion data for the database (never blocks)"""
+    if history_writer is not None:
+        history_writer.record_congestion(congestion_data, primary_signal().current_signal)
+
+def record_congestion(congestion_data):
+    """Update signal timing and history once per processed frame"""
+    # Update signal timing based on congestion (a corridor junction is timed by corridor.update)
+    signal = primary_signal()
+    if signal is signal_controller:
         signal_controller.calculate_dynamic_timing(congestion_data)
-        
-        # Store congestion history (keep last 100 entries)
-        congestion_history.append({
-            **congestion_data,
-            'signal_status': signal_controller.current_signal
-        })
-        if len(congestion_history) > 100:
-            congestion_history.pop(0)
-        
-        # Save to database (optional)
-        # save_to_database(congestion_data)
-        
-        # Encode frame as JPEG
-        ret, buffer = cv2.imencode('.jpg', annotated_frame)
-        frame_bytes = buffer.tobytes()
-        
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        time.sleep(0.033)  # ~30 FPS
+    
+    # Store congestion history (ring buffer with rolling statistics)
+    congestion_history.append(congestion_data, signal.current_signal)
+    
+    # Save to database (buffered, written in batches)
+    save_to_database(congestion_data)
+
+# Server push of dashboard snapshots (/api/stream)
+STREAM_CONFIG = {
+    'enabled': True,
+    'interval': 1.0,        # Seconds between snapshots (the signal countdown resolution)
+    'history_points': 5,    # History delta is averaged into at most this many points
+    'keepalive': 15.0       # Seconds of silence before a keepalive comment
+}
+
+broadcaster = None
+last_history_timestamp = None
+
+def build_snapshot():
+    """Congestion, signal state, health and history since the previous snapshot"""
+    global last_history_timestamp
+    since = last_history_timestamp
+    latest = congestion_history.latest_timestamp()
+    history_delta = []
+    if latest is not None and (since is None or latest > since):
+        history_delta = congestion_history.query(since=since, max_points=STREAM_CONFIG['history_points'])
+        last_history_timestamp = latest
+    
+    return {
+        'congestion': camera_detectors.get(primary_camera_id, detector).get_congestion_data(),
+        'signal': primary_signal().get_signal_status(),
+        'history_delta': history_delta,
+        'health': health_status(),
+        'timestamp': datetime.now().isoformat()
+    }
+
+def init_broadcaster():
+    """Start pushing snapshots; signal changes are pushed immediately"""
+    global broadcaster, last_history_timestamp
+    if not STREAM_CONFIG['enabled']:
+        return
+    
+    # Clients load earlier history from /api/history once, then apply deltas
+    last_history_timestamp = time.time()
+    broadcaster = SnapshotBroadcaster(build_snapshot,
+                                      interval=STREAM_CONFIG['interval'],
+                                      keepalive=STREAM_CONFIG['keepalive'])
+    broadcaster.start()
+    primary_signal().add_listener(broadcaster.notify)
+
+# Serving mode: 'threaded' (Flask dev server, one thread per connection) or
+# 'async' (aiohttp event loop for many live-feed viewers; needs aiohttp)
+SERVER_CONFIG = {
+    'mode': os.environ.get('SERVER_MODE', 'threaded'),
+    'host': '0.0.0.0',
+    'port': 5000,
+    'write_timeout': 10.0,  # Async mode drops clients that stall longer than this
+    'json_workers': 8       # Async mode threads for the JSON routes
+}
+
+def generate_frames(camera_id=None):
+    """Stream frames published by the shared detection pipeline"""
+    camera_id = camera_id or primary_camera_id
+    feed = pipelines.get(camera_id)
+    if feed is None:
+        return
+    
+    VIEWERS.inc('live-feed', camera_id)
+    try:
+        last_seq = 0
+        while feed.running:
+            frame_bytes, last_seq = feed.wait_for_frame(last_seq)
+            if frame_bytes is None:
+                continue
+            # Length, sequence and publish time let load_test.py measure delivery
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n' +
+                   f"Content-Length: {len(frame_bytes)}\r\nX-Frame-Seq: {last_seq}\r\n"
+                   f"X-Timestamp: {time.time():.6f}\r\n\r\n".encode() + frame_bytes + b'\r\n')
+    finally:
+        VIEWERS.dec('live-feed', camera_id)
 
 @app.route('/')
 def home():
@@ -134,14 +342,23 @@ def home():
         'message': 'Smart Traffic Management System',
         'status': 'running',
         'camera_active': camera is not None and camera.isOpened(),
-        'signal_controller_active': signal_controller.running,
+        'signal_controller_active': signal_controller is not None and primary_signal().running,
         'available_endpoints': {
             'health': '/api/health',
+            'liveness': '/api/health/live',
+            'readiness': '/api/health/ready',
             'live_feed': '/api/live-feed',
             'congestion': '/api/congestion',
             'signal_status': '/api/signal-status',
             'history': '/api/history',
+            'history_range': '/api/history/range',
+            'system_stats': '/api/system-stats',
             'stats': '/api/stats',
+            'pipeline': '/api/pipeline',
+            'cameras': '/api/cameras',
+            'stream': '/api/stream',
+            'corridor': '/api/corridor',
+            'metrics': '/metrics',
             'force_signal': '/api/force-signal (POST)'
         },
         'timestamp': datetime.now().isoformat()
@@ -149,28 +366,158 @@ def home():
 
 @app.route('/api/live-feed')
 def live_feed():
-    """Stream live video feed with vehicle detection"""
-    return Response(generate_frames(),
+    """Stream live video feed with vehicle detection (?camera=<id> to pick a feed)"""
+    return Response(generate_frames(request.args.get('camera')),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/api/stream')
+def stream():
+    """Server-sent events: one snapshot per update shared by every client"""
+    if broadcaster is None:
+        return jsonify({'success': False, 'message': 'Streaming is disabled'}), 503
+    return Response(broadcaster.subscribe(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/congestion')
 def get_congestion():
-    """Get current congestion data"""
-    congestion_data = detector.get_congestion_data()
+    """Get current congestion data (?camera=<id> to pick a feed)"""
+    camera_id = request.args.get('camera') or primary_camera_id
+    camera_detector = camera_detectors.get(camera_id, detector)
+    congestion_data = camera_detector.get_congestion_data()
     return jsonify(congestion_data)
 
 @app.route('/api/signal-status')
 def get_signal_status():
     """Get current traffic signal status"""
-    signal_status = signal_controller.get_signal_status()
+    signal_status = primary_signal().get_signal_status()
     return jsonify(signal_status)
 
+def parse_since(value):
+    """Parse a since= parameter given as epoch seconds or an ISO timestamp"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
 @app.route('/api/history')
 def get_history():
-    """Get congestion history"""
+    """Get congestion history (?since=<epoch|iso>&limit=50&max_points=<n>)
+
+    With since and no max_points the oldest `limit` readings after it are
+    returned; 'truncated' says whether more follow (page on from the last timestamp).
+    """
+    try:
+        since = parse_since(request.args.get('since'))
+        limit = request.args.get('limit', 50, type=int)
+        max_points = request.args.get('max_points', type=int)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid since timestamp'}), 400
+    if limit <= 0 or (max_points is not None and max_points <= 0):
+        return jsonify({'success': False, 'message': 'limit and max_points must be positive'}), 400
+    
+    # One extra row tells whether the limit cut the result short
+    history = congestion_history.query(since=since, limit=limit + 1, max_points=max_points)
+    truncated = not max_points and len(history) > limit
+    if truncated:
+        # Drop the extra row: the oldest one without since, the newest one with it
+        history = history[1:] if since is None else history[:limit]
     return jsonify({
-        'history': congestion_history[-50:],  # Last 50 entries
-        'total_entries': len(congestion_history)
+        'history': history,
+        'truncated': truncated,
+        'total_entries': len(congestion_history),
+        'latest_timestamp': congestion_history.latest_timestamp()
+    })
+
+def query_history_store(method, *args):
+    """Run a read on the shared history store, reconnecting after failures"""
+    global history_store
+    with history_store_lock:
+        try:
+            if history_store is None:
+                history_store = create_history_store_factory()()
+            return getattr(history_store, method)(*args)
+        except Exception:
+            if history_store is not None:
+                history_store.close()
+            history_store = None
+            raise
+
+def choose_resolution(since, until, max_points):
+    """Finest resolution covering [since, until) in at most max_points points"""
+    oldest = congestion_history.oldest_timestamp()
+    if oldest is not None and since >= oldest:
+        return 'raw'  # Still in the in-memory buffer
+    for resolution in ('minute', 'hour', 'day'):
+        if (until - since) / ROLLUP_SECONDS[resolution] <= max_points:
+            return resolution
+    return 'day'
+
+@app.route('/api/history/range')
+def get_history_range():
+    """Congestion over a time range at a resolution that fits the point budget
+    (?since=<epoch|iso>&until=<epoch|iso>&max_points=1000&resolution=auto|raw|minute|hour|day)"""
+    try:
+        until = parse_since(request.args.get('until'))
+        since = parse_since(request.args.get('since'))
+        max_points = request.args.get('max_points', PERSISTENCE_CONFIG['range_max_points'], type=int)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid since/until timestamp'}), 400
+    until = time.time() if until is None else until
+    since = until - 3600 if since is None else since
+    if since >= until or max_points <= 0:
+        return jsonify({'success': False, 'message': 'Empty time range'}), 400
+    
+    resolution = request.args.get('resolution', 'auto')
+    if resolution == 'auto':
+        resolution = choose_resolution(since, until, max_points)
+    
+    if resolution == 'raw':
+        history = congestion_history.query(since=since, until=until, max_points=max_points)
+    elif resolution in ROLLUP_SECONDS:
+        if not PERSISTENCE_CONFIG['enabled'] or not PERSISTENCE_CONFIG['rollups']:
+            return jsonify({'success': False, 'message': 'Rollups are disabled'}), 503
+        try:
+            rows = query_history_store('select_rollups', resolution,
+                                       datetime.fromtimestamp(since), datetime.fromtimestamp(until))
+        except Exception as e:
+            print(f"History query error: {e}")
+            return jsonify({'success': False, 'message': 'History database unavailable'}), 503
+        history = rollup_points(rows)
+    else:
+        return jsonify({'success': False, 'message': f'Invalid resolution: {resolution}'}), 400
+    
+    return jsonify({
+        'resolution': resolution,
+        'since': datetime.fromtimestamp(since).isoformat(),
+        'until': datetime.fromtimestamp(until).isoformat(),
+        'points': len(history),
+        'history': history
+    })
+
+@app.route('/api/system-stats')
+def get_system_stats():
+    """Daily system_stats rows maintained by the history writer (?days=30)"""
+    days = max(request.args.get('days', 30, type=int), 1)  # Today at least
+    since = (datetime.now() - timedelta(days=days - 1)).date()
+    try:
+        rows = query_history_store('select_system_stats', since)
+    except Exception as e:
+        print(f"History query error: {e}")
+        return jsonify({'success': False, 'message': 'History database unavailable'}), 503
+    return jsonify({
+        'days': [
+            {
+                'date': str(day),
+                'total_vehicles_detected': vehicles,
+                'avg_congestion_level': float(average) if average is not None else None,
+                'peak_congestion_time': str(peak) if peak is not None else None,
+                'total_signal_changes': signal_changes,
+                'system_uptime_minutes': uptime
+            }
+            for day, vehicles, average, peak, signal_changes, uptime in rows
+        ]
     })
 
 @app.route('/api/force-signal', methods=['POST'])
@@ -180,7 +527,7 @@ def force_signal():
     signal = data.get('signal', '').upper()
     
     if signal in ['GREEN', 'YELLOW', 'RED']:
-        signal_controller.force_signal_change(signal)
+        primary_signal().force_signal_change(signal)
         return jsonify({'success': True, 'message': f'Signal changed to {signal}'})
     else:
         return jsonify({'success': False, 'message': 'Invalid signal'}), 400
@@ -188,62 +535,263 @@ def force_signal():
 @app.route('/api/stats')
 def get_stats():
     """Get overall system statistics"""
-    if not congestion_history:
+    if not len(congestion_history):
         return jsonify({'message': 'No data available'})
     
-    # Calculate averages
-    total_entries = len(congestion_history)
-    avg_green = sum(entry['zone_counts']['green_zone'] for entry in congestion_history) / total_entries
-    avg_yellow = sum(entry['zone_counts']['yellow_zone'] for entry in congestion_history) / total_entries
-    avg_red = sum(entry['zone_counts']['red_zone'] for entry in congestion_history) / total_entries
-    avg_total = sum(entry['total_vehicles'] for entry in congestion_history) / total_entries
+    # Running averages over the buffer and rolling windows
+    averages = congestion_history.averages()
+    signal = primary_signal()
     
     return jsonify({
-        'total_entries': total_entries,
+        'total_entries': len(congestion_history),
         'averages': {
-            'green_zone': round(avg_green, 2),
-            'yellow_zone': round(avg_yellow, 2),
-            'red_zone': round(avg_red, 2),
-            'total_vehicles': round(avg_total, 2)
+            'green_zone': averages['green_zone'],
+            'yellow_zone': averages['yellow_zone'],
+            'red_zone': averages['red_zone'],
+            'total_vehicles': averages['total_vehicles']
         },
-        'current_signal': signal_controller.current_signal,
-        'dynamic_green_duration': signal_controller.dynamic_green_duration
+        'windows': congestion_history.window_stats(),
+        'current_signal': signal.current_signal,
+        'dynamic_green_duration': signal.dynamic_green_duration,
+        'signal_scheduler': signal.scheduler.get_stats()
     })
 
+@app.route('/api/corridor')
+def get_corridor():
+    """Get the corridor cycle, offsets, splits and signal state per intersection"""
+    if corridor is None:
+        return jsonify({'enabled': False, 'intersections': []})
+    return jsonify(dict(corridor.get_plan(), enabled=True))
+
+@app.route('/api/pipeline')
+def get_pipeline_stats():
+    """Get per-stage FPS and queue depth of the live pipeline"""
+    if pipeline is None:
+        return jsonify({'running': False, 'stages': {}})
+    return jsonify(pipeline.get_stats())
+
+@app.route('/api/cameras')
+def get_cameras():
+    """List camera feeds with their congestion and pipeline stats"""
+    return jsonify({
+        'primary': primary_camera_id,
+        'cameras': {
+            camera_id: {
+                'active': cameras[camera_id].isOpened(),
+                'congestion': camera_detectors[camera_id].get_congestion_data(),
+                'pipeline': pipelines[camera_id].get_stats()
+            }
+            for camera_id in pipelines
+        },
+        'batching': batch_engine.get_stats() if batch_engine is not None else None,
+        'history_writer': history_writer.get_stats() if history_writer is not None else None,
+        'stream': broadcaster.get_stats() if broadcaster is not None else None
+    })
+
+def health_status():
+    """Camera, signal controller and model state shared by the health endpoints"""
+    return {
+        'status': 'healthy',
+        'camera_active': camera is not None and camera.isOpened(),
+        'signal_controller_active': signal_controller is not None and primary_signal().running,
+        'model_ready': model is not None and model.ready
+    }
+
+def readiness():
+    """(ready, checks): the signal controller is running and, when there are pipelines,
+    the model is loaded and every pipeline is running (an API-only process never needs the model)"""
+    checks = {
+        'model': model.get_status() if model is not None else {'state': 'not_created'},
+        'signal_controller': signal_controller is not None and primary_signal().running,
+        'pipelines': {camera_id: feed.running for camera_id, feed in pipelines.items()}
+    }
+    ready = bool(checks['signal_controller']) and (
+        not pipelines or (checks['model']['state'] == 'ready' and all(checks['pipelines'].values())))
+    return ready, checks
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
+    return jsonify(dict(health_status(), timestamp=datetime.now().isoformat()))
+
+@app.route('/api/health/live')
+def liveness_check():
+    """Liveness: the process is up and serving requests (never waits on the model)"""
     return jsonify({
-        'status': 'healthy',
-        'camera_active': camera is not None and camera.isOpened(),
-        'signal_controller_active': signal_controller.running,
+        'status': 'alive',
+        'uptime_s': round(time.monotonic() - started_at, 1),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/health/ready')
+def readiness_check():
+    """Readiness: 503 while pipelines wait on a loading or failed model, else 200"""
+    ready, checks = readiness()
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': checks,
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
+def collect_metrics():
+    """Frame counters and queue gauges read from the live component stats on every scrape"""
+    captured = Counter('traffic_frames_captured_total', 'Frames read from each camera', ('camera',))
+    published = Counter('traffic_frames_published_total', 'Frames published to viewers and the API', ('camera',))
+    processed = Counter('traffic_frames_processed_total', 'Frames completed by each pipeline stage', ('camera', 'stage'))
+    dropped = Counter('traffic_frames_dropped_total', 'Frames dropped from a full stage input queue', ('camera', 'stage'))
+    errors = Counter('traffic_stage_errors_total', 'Frames that raised an error in a pipeline stage', ('camera', 'stage'))
+    queue_depth = Gauge('traffic_queue_depth', 'Frames waiting in each stage input queue', ('camera', 'stage'))
+    inferences = Counter('traffic_inference_calls_total', 'Model calls per camera', ('camera',))
+    gated = Counter('traffic_frames_gated_total', 'Frames that reused detections because the motion gate saw no change', ('camera',))
+    
+    for camera_id, feed in pipelines.items():
+        stats = feed.get_stats()
+        captured.add(stats['frames_captured'], camera_id)
+        published.add(stats['frames_published'], camera_id)
+        for stage, stage_stats in stats['stages'].items():
+            processed.add(stage_stats['processed'], camera_id, stage)
+            errors.add(stage_stats['errors'], camera_id, stage)
+            if stage != 'decode':
+                dropped.add(stage_stats['dropped'], camera_id, stage)
+                queue_depth.add(stage_stats['queue_depth'], camera_id, stage)
+        inferences.add(stats['inference']['inference_calls'], camera_id)
+        if 'motion_gate' in stats['inference']:
+            gated.add(stats['inference']['motion_gate']['frames_gated'], camera_id)
+    families = [captured, published, processed, dropped, errors, queue_depth, inferences, gated]
+    
+    if batch_engine is not None:
+        pending = Gauge('traffic_batch_pending', 'Frames waiting for the batching engine')
+        pending.add(batch_engine.get_stats()['pending'])
+        families.append(pending)
+    
+    if history_writer is not None:
+        writer_stats = history_writer.get_stats()
+        queued = Gauge('traffic_history_queued', 'History rows waiting for the database writer')
+        queued.add(writer_stats['queued'])
+        rows = Counter('traffic_history_rows_total', 'History rows by outcome', ('outcome',))
+        for outcome in ('written', 'spilled', 'dropped'):
+            rows.add(writer_stats[f'rows_{outcome}'], outcome)
+        families.extend([queued, rows])
+    return families
+
+REGISTRY.add_collector(collect_metrics)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, frame counters and gauges"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+def result_handler(camera_id):
+    """Per-frame callback for a camera, or None if nothing consumes its results"""
+    # Only the primary feed drives the signal controller and history;
+    # corridor cameras feed the splits of their intersections
+    primary = camera_id == primary_camera_id
+    coordinated = corridor is not None and corridor.has_camera(camera_id)
+    if not primary and not coordinated:
+        return None
+    
+    def on_result(congestion_data):
+        if primary:
+            record_congestion(congestion_data)
+        if coordinated:
+            corridor.update(camera_id, congestion_data)
+    return on_result
+
+def start_pipeline():
+    """Start one shared capture-and-inference pipeline per camera"""
+    global pipeline, batch_engine
+    
+    # Load the model while the cameras spin up (the API answers meanwhile, see /api/health/ready)
+    if DETECTOR_CONFIG['warm_up']:
+        model.warm_up()
+    
+    # Multiple feeds share one model through the batching engine
+    if len(cameras) > 1:
+        batch_engine = BatchInferenceEngine(detector,
+                                            batch_size=CAMERA_CONFIG['batch_size'],
+                                            max_wait=CAMERA_CONFIG['max_batch_wait'])
+        batch_engine.start()
+    
+    for camera_id, capture in cameras.items():
+        if batch_engine is not None:
+            camera_detectors[camera_id] = batch_engine.create_detector(camera_id, create_motion_gate())
+        else:
+            detector.motion_gate = create_motion_gate()
+            camera_detectors[camera_id] = detector
+        
+        # Per-camera lane polygons and grid size
+        zone_config = os.path.join(CAMERA_CONFIG['zones_dir'], f"{camera_id}.json")
+        if os.path.exists(zone_config):
+            camera_detectors[camera_id].set_zone_layout(ZoneLayout.load(zone_config))
+            print(f"Loaded zone layout for {camera_id} from {zone_config}")
+        
+        if TRACKING_CONFIG['enabled']:
+            options = {key: value for key, value in TRACKING_CONFIG.items() if key != 'enabled'}
+            camera_detectors[camera_id].tracker = camera_detectors[camera_id].create_tracker(**options)
+        
+        pipelines[camera_id] = FramePipeline(capture, camera_detectors[camera_id],
+                                             on_result=result_handler(camera_id), camera_id=camera_id,
+                                             **PIPELINE_CONFIG)
+        pipelines[camera_id].start()
+    
+    pipeline = pipelines[primary_camera_id]
+
 def cleanup():
     """Cleanup resources"""
-    global camera
-    if camera:
-        camera.release()
-    signal_controller.stop()
+    if broadcaster:
+        broadcaster.stop()
+    if corridor:
+        corridor.stop()
+    for feed in pipelines.values():
+        feed.stop()
+    if batch_engine:
+        batch_engine.stop()
+    if history_writer:
+        history_writer.stop()
+    if history_store:
+        history_store.close()
+    for capture in cameras.values():
+        capture.release()
+    if signal_controller:
+        signal_controller.stop()
     cv2.destroyAllWindows()
 
 if __name__ == '__main__':
+    # Background threads (scheduler, pipelines, history writer) report through logging
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     try:
         print("Initializing Smart Traffic Management System...")
+        create_app()
+        
+        # Video sources can be passed on the command line
+        if len(sys.argv) > 1:
+            CAMERA_CONFIG['sources'] = sys.argv[1:]
         
         # Initialize camera
         if not init_camera():
             print("Failed to initialize camera!")
             exit(1)
         
-        print("Camera initialized successfully!")
+        print(f"Initialized {len(cameras)} camera(s) successfully!")
+        init_history_writer()
+        init_corridor()
+        start_pipeline()
+        init_broadcaster()
         print("Starting Flask server...")
         print("Access the system at: http://localhost:5000")
         print("Live feed available at: http://localhost:5000/api/live-feed")
+        print("Live stats stream at: http://localhost:5000/api/stream")
         
-        # Start the Flask app
-        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+        if SERVER_CONFIG['mode'] == 'async':
+            from async_server import run_async_server
+            print("Serving with asyncio (SERVER_MODE=async)")
+            run_async_server(app, pipelines, primary_camera_id, broadcaster,
+                             host=SERVER_CONFIG['host'], port=SERVER_CONFIG['port'],
+                             write_timeout=SERVER_CONFIG['write_timeout'],
+                             json_workers=SERVER_CONFIG['json_workers'])
+        else:
+            # Start the Flask app
+            app.run(host=SERVER_CONFIG['host'], port=SERVER_CONFIG['port'], debug=False, threaded=True)
         
     except KeyboardInterrupt:
         print("\nShutting down...")
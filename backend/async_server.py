@@ -0,0 +1,305 @@
+import asyncio
+import io
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from metrics import VIEWERS
+
+# Response headers that aiohttp sets itself
+HOP_BY_HOP = {"content-length", "transfer-encoding", "connection"}
+
+def process_memory_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Relay:
+    """Hands the newest payload of a blocking publisher to asyncio clients.
+
+    One thread blocks on wait(last_seq, timeout) -> (payload, seq), the
+    contract shared by FramePipeline.wait_for_frame and
+    SnapshotBroadcaster.wait_for_message, and posts each new payload to the
+    event loop. Clients await the next sequence number and always get the
+    newest payload, so a slow client skips frames instead of queueing them.
+    """
+
+    def __init__(self, name, wait, loop, timeout=1.0):
+        self.name = name
+        self.wait = wait
+        self.loop = loop
+        self.timeout = timeout
+
+        # Only touched on the event loop
+        self.payload = None
+        self.seq = 0
+        self.published = 0.0
+        self.changed = asyncio.Event()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"relay-{name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        seq = 0
+        while self.running:
+            start = time.monotonic()
+            payload, seq = self.wait(seq, self.timeout)
+            if payload is None and time.monotonic() - start < self.timeout / 2:
+                time.sleep(self.timeout)  # The publisher has stopped; don't spin
+            elif payload is not None and self.running:
+                self.loop.call_soon_threadsafe(self._publish, payload, seq, time.time())
+
+    def _publish(self, payload, seq, published):
+        self.payload, self.seq, self.published = payload, seq, published
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def next(self, last_seq):
+        """Wait for a payload newer than last_seq; returns (payload, seq, published)"""
+        while self.seq == last_seq:
+            await self.changed.wait()
+        return self.payload, self.seq, self.published
+
+    def stop(self):
+        self.running = False
+
+class Viewer:
+    """Delivery statistics for one connected client"""
+
+    def __init__(self, kind, feed, remote):
+        self.kind = kind
+        self.feed = feed
+        self.remote = remote
+        self.connected_at = time.time()
+        self.sent = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+
+    def get_stats(self):
+        return {
+            "kind": self.kind,
+            "feed": self.feed,
+            "remote": self.remote,
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "bytes_sent": self.bytes_sent
+        }
+
+class AsyncStreamServer:
+    """asyncio serving mode for many concurrent live-feed and stream viewers.
+
+    /api/live-feed and /api/stream are served by coroutines that share one
+    encoded buffer per feed, so an open connection costs a small task and a
+    socket instead of an OS thread. Every other route is handed to the Flask
+    app on a small thread pool, so the JSON API behaves exactly as before.
+    """
+
+    def __init__(self, flask_app, pipelines, primary_camera_id, broadcaster=None,
+                 write_timeout=10.0, json_workers=8, send_buffer=128 * 1024):
+        self.flask_app = flask_app
+        self.pipelines = pipelines
+        self.primary_camera_id = primary_camera_id
+        self.broadcaster = broadcaster
+        self.write_timeout = write_timeout  # Clients that cannot take a write for this long are dropped
+        self.send_buffer = send_buffer      # Socket buffer per viewer; small so slow clients skip instead of lag
+        self.executor = ThreadPoolExecutor(max_workers=json_workers, thread_name_prefix="json-route")
+
+        self.relays = {}
+        self.stream_relay = None
+        self.viewers = set()
+        self.dropped_clients = 0
+
+    async def _startup(self, app):
+        loop = asyncio.get_running_loop()
+        for camera_id, feed in self.pipelines.items():
+            self.relays[camera_id] = Relay(camera_id, feed.wait_for_frame, loop)
+        if self.broadcaster is not None:
+            self.stream_relay = Relay("stream", self.broadcaster.wait_for_message, loop)
+
+    async def _cleanup(self, app):
+        for relay in (*self.relays.values(), self.stream_relay):
+            if relay is not None:
+                relay.stop()
+        self.executor.shutdown(wait=False)
+
+    def create_app(self):
+        """Build the aiohttp application"""
+        app = web.Application()
+        app.on_startup.append(self._startup)
+        app.on_cleanup.append(self._cleanup)
+        app.router.add_get('/api/live-feed', self.live_feed)
+        app.router.add_get('/api/stream', self.stream)
+        app.router.add_get('/api/viewers', self.get_viewers)
+        app.router.add_route('*', '/{tail:.*}', self.wsgi)
+        return app
+
+    def _limit_buffering(self, request):
+        """Keep little data in flight per client so a slow reader sees fresh frames"""
+        sock = request.transport.get_extra_info('socket') if request.transport else None
+        if sock is not None and self.send_buffer:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+            except OSError:
+                pass
+            request.transport.set_write_buffer_limits(high=self.send_buffer)
+
+    async def _write(self, response, viewer, data):
+        """Write to one client; a stalled client is dropped instead of holding a buffer"""
+        await asyncio.wait_for(response.write(data), self.write_timeout)
+        viewer.bytes_sent += len(data)
+
+    async def live_feed(self, request):
+        """MJPEG stream of the shared encoded frames (?camera=<id> to pick a feed)"""
+        camera_id = request.query.get('camera') or self.primary_camera_id
+        relay = self.relays.get(camera_id)
+        if relay is None:
+            return web.json_response({'success': False, 'message': 'Unknown camera'}, status=404)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'multipart/x-mixed-replace; boundary=frame',
+            'Cache-Control': 'no-cache'
+        })
+        self._limit_buffering(request)
+        await response.prepare(request)
+
+        viewer = Viewer('live-feed', camera_id, request.remote)
+        self.viewers.add(viewer)
+        VIEWERS.inc('live-feed', camera_id)
+        last_seq = 0
+        try:
+            while True:
+                jpeg, seq, published = await relay.next(last_seq)
+                if last_seq:
+                    viewer.skipped += seq - last_seq - 1
+                last_seq = seq
+                header = (f"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n"
+                          f"X-Frame-Seq: {seq}\r\nX-Timestamp: {published:.6f}\r\n\r\n").encode()
+                await self._write(response, viewer, header + jpeg + b"\r\n")
+                viewer.sent += 1
+        except asyncio.TimeoutError:
+            self.dropped_clients += 1
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            VIEWERS.dec('live-feed', camera_id)
+        return response
+
+    async def stream(self, request):
+        """Server-sent events of the shared dashboard snapshots"""
+        if self.stream_relay is None:
+            return web.json_response({'success': False, 'message': 'Streaming is disabled'}, status=503)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Access-Control-Allow-Origin': '*'
+        })
+        await response.prepare(request)
+
+        viewer = Viewer('stream', 'stream', request.remote)
+        self.viewers.add(viewer)
+        VIEWERS.inc('stream', 'all')
+        last_seq = 0
+        try:
+            await self._write(response, viewer, f"retry: {int(self.broadcaster.interval * 3000)}\n\n".encode())
+            while True:
+                try:
+                    message, seq, _ = await asyncio.wait_for(self.stream_relay.next(last_seq),
+                                                             self.broadcaster.keepalive)
+                except asyncio.TimeoutError:
+                    await self._write(response, viewer, b": keepalive\n\n")
+                    continue
+                if last_seq:
+                    viewer.skipped += seq - last_seq - 1
+                last_seq = seq
+                await self._write(response, viewer, message)
+                viewer.sent += 1
+        except asyncio.TimeoutError:
+            self.dropped_clients += 1
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            VIEWERS.dec('stream', 'all')
+        return response
+
+    async def get_viewers(self, request):
+        """Connected clients, frames skipped by slow clients and process memory"""
+        viewers = [viewer.get_stats() for viewer in self.viewers]
+        return web.json_response({
+            'viewers': len(viewers),
+            'live_feed_viewers': sum(1 for viewer in viewers if viewer['kind'] == 'live-feed'),
+            'stream_viewers': sum(1 for viewer in viewers if viewer['kind'] == 'stream'),
+            'dropped_clients': self.dropped_clients,
+            'memory_mb': round(process_memory_mb(), 1),
+            'clients': viewers
+        })
+
+    def _call_wsgi(self, environ):
+        """Run the Flask app for one request and collect the whole response"""
+        status_headers = []
+
+        def start_response(status, headers, exc_info=None):
+            status_headers[:] = [status, headers]
+
+        result = self.flask_app.wsgi_app(environ, start_response)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return status_headers[0], status_headers[1], body
+
+    async def wsgi(self, request):
+        """Serve any other route with the Flask app on the thread pool"""
+        body = await request.read()
+        host, _, port = (request.host or "localhost").partition(":")
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': request.path,
+            'QUERY_STRING': request.query_string,
+            'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'SERVER_NAME': host,
+            'SERVER_PORT': port or '80',
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in request.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                environ[key] = value
+
+        loop = asyncio.get_running_loop()
+        status, headers, payload = await loop.run_in_executor(self.executor, self._call_wsgi, environ)
+        response = web.Response(status=int(status.split()[0]), body=payload)
+        for name, value in headers:
+            if name.lower() not in HOP_BY_HOP:
+                response.headers.add(name, value)
+        return response
+
+def run_async_server(flask_app, pipelines, primary_camera_id, broadcaster=None,
+                     host='0.0.0.0', port=5000, write_timeout=10.0, json_workers=8):
+    """Serve the app with asyncio until interrupted"""
+    server = AsyncStreamServer(flask_app, pipelines, primary_camera_id, broadcaster,
+                               write_timeout=write_timeout, json_workers=json_workers)
+    web.run_app(server.create_app(), host=host, port=port, print=None)
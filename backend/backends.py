@@ -0,0 +1,448 @@
+import logging
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from metrics import MODEL_LOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Every backend returns one float32 array per frame with columns
+# x1, y1, x2, y2, confidence, class id (COCO ids, frame pixel coordinates)
+EMPTY_BOXES = np.empty((0, 6), dtype=np.float32)
+
+def class_aware_nms(boxes, iou_threshold):
+    """Non-maximum suppression over (N, 6) boxes, applied separately per class"""
+    if len(boxes) == 0:
+        return EMPTY_BOXES
+
+    # Offset each class into its own coordinate region so classes never overlap
+    offset = boxes[:, 5] * (float(boxes[:, :4].max()) + 1)
+    xywh = np.stack([boxes[:, 0] + offset, boxes[:, 1] + offset,
+                     boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1)
+    indices = cv2.dnn.NMSBoxes(xywh.tolist(), boxes[:, 4].tolist(), 0.0, iou_threshold)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    return boxes[np.sort(indices)]
+
+class DetectorBackend:
+    """Base class for inference engines used by VehicleDetector"""
+
+    name = "base"
+
+    def __init__(self):
+        self.load_time = 0.0  # Seconds spent loading the model
+
+    def predict(self, frames, input_size=None):
+        """Run inference on a list of BGR frames and return raw boxes per frame.
+
+        input_size overrides the backend's inference resolution for this call.
+        """
+        raise NotImplementedError
+
+class UltralyticsBackend(DetectorBackend):
+    """PyTorch eager inference through ultralytics YOLO"""
+
+    name = "ultralytics"
+
+    def __init__(self, weights='yolov8n.pt', input_size=640):
+        super().__init__()
+        from ultralytics import YOLO
+
+        started = time.perf_counter()
+        self.model = YOLO(weights)
+        self.load_time = time.perf_counter() - started
+        self.input_size = input_size
+
+    def predict(self, frames, input_size=None):
+        """Run YOLO once on the whole list of frames"""
+        results = self.model(frames, imgsz=input_size or self.input_size, verbose=False)
+        # One device-to-host copy per frame
+        return [result.boxes.data.cpu().numpy() if result.boxes is not None else EMPTY_BOXES
+                for result in results]
+
+class OnnxBackend(DetectorBackend):
+    """CPU-optimized inference of an exported YOLOv8 model with ONNX Runtime.
+
+    Pass providers=['OpenVINOExecutionProvider'] to run through OpenVINO when
+    onnxruntime-openvino is installed; CPUExecutionProvider is always the fallback.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path='yolov8n.onnx', num_threads=4, input_size=640,
+                 conf_threshold=0.25, iou_threshold=0.45, quantized=False, providers=None):
+        super().__init__()
+        import onnxruntime as ort
+
+        if quantized:
+            model_path = quantize_onnx(model_path)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        available = ort.get_available_providers()
+        providers = [p for p in (providers or []) if p in available] + ['CPUExecutionProvider']
+
+        started = time.perf_counter()
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+        self.load_time = time.perf_counter() - started
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Models exported without dynamic=True only accept a batch of one at the export size
+        self.fixed_batch = isinstance(model_input.shape[0], int)
+        self.fixed_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else None
+        self.input_size = input_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.model_path = model_path
+
+    def _preprocess(self, frame, input_size):
+        """Letterbox a BGR frame into a normalized CHW RGB tensor"""
+        height, width = frame.shape[:2]
+        scale = min(input_size / height, input_size / width)
+        resized = cv2.resize(frame, (int(round(width * scale)), int(round(height * scale))),
+                             interpolation=cv2.INTER_LINEAR)
+
+        # Pad bottom/right so boxes map back with a single division
+        canvas = np.full((input_size, input_size, 3), 114, dtype=np.uint8)
+        canvas[:resized.shape[0], :resized.shape[1]] = resized
+        tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+        return tensor, scale
+
+    def _postprocess(self, output, scale, frame_width, frame_height):
+        """Decode one (4 + classes, anchors) YOLOv8 output into boxes"""
+        preds = output.T
+        scores = preds[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), cls]
+
+        keep = conf > self.conf_threshold
+        if not np.any(keep):
+            return EMPTY_BOXES
+        preds, cls, conf = preds[keep], cls[keep], conf[keep]
+
+        # cx, cy, w, h -> x1, y1, x2, y2 in frame coordinates
+        boxes = np.empty((len(preds), 6), dtype=np.float32)
+        boxes[:, 0] = (preds[:, 0] - preds[:, 2] / 2) / scale
+        boxes[:, 1] = (preds[:, 1] - preds[:, 3] / 2) / scale
+        boxes[:, 2] = (preds[:, 0] + preds[:, 2] / 2) / scale
+        boxes[:, 3] = (preds[:, 1] + preds[:, 3] / 2) / scale
+        boxes[:, 4] = conf
+        boxes[:, 5] = cls
+
+        boxes = class_aware_nms(boxes, self.iou_threshold)
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, frame_width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, frame_height)
+        return boxes
+
+    def predict(self, frames, input_size=None):
+        """Run the ONNX session on the frames, batched when the model allows it"""
+        input_size = input_size or self.input_size
+        if self.fixed_size is not None and input_size != self.fixed_size:
+            raise ValueError(f"{self.model_path} only accepts {self.fixed_size}px input; "
+                             f"export it with dynamic=True to run at {input_size}px")
+        prepared = [self._preprocess(frame, input_size) for frame in frames]
+        if self.fixed_batch:
+            outputs = [self.session.run(None, {self.input_name: tensor[None]})[0][0]
+                       for tensor, _ in prepared]
+        else:
+            batch = np.stack([tensor for tensor, _ in prepared])
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+
+        return [self._postprocess(output, scale, frame.shape[1], frame.shape[0])
+                for output, (_, scale), frame in zip(outputs, prepared, frames)]
+
+class SyntheticBackend(DetectorBackend):
+    """Deterministic stand-in that produces scripted boxes without model weights.
+
+    By default it simulates vehicles driving down the frame at constant speeds.
+    A custom script can be given as a callable (frame_index, width, height) -> boxes
+    or as a list of (N, 6) box arrays that is replayed in a loop.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, script=None, vehicles=20, seed=0, latency=0.0):
+        super().__init__()
+        self.script = script
+        self.latency = latency  # Optional simulated inference time per call
+        self.frame_index = 0
+
+        # Normalized vehicle tracks: start position, speed, size and class
+        rng = np.random.default_rng(seed)
+        self.start_x = rng.uniform(0.0, 0.9, vehicles)
+        self.start_y = rng.uniform(0.0, 1.0, vehicles)
+        self.speed = rng.uniform(0.002, 0.01, vehicles)
+        self.size = rng.uniform(0.04, 0.12, vehicles)
+        self.cls = rng.choice([2, 3, 5, 7], vehicles).astype(np.float32)
+        self.conf = rng.uniform(0.35, 0.95, vehicles).astype(np.float32)
+
+    def scripted_boxes(self, frame_index, width, height):
+        """Boxes for one frame of the built-in constant-speed script"""
+        y = (self.start_y + self.speed * frame_index) % 1.0
+        boxes = np.empty((len(y), 6), dtype=np.float32)
+        boxes[:, 0] = self.start_x * width
+        boxes[:, 1] = y * height
+        boxes[:, 2] = np.minimum((self.start_x + self.size) * width, width)
+        boxes[:, 3] = np.minimum((y + self.size) * height, height)
+        boxes[:, 4] = self.conf
+        boxes[:, 5] = self.cls
+        return boxes
+
+    def predict(self, frames, input_size=None):
+        """Return scripted boxes for each frame (input_size has no effect)"""
+        if self.latency:
+            time.sleep(self.latency)
+
+        outputs = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            if callable(self.script):
+                boxes = self.script(self.frame_index, width, height)
+            elif self.script:
+                boxes = self.script[self.frame_index % len(self.script)]
+            else:
+                boxes = self.scripted_boxes(self.frame_index, width, height)
+            outputs.append(np.asarray(boxes, dtype=np.float32).reshape(-1, 6))
+            self.frame_index += 1
+        return outputs
+
+class TiledBackend(DetectorBackend):
+    """Runs a backend on several regions of each frame and merges the results.
+
+    Each region is a dict with a 'box' (x1, y1, x2, y2 as fractions of the
+    frame), an optional 'tiles' (rows, cols) split, a tile 'overlap'
+    fraction and an optional 'input_size' (default: the wrapped backend's).
+    Small crops are upscaled to their input size, so distant vehicles are
+    seen at a higher effective resolution while the full frame can run at a
+    lower one. Crops of all frames go through one predict() call per
+    distinct input size, and detections are mapped back to frame
+    coordinates and merged with cross-tile NMS.
+    """
+
+    name = "tiled"
+
+    def __init__(self, backend, regions, iou_threshold=0.5):
+        super().__init__()
+        self.backend = backend
+        self.regions = regions
+        self.iou_threshold = iou_threshold
+        self.load_time = backend.load_time
+        self.window_cache = {}
+
+    def windows(self, width, height):
+        """Pixel windows (x1, y1, x2, y2) and their input sizes for a frame size,
+        computed once per resolution"""
+        key = (width, height)
+        if key not in self.window_cache:
+            windows, sizes = [], []
+            for region in self.regions:
+                x1, y1, x2, y2 = region['box']
+                x1, x2 = x1 * width, x2 * width
+                y1, y2 = y1 * height, y2 * height
+                rows, cols = region.get('tiles', (1, 1))
+                overlap = region.get('overlap', 0.2)
+
+                # Tile size such that tiles with the given overlap span the region
+                tile_w = (x2 - x1) / (cols - (cols - 1) * overlap)
+                tile_h = (y2 - y1) / (rows - (rows - 1) * overlap)
+                for row in range(rows):
+                    for col in range(cols):
+                        tx = x1 + col * tile_w * (1 - overlap)
+                        ty = y1 + row * tile_h * (1 - overlap)
+                        windows.append((int(tx), int(ty),
+                                        min(int(round(tx + tile_w)), width),
+                                        min(int(round(ty + tile_h)), height)))
+                        sizes.append(region.get('input_size'))
+            self.window_cache[key] = (np.array(windows, dtype=np.int32), sizes)
+        return self.window_cache[key]
+
+    def predict(self, frames, input_size=None):
+        """Run all crops through the wrapped backend and merge per frame"""
+        groups = {}  # input size -> (crops, owners)
+        for index, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            windows, sizes = self.windows(width, height)
+            for (x1, y1, x2, y2), size in zip(windows, sizes):
+                crops, owners = groups.setdefault(size or input_size, ([], []))
+                crops.append(frame[y1:y2, x1:x2])
+                owners.append((index, x1, y1))
+
+        merged = [[] for _ in frames]
+        for size, (crops, owners) in groups.items():
+            for (index, x_offset, y_offset), boxes in zip(owners, self.backend.predict(crops, input_size=size)):
+                if len(boxes):
+                    boxes = np.array(boxes, dtype=np.float32)
+                    boxes[:, [0, 2]] += x_offset
+                    boxes[:, [1, 3]] += y_offset
+                    merged[index].append(boxes)
+
+        return [class_aware_nms(np.concatenate(parts), self.iou_threshold) if parts else EMPTY_BOXES
+                for parts in merged]
+
+# Full frame at low resolution plus an overlapping 1x2 tiling of the distant
+# red-zone band at the backend's input size
+FAR_ZONE_REGIONS = [
+    {'box': (0.0, 0.0, 1.0, 1.0), 'input_size': 320},
+    {'box': (0.0, 0.05, 1.0, 0.45), 'tiles': (1, 2), 'overlap': 0.2}
+]
+
+BACKENDS = {
+    UltralyticsBackend.name: UltralyticsBackend,
+    OnnxBackend.name: OnnxBackend,
+    SyntheticBackend.name: SyntheticBackend
+}
+
+def create_backend(name='ultralytics', regions=None, **options):
+    """Create a detector backend by name, optionally wrapped for region/tiled inference"""
+    if name == 'onnx-int8':
+        name, options = 'onnx', {**options, 'quantized': True}
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {name}")
+    backend = BACKENDS[name](**options)
+    if regions:
+        backend = TiledBackend(backend, regions)
+    return backend
+
+class LazyBackend(DetectorBackend):
+    """Handle that creates the real backend on first use.
+
+    Constructing it is free, so importing the app or building detectors does
+    not load weights or import torch / onnxruntime. The model is loaded once,
+    by the first predict() or by warm_up() on a background thread, and
+    concurrent callers wait for that same load. After a failed load, calls
+    fail fast until retry_interval has passed.
+
+    One handle is shared by every camera (see shared_backend), and PyTorch /
+    ultralytics models are not safe to call from several threads at once, so
+    predict() runs one call at a time under predict_lock. Cameras overlap
+    their inference through BatchInferenceEngine instead.
+    """
+
+    name = "lazy"
+
+    def __init__(self, name='ultralytics', regions=None, retry_interval=30.0, **options):
+        super().__init__()
+        self.backend_name = name
+        self.regions = regions
+        self.options = options
+        self.retry_interval = retry_interval
+
+        self.backend = None
+        self.loading = False
+        self.warm = False  # A frame has been run through the loaded model
+        self.error = None
+        self.failed_at = None
+        self.lock = threading.Lock()
+        self.predict_lock = threading.Lock()
+        self.warm_up_thread = None
+
+    @property
+    def ready(self):
+        return self.backend is not None
+
+    def load(self):
+        """Return the backend, creating it if needed"""
+        backend = self.backend
+        if backend is not None:
+            return backend
+        with self.lock:
+            if self.backend is not None:
+                return self.backend
+            if self.failed_at is not None and time.monotonic() - self.failed_at < self.retry_interval:
+                raise RuntimeError(f"Model unavailable: {self.error}")
+
+            self.loading = True
+            started = time.perf_counter()
+            try:
+                backend = create_backend(self.backend_name, regions=self.regions, **self.options)
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self.failed_at = time.monotonic()
+                raise
+            finally:
+                self.loading = False
+
+            self.load_time = time.perf_counter() - started
+            self.error = None
+            self.failed_at = None
+            self.backend = backend
+            MODEL_LOAD_SECONDS.set(self.load_time, self.backend_name)
+            return backend
+
+    def predict(self, frames, input_size=None):
+        """Load the model if needed and run it (one call at a time)"""
+        backend = self.load()
+        with self.predict_lock:
+            outputs = backend.predict(frames, input_size=input_size)
+        self.warm = True
+        return outputs
+
+    def warm_up(self, width=640, height=480):
+        """Load the model and run one blank frame on a background thread"""
+        with self.lock:
+            if self.warm_up_thread is None:
+                self.warm_up_thread = threading.Thread(target=self._warm_up, args=(width, height),
+                                                       name="model-warm-up", daemon=True)
+                self.warm_up_thread.start()
+        return self.warm_up_thread
+
+    def _warm_up(self, width, height):
+        try:
+            self.predict([np.zeros((height, width, 3), dtype=np.uint8)])
+            logger.info("Model '%s' loaded in %.2f s", self.backend_name, self.load_time)
+        except Exception:
+            logger.exception("Model warm-up failed")
+
+    def get_status(self):
+        """Load state for readiness checks"""
+        if self.backend is not None:
+            state = "ready"
+        elif self.loading:
+            state = "loading"
+        elif self.error is not None:
+            state = "failed"
+        else:
+            state = "not_loaded"
+        return {
+            "backend": self.backend_name,
+            "state": state,
+            "warm": self.warm,
+            "load_time_s": round(self.load_time, 3),
+            "error": self.error
+        }
+
+_shared_backends = {}
+_shared_backends_lock = threading.Lock()
+
+def shared_backend(name='ultralytics', regions=None, **options):
+    """Process-wide LazyBackend per backend configuration, so a model is loaded once per process"""
+    key = (name, repr(regions), repr(sorted(options.items())))
+    with _shared_backends_lock:
+        if key not in _shared_backends:
+            _shared_backends[key] = LazyBackend(name, regions=regions, **options)
+        return _shared_backends[key]
+
+def export_onnx(weights='yolov8n.pt', input_size=640, dynamic=True):
+    """Export YOLO weights to ONNX (dynamic batch so batched inference works)"""
+    from ultralytics import YOLO
+    return YOLO(weights).export(format='onnx', imgsz=input_size, dynamic=dynamic, simplify=True)
+
+def quantize_onnx(model_path, output_path=None):
+    """Create an int8 dynamically quantized copy of an ONNX model (cached on disk)"""
+    if output_path is None:
+        root, ext = os.path.splitext(model_path)
+        output_path = f"{root}.int8{ext}"
+    if not os.path.exists(output_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    return output_path
+
+if __name__ == '__main__':
+    # Export the default model for the ONNX backend
+    print(f"Exported: {export_onnx()}")
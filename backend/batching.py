@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from detection import VehicleDetector
+from metrics import BATCH_INFERENCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class BatchRequest:
+    """A single frame waiting for batched inference"""
+
+    def __init__(self, camera_id, frame):
+        self.camera_id = camera_id
+        self.frame = frame
+        self.boxes = None
+        self.error = None
+        self.done = threading.Event()
+        self.queued_at = time.perf_counter()
+        self.dispatched_at = None  # When its batch went to the model
+
+    @property
+    def queue_wait(self):
+        """Seconds spent waiting for a batch to fill"""
+        return self.dispatched_at - self.queued_at if self.dispatched_at is not None else 0.0
+
+class BatchInferenceEngine:
+    """Collects frames from many cameras and runs them through one model call.
+
+    A batch is dispatched as soon as batch_size frames are waiting or the
+    oldest waiting frame has been queued for max_wait seconds.
+    """
+
+    def __init__(self, detector, batch_size=8, max_wait=0.01):
+        self.detector = detector  # Owns the single shared model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+        self.pending = []
+        self.condition = threading.Condition()
+
+        # Batch statistics
+        self.batches_run = 0
+        self.frames_run = 0
+        self.inference_time = 0.0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the batching thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="batch-inference", daemon=True)
+        self.thread.start()
+
+    def infer(self, camera_id, frame, timeout=5.0):
+        """Queue a frame and block until its raw boxes are ready"""
+        return self.submit(camera_id, frame, timeout).boxes
+
+    def submit(self, camera_id, frame, timeout=5.0):
+        """Queue a frame and return its completed BatchRequest.
+
+        The timeout starts once the model is loaded, so the first batches
+        wait for a lazy backend to load its weights.
+        """
+        request = BatchRequest(camera_id, frame)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify_all()
+
+        backend = self.detector.backend
+        while not getattr(backend, "ready", True) and not request.done.wait(0.1):
+            pass
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"Batched inference timed out for camera {camera_id}")
+        if request.error is not None:
+            raise request.error
+        return request
+
+    def _next_batch(self):
+        """Wait for a full batch or for the oldest frame to hit max_wait"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending or not self.running, 0.5)
+            if not self.pending:
+                return []
+
+            deadline = time.monotonic() + self.max_wait
+            while len(self.pending) < self.batch_size and self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.pending[:self.batch_size]
+            self.pending = self.pending[self.batch_size:]
+            return batch
+
+    def _run(self):
+        """Dispatch batches and route results back to each camera"""
+        while self.running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for request in batch:
+                request.dispatched_at = started
+            try:
+                results = self.detector.infer_batch([request.frame for request in batch])
+                for request, boxes in zip(batch, results):
+                    request.boxes = boxes
+            except Exception as e:
+                logger.warning("Batch inference error: %s", e)
+                for request in batch:
+                    request.error = e
+            elapsed = time.perf_counter() - started
+            BATCH_INFERENCE_SECONDS.observe(elapsed)
+            self.inference_time += elapsed
+            self.batches_run += 1
+            self.frames_run += len(batch)
+
+            for request in batch:
+                request.done.set()
+
+        # Release anyone still waiting
+        with self.condition:
+            for request in self.pending:
+                request.error = RuntimeError("Batch inference engine stopped")
+                request.done.set()
+            self.pending = []
+
+    def create_detector(self, camera_id, motion_gate=None):
+        """Create a per-camera detector whose inference goes through this engine"""
+        return CameraDetector(self, camera_id, motion_gate=motion_gate)
+
+    def get_stats(self):
+        """Get batching statistics"""
+        return {
+            "batch_size": self.batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "batches_run": self.batches_run,
+            "frames_run": self.frames_run,
+            "avg_batch_fill": round(self.frames_run / self.batches_run, 2) if self.batches_run else 0.0,
+            "avg_batch_latency_ms": round(self.inference_time / self.batches_run * 1000, 2) if self.batches_run else 0.0,
+            "pending": len(self.pending)
+        }
+
+    def stop(self):
+        """Stop the batching thread"""
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+class CameraDetector(VehicleDetector):
+    """Per-camera zone and grid state backed by a shared BatchInferenceEngine"""
+
+    def __init__(self, engine, camera_id, motion_gate=None):
+        # Share the engine's backend instead of loading another model
+        super().__init__(backend=engine.detector.backend, motion_gate=motion_gate)
+        self.engine = engine
+        self.camera_id = camera_id
+
+    def infer_batch(self, frames):
+        """Route frames through the shared batching engine"""
+        requests = [self.engine.submit(self.camera_id, frame) for frame in frames]
+        self.last_batch_wait = sum(request.queue_wait for request in requests)
+        return [request.boxes for request in requests]
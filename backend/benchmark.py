@@ -0,0 +1,416 @@
+"""Offline benchmark of the detection and serving hot paths.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --video traffic.mp4 --boxes 100 --output bench.json
+    python benchmark.py --output new.json --compare bench.json --tolerance 0.1
+
+Runs without model weights, cameras or a database: detections come from the
+scripted synthetic backend (--boxes vehicles per frame) on synthetic frames
+with those vehicles drawn in, or on frames read from --video files. For every
+frame source it measures:
+
+  postprocess     apply_detections (filtering, zones, grid, tracking) per frame
+  congestion      get_congestion_data per frame
+  annotate        annotate per frame
+  encode          JPEG encode per frame
+  serial          detect + annotate + encode in one thread (FPS)
+  pipeline        FramePipeline end to end with all stages threaded (FPS, latency)
+
+plus TrafficSignalController updates, /api/stats and /api/history
+throughput under concurrent requests (in-process Flask test client), and
+memory growth over a long run. Frames and detections are seeded, so runs
+on the same machine are comparable. --compare prints the change of every
+timing against an earlier result file and exits non-zero on regressions.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import cv2
+import numpy as np
+from backends import SyntheticBackend
+from detection import VehicleDetector
+from history import CongestionHistory
+from pipeline import FramePipeline, BLOCK
+from signal_logic import TrafficSignalController
+
+ROUTES = ("/api/stats", "/api/history", "/api/history?max_points=200")
+
+def rss_mb():
+    """Resident memory of this process in MB (Linux)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+def timing_stats(seconds):
+    """Mean and percentiles of per-call timings in milliseconds"""
+    values = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(values):
+        return {}
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {
+        "calls": int(len(values)),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(values.max()), 4)
+    }
+
+class FrameSource:
+    """Looping in-memory stand-in for cv2.VideoCapture"""
+
+    def __init__(self, frames, fps=30.0):
+        self.frames = frames
+        self.fps = fps
+        self.index = 0
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.frames)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.index % len(self.frames)
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.index = int(value)
+        return True
+
+    def release(self):
+        self.opened = False
+
+def synthetic_frames(backend, count, width, height, seed=0):
+    """Road-like frames with the backend's scripted vehicles drawn in"""
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    background[:, int(width * 0.45):int(width * 0.55)] = 110  # Lane marking band
+    background = cv2.add(background, rng.integers(0, 12, background.shape, dtype=np.uint8))
+
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        for x1, y1, x2, y2, _, cls in backend.scripted_boxes(index, width, height):
+            shade = int(60 + 40 * (cls % 4))
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (shade, shade, 200 - shade), -1)
+        frames.append(frame)
+    return frames
+
+def video_frames(path, count):
+    """Up to `count` decoded frames of a local video file"""
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+def create_detector(boxes, seed, tracking):
+    detector = VehicleDetector(SyntheticBackend(vehicles=boxes, seed=seed))
+    if tracking:
+        detector.tracker = detector.create_tracker()
+    return detector
+
+def bench_frames(frames, args):
+    """Per-stage costs, serial FPS and pipeline FPS on one set of frames"""
+    height, width = frames[0].shape[:2]
+    detector = create_detector(args.boxes, args.seed, args.tracking)
+    boxes = [detector.backend.scripted_boxes(index, width, height) for index in range(len(frames))]
+    for index in range(min(args.warmup, len(frames))):
+        detector.apply_detections(boxes[index], width, height, now=index / 30)
+
+    postprocess, congestion, annotate, encode = [], [], [], []
+    detections = []
+    for index, frame_boxes in enumerate(boxes):
+        started = time.perf_counter()
+        detections.append(detector.apply_detections(frame_boxes, width, height, now=(args.warmup + index) / 30))
+        postprocess.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        detector.get_congestion_data()
+        congestion.append(time.perf_counter() - started)
+
+    annotated = []
+    for frame, frame_detections in zip(frames, detections):
+        started = time.perf_counter()
+        annotated.append(detector.annotate(frame, frame_detections))
+        annotate.append(time.perf_counter() - started)
+
+    jpeg_bytes = 0
+    for frame in annotated:
+        started = time.perf_counter()
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality])
+        encode.append(time.perf_counter() - started)
+        jpeg_bytes += len(buffer)
+
+    # One thread doing everything, like the original generate_frames loop
+    detector = create_detector(args.boxes, args.seed, args.tracking)
+    started = time.perf_counter()
+    for frame in frames:
+        detected = detector.detect(frame)
+        detector.get_congestion_data()
+        cv2.imencode('.jpg', detector.annotate(frame, detected), [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality])
+    serial_seconds = time.perf_counter() - started
+
+    return {
+        "frames": len(frames),
+        "resolution": [width, height],
+        "boxes_per_frame": round(float(np.mean([len(d) for d in detections])), 1),
+        "postprocess": timing_stats(postprocess),
+        "congestion": timing_stats(congestion),
+        "annotate": timing_stats(annotate),
+        "encode": dict(timing_stats(encode), avg_kb=round(jpeg_bytes / len(annotated) / 1024, 1)),
+        "serial": {"fps": round(len(frames) / serial_seconds, 1)},
+        "pipeline": bench_pipeline(frames, args)
+    }
+
+def bench_pipeline(frames, args):
+    """Threaded decode -> infer -> annotate -> encode pipeline, unpaced and lossless"""
+    detector = create_detector(args.boxes, args.seed, args.tracking)
+    feed = FramePipeline(FrameSource(frames), detector, overflow_policy=BLOCK, max_fps=1e6,
+                         jpeg_quality=args.jpeg_quality, camera_id=f"benchmark_{id(frames)}")
+    feed.start()
+    time.sleep(min(1.0, args.duration / 4))  # Warm-up
+    published, started = feed.frame_seq, time.perf_counter()
+    time.sleep(args.duration)
+    published, elapsed = feed.frame_seq - published, time.perf_counter() - started
+    stats = feed.get_stats()
+    feed.stop()
+    return {
+        "fps": round(published / elapsed, 1),
+        "latency_p50_ms": stats["latency_p50_ms"],
+        "latency_p99_ms": stats["latency_p99_ms"],
+        "stage_fps": {name: stage["fps"] for name, stage in stats["stages"].items()}
+    }
+
+def bench_signal(iterations):
+    """Dynamic timing updates and status reads of one controller"""
+    controller = TrafficSignalController()
+    rng = np.random.default_rng(0)
+    readings = [{"zone_counts": {"green_zone": int(g), "yellow_zone": int(y), "red_zone": int(r)}}
+                for g, y, r in rng.integers(0, 12, (1000, 3))]
+
+    started = time.perf_counter()
+    for index in range(iterations):
+        controller.calculate_dynamic_timing(readings[index % len(readings)])
+    update_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        controller.get_signal_status()
+    status_seconds = time.perf_counter() - started
+    controller.stop()
+    return {
+        "updates_per_s": round(iterations / update_seconds),
+        "status_reads_per_s": round(iterations / status_seconds)
+    }
+
+def bench_routes(args):
+    """Route throughput with the history buffer filled (in-process, no network)"""
+    os.environ.setdefault("DETECTOR_BACKEND", "synthetic")
+    import app as server
+    server.create_app()
+    history = server.congestion_history
+    rng = np.random.default_rng(args.seed)
+    now = time.time()
+    counts = rng.integers(0, 10, (args.history_rows, 3))
+    for index, (green, yellow, red) in enumerate(counts):
+        history.append({"zone_counts": {"green_zone": int(green), "yellow_zone": int(yellow), "red_zone": int(red)},
+                        "total_vehicles": int(green + yellow + red), "occupied_grid_cells": int(red)},
+                       "GREEN", timestamp=now - (args.history_rows - index) / 30)
+
+    results = {"history_rows": len(history), "concurrency": args.concurrency}
+    for route in ROUTES:
+        def request(_):
+            client = server.app.test_client()
+            started = time.perf_counter()
+            response = client.get(route)
+            response.get_data()
+            return time.perf_counter() - started, response.status_code
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(request, range(args.concurrency)))  # Warm-up
+            started = time.perf_counter()
+            outcomes = list(pool.map(request, range(args.requests)))
+            elapsed = time.perf_counter() - started
+        results[route] = dict(timing_stats([seconds for seconds, _ in outcomes]),
+                              requests_per_s=round(args.requests / elapsed, 1),
+                              errors=sum(1 for _, status in outcomes if status != 200))
+    server.signal_controller.stop()
+    return results
+
+def bench_memory(frames, args):
+    """RSS and live objects while processing frames with tracking and history"""
+    detector = create_detector(args.boxes, args.seed, True)
+    history = CongestionHistory(capacity=3600 * 30)
+    samples = []
+    interval = max(args.memory_frames // 20, 1)
+    gc.collect()
+    for index in range(args.memory_frames):
+        frame = frames[index % len(frames)]
+        detected = detector.detect(frame)
+        history.append(detector.get_congestion_data(), "GREEN", timestamp=index / 30)
+        cv2.imencode('.jpg', detector.annotate(frame, detected), [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality])
+        if index % interval == 0 or index == args.memory_frames - 1:
+            samples.append((index + 1, rss_mb(), len(gc.get_objects())))
+
+    # Growth after the first quarter (buffers and caches are allocated by then)
+    steady = [sample for sample in samples if sample[0] >= args.memory_frames // 4] or samples
+    slope = 0.0
+    if len(steady) > 1 and steady[0][1] is not None:
+        slope = np.polyfit([s[0] for s in steady], [s[1] for s in steady], 1)[0] * 1000
+    return {
+        "frames": args.memory_frames,
+        "start_mb": round(samples[0][1], 1) if samples[0][1] is not None else None,
+        "end_mb": round(samples[-1][1], 1) if samples[-1][1] is not None else None,
+        "growth_mb_per_1k_frames": round(float(slope), 3),
+        "python_objects": {"start": samples[0][2], "end": samples[-1][2]},
+        "samples": [{"frame": frame, "rss_mb": round(rss, 1) if rss is not None else None, "objects": objects}
+                    for frame, rss, objects in samples]
+    }
+
+def environment():
+    """Versions needed to compare results between runs"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+def flatten(results, prefix=""):
+    """Timing and throughput leaves as {path: value}"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline and return the regressed metrics"""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for path in sorted(current):
+        if path not in previous or not previous[path]:
+            continue
+        name = path.rsplit(".", 1)[-1]
+        if name.endswith("_ms") and name != "max_ms":
+            higher_is_better = False
+        elif name in ("fps", "requests_per_s", "updates_per_s", "status_reads_per_s"):
+            higher_is_better = True
+        elif name == "growth_mb_per_1k_frames":
+            higher_is_better = False
+        else:
+            continue
+        change = (current[path] - previous[path]) / abs(previous[path])
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(path)
+        print(f"{path:60s} {previous[path]:>12} -> {current[path]:>12} ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection post-processing, rendering and serving")
+    parser.add_argument("--video", action="append", default=[], help="Local video file (repeatable)")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per source")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--boxes", type=int, default=60, help="Scripted vehicles per frame")
+    parser.add_argument("--tracking", action="store_true", help="Include the tracker in post-processing")
+    parser.add_argument("--jpeg-quality", type=int, default=80)
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed frames before per-stage timing")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of pipeline run per source")
+    parser.add_argument("--signal-iterations", type=int, default=100000)
+    parser.add_argument("--history-rows", type=int, default=36000, help="Readings in the history buffer for route tests")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--memory-frames", type=int, default=5000, help="Frames for the memory growth run (0 = skip)")
+    parser.add_argument("--skip-routes", action="store_true", help="Do not import the Flask app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+    cv2.setNumThreads(1)
+
+    sources = {"synthetic": synthetic_frames(SyntheticBackend(vehicles=args.boxes, seed=args.seed),
+                                             args.frames, args.width, args.height, args.seed)}
+    for path in args.video:
+        frames = video_frames(path, args.frames)
+        if frames:
+            sources[os.path.basename(path)] = frames
+        else:
+            print(f"Skipping unreadable video: {path}")
+
+    results = {"sources": {}}
+    for name, frames in sources.items():
+        print(f"Benchmarking {name} ({len(frames)} frames)...")
+        results["sources"][name] = bench_frames(frames, args)
+
+    print("Benchmarking signal controller...")
+    results["signal"] = bench_signal(args.signal_iterations)
+    if not args.skip_routes:
+        print(f"Benchmarking routes ({args.concurrency} concurrent clients)...")
+        results["routes"] = bench_routes(args)
+    if args.memory_frames:
+        print(f"Measuring memory over {args.memory_frames} frames...")
+        results["memory"] = bench_memory(sources["synthetic"], args)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "environment": environment(),
+        "config": vars(args),
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+        print(f"Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import json
+import logging
+import threading
+import time
+from metrics import VIEWERS
+
+logger = logging.getLogger(__name__)
+
+class SnapshotBroadcaster:
+    """Server-sent events fan-out of live dashboard snapshots.
+
+    A single background thread calls build_snapshot() every interval seconds
+    (or sooner when notify() is called), serializes the result once into an
+    SSE message and publishes it. Every subscriber is handed the same bytes,
+    so the cost per update does not grow with the number of dashboards. Slow
+    subscribers simply skip to the newest snapshot instead of queueing.
+    """
+
+    def __init__(self, build_snapshot, interval=1.0, keepalive=15.0):
+        self.build_snapshot = build_snapshot  # Returns a JSON-serializable dict
+        self.interval = interval              # Seconds between snapshots
+        self.keepalive = keepalive            # Idle seconds before a comment line keeps proxies open
+
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.message = None
+        self.subscribers = 0
+        self.wakeup = threading.Event()
+
+        # Broadcaster statistics
+        self.snapshots = 0
+        self.encode_time = 0.0
+        self.errors = 0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the snapshot thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="snapshot-broadcaster", daemon=True)
+        self.thread.start()
+
+    def notify(self, *args):
+        """Publish the next snapshot right away (usable as a signal listener)"""
+        self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            self.publish()
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def publish(self):
+        """Build, encode and publish one snapshot"""
+        try:
+            snapshot = self.build_snapshot()
+        except Exception:
+            self.errors += 1
+            logger.exception("Error building snapshot")
+            return
+
+        start = time.perf_counter()
+        with self.condition:
+            seq = self.seq + 1
+            snapshot['seq'] = seq
+            data = json.dumps(snapshot, separators=(',', ':'), default=str)
+            self.message = f"id: {seq}\nevent: snapshot\ndata: {data}\n\n".encode()
+            self.seq = seq
+            self.condition.notify_all()
+        self.encode_time += time.perf_counter() - start
+        self.snapshots += 1
+
+    def wait_for_message(self, last_seq, timeout):
+        """Block until a snapshot newer than last_seq exists; returns (message, seq)"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > last_seq or not self.running, timeout)
+            if self.seq > last_seq:
+                return self.message, self.seq
+            return None, last_seq
+
+    def subscribe(self):
+        """Generator of SSE messages for one client, starting with the latest snapshot"""
+        with self.condition:
+            self.subscribers += 1
+        VIEWERS.inc("stream", "all")
+        try:
+            # Ask the browser to reconnect quickly if the stream drops
+            yield f"retry: {int(self.interval * 3000)}\n\n".encode()
+            last_seq = 0
+            while self.running:
+                message, last_seq = self.wait_for_message(last_seq, self.keepalive)
+                yield message if message is not None else b": keepalive\n\n"
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+            VIEWERS.dec("stream", "all")
+
+    def get_stats(self):
+        """Get broadcaster statistics"""
+        return {
+            "subscribers": self.subscribers,
+            "snapshots": self.snapshots,
+            "seq": self.seq,
+            "avg_encode_ms": round(self.encode_time / self.snapshots * 1000, 3) if self.snapshots else 0.0,
+            "message_bytes": len(self.message) if self.message else 0,
+            "errors": self.errors
+        }
+
+    def stop(self):
+        """Stop publishing and release waiting subscribers"""
+        self.running = False
+        self.wakeup.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 1)
@@ -0,0 +1,304 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from signal_logic import default_scheduler
+
+logger = logging.getLogger(__name__)
+
+class Intersection:
+    """Signal state of one intersection in a corridor (usable where a TrafficSignalController is expected)"""
+
+    def __init__(self, corridor, index, intersection_id, camera_id, distance):
+        self.corridor = corridor
+        self.index = index
+        self.id = intersection_id
+        self.camera_id = camera_id
+        self.distance = distance  # Metres from the start of the corridor
+
+        self.current_signal = "RED"
+        self.phase_start = 0.0
+        self.phase_end = 0.0
+        self.green = 0.0          # Corridor green for the running cycle (seconds)
+        self.listeners = []
+
+    @property
+    def signal_duration(self):
+        return self.phase_end - self.phase_start
+
+    @property
+    def running(self):
+        return self.corridor.running
+
+    @property
+    def dynamic_green_duration(self):
+        """Green split the next corridor green will use"""
+        return float(self.corridor.green_target[self.index])
+
+    @property
+    def scheduler(self):
+        return self.corridor.scheduler
+
+    @property
+    def time_remaining(self):
+        return max(0.0, self.phase_end - time.monotonic())
+
+    def add_listener(self, callback):
+        """Register a callback for signal changes: callback(signal, duration, reason)"""
+        self.listeners.append(callback)
+
+    def force_signal_change(self, signal):
+        """Manually start a phase here (for testing)"""
+        return self.corridor.force_signal_change(self.id, signal)
+
+    def get_signal_status(self):
+        """Get current signal status"""
+        corridor = self.corridor
+        with corridor.lock:
+            time_remaining = self.time_remaining
+            return {
+                "intersection": self.id,
+                "camera": self.camera_id,
+                "current_signal": self.current_signal,
+                "time_remaining": math.ceil(time_remaining),
+                "time_remaining_ms": int(time_remaining * 1000),
+                "signal_duration": round(self.signal_duration, 2),
+                "green_split": round(float(corridor.green_target[self.index]), 2),
+                "offset": round(float(corridor.offsets[self.index]), 2),
+                "cycle_length": corridor.cycle,
+                "pressure": round(float(corridor.pressure[self.index]), 3),
+                "timestamp": datetime.now().isoformat()
+            }
+
+class CorridorController:
+    """Coordinated signal timing for a corridor of intersections (green wave).
+
+    All intersections share one cycle length. Intersection i starts its
+    corridor green offset_i = distance_i / speed seconds after the corridor
+    reference, so a platoon travelling at the progression speed meets green
+    lights. Each intersection's green split adapts to an exponentially
+    smoothed pressure from its camera's zone counts.
+
+    Every intersection runs GREEN -> YELLOW -> RED on the shared deadline
+    scheduler, and RED lasts until its next coordinated green start. A
+    congestion update only re-plans the intersection it belongs to, and
+    only when its quantized split changes: a larger split extends a running
+    green, a smaller one applies from the next green. The shared cycle is
+    re-chosen from the highest pressure with hysteresis. A cycle change
+    moves the reference and the offsets, and only intersections waiting in
+    RED are re-planned, never below min_cross_green. Outside
+    force_signal_change(), GREEN and YELLOW are never cut short or skipped.
+    """
+
+    def __init__(self, intersections, scheduler=None, speed_kmh=50.0,
+                 min_cycle=60, max_cycle=120, cycle_step=10, yellow=5,
+                 min_green=15, min_cross_green=15, saturation_count=20,
+                 zone_weights=None, smoothing=0.2, split_step=1.0):
+        self.speed = speed_kmh / 3.6              # Progression speed in m/s
+        self.min_cycle = min_cycle
+        self.max_cycle = max_cycle
+        self.cycle_step = cycle_step              # Cycle lengths are multiples of this
+        self.yellow = yellow
+        self.min_green = min_green                # Corridor green never drops below this
+        self.min_cross_green = min_cross_green    # Cross street keeps at least this much of each cycle
+        self.saturation_count = saturation_count  # Weighted count treated as full pressure
+        self.zone_weights = zone_weights or {"red_zone": 1.0, "yellow_zone": 0.6, "green_zone": 0.3}
+        self.smoothing = smoothing                # EMA weight of each new reading
+        self.split_step = split_step              # Splits are quantized to avoid constant re-plans
+
+        self.lock = threading.RLock()
+        self.scheduler = scheduler or default_scheduler()
+        self.listeners = []  # callback(intersection_id, signal, duration, reason)
+
+        self.intersections = [
+            Intersection(self, index, config['id'], config.get('camera'), float(config.get('distance', 0.0)))
+            for index, config in enumerate(intersections)
+        ]
+        self.by_id = {intersection.id: intersection for intersection in self.intersections}
+        self.by_camera = {}
+        for intersection in self.intersections:
+            if intersection.camera_id is not None:
+                self.by_camera.setdefault(intersection.camera_id, []).append(intersection)
+
+        count = len(self.intersections)
+        self.distances = np.array([intersection.distance for intersection in self.intersections], dtype=np.float64)
+        self.pressure = np.zeros(count)
+        self.green_target = np.zeros(count)
+        self.cycle = min_cycle
+        self.reference = time.monotonic()  # Corridor time zero; cycles start at reference + k * cycle
+        self.offsets = np.zeros(count)
+
+        # Statistics
+        self.updates = 0
+        self.split_replans = 0
+        self.cycle_changes = 0
+
+        self.running = True
+        with self.lock:
+            self._set_cycle(min_cycle, self.reference)
+            for intersection in self.intersections:
+                self._start_green(intersection, self._next_green_start(intersection, self.reference))
+
+    def has_camera(self, camera_id):
+        return camera_id in self.by_camera
+
+    def add_listener(self, callback):
+        """Register a callback for signal changes at any intersection"""
+        self.listeners.append(callback)
+
+    # Planning
+
+    def _set_cycle(self, cycle, reference):
+        """Adopt a cycle length and recompute offsets and split targets"""
+        self.cycle = cycle
+        self.reference = reference
+        self.offsets = np.mod(self.distances / self.speed, cycle)
+        for intersection in self.intersections:
+            self.green_target[intersection.index] = self._split(intersection.index)
+
+    def _split(self, index):
+        """Corridor green for one intersection from its pressure"""
+        available = self.cycle - 2 * self.yellow - self.min_cross_green
+        green = self.min_green + max(available - self.min_green, 0) * self.pressure[index]
+        return max(self.min_green, round(green / self.split_step) * self.split_step)
+
+    def _next_green_start(self, intersection, earliest):
+        """First coordinated green start for an intersection at or after `earliest`"""
+        start = self.reference + self.offsets[intersection.index]
+        cycles = max(math.ceil((earliest - start) / self.cycle - 1e-9), 0)
+        return float(start + cycles * self.cycle)
+
+    def _schedule(self, intersection, deadline):
+        self.scheduler.schedule((self, intersection.index), deadline,
+                                lambda: self._on_deadline(intersection))
+
+    def _enter(self, intersection, signal, start, end):
+        intersection.current_signal = signal
+        intersection.phase_start = start
+        intersection.phase_end = end
+        self._schedule(intersection, end)
+
+    def _start_green(self, intersection, start):
+        """Begin a corridor green (or wait in RED until its coordinated start)"""
+        now = time.monotonic()
+        if start > now + 1e-3:
+            self._enter(intersection, "RED", now, start)
+            return
+        intersection.green = float(self.green_target[intersection.index])
+        self._enter(intersection, "GREEN", start, start + intersection.green)
+
+    def _on_deadline(self, intersection):
+        """Scheduler callback at the end of a phase"""
+        with self.lock:
+            if not self.running:
+                return
+            end = intersection.phase_end
+            if intersection.current_signal == "GREEN":
+                self._enter(intersection, "YELLOW", end, end + self.yellow)
+            elif intersection.current_signal == "YELLOW":
+                # Cross street gets at least its minimum green before the next coordinated start
+                earliest = end + self.min_cross_green
+                self._enter(intersection, "RED", end, self._next_green_start(intersection, earliest))
+            else:
+                self._start_green(intersection, end)
+            self._notify(intersection, "automatic")
+
+    def _notify(self, intersection, reason):
+        """Tell listeners about an intersection's current signal (lock held)"""
+        signal, duration = intersection.current_signal, intersection.signal_duration
+        for callback in intersection.listeners:
+            try:
+                callback(signal, duration, reason)
+            except Exception:
+                logger.exception("Signal listener error")
+        for callback in self.listeners:
+            try:
+                callback(intersection.id, signal, duration, reason)
+            except Exception:
+                logger.exception("Corridor listener error")
+
+    # Incremental updates
+
+    def update(self, camera_id, congestion_data, now=None):
+        """Feed one camera reading; re-plans only what changed"""
+        zone_counts = congestion_data.get("zone_counts", {})
+        weighted = sum(zone_counts.get(zone, 0) * weight for zone, weight in self.zone_weights.items())
+        demand = min(weighted / self.saturation_count, 1.0)
+        now = time.monotonic() if now is None else now
+
+        with self.lock:
+            self.updates += 1
+            for intersection in self.by_camera.get(camera_id, ()):
+                index = intersection.index
+                self.pressure[index] += self.smoothing * (demand - self.pressure[index])
+                target = self._split(index)
+                if target == self.green_target[index]:
+                    continue
+                self.green_target[index] = target
+                self.split_replans += 1
+
+                # A running green is only ever extended; a shorter split waits for the next green
+                if intersection.current_signal == "GREEN" and target > intersection.green:
+                    intersection.green = target
+                    intersection.phase_end = intersection.phase_start + intersection.green
+                    self._schedule(intersection, intersection.phase_end)
+
+            self._update_cycle(now)
+
+    def _update_cycle(self, now):
+        """Re-choose the shared cycle from the highest pressure (with hysteresis)"""
+        peak = float(self.pressure.max()) if len(self.pressure) else 0.0
+        ideal = self.min_cycle + (self.max_cycle - self.min_cycle) * peak
+        if abs(ideal - self.cycle) < self.cycle_step:
+            return  # Within one step of the running cycle: keep it
+        target = min(max(round(ideal / self.cycle_step) * self.cycle_step, self.min_cycle), self.max_cycle)
+        if target == self.cycle:
+            return
+
+        # Keep the reference on the current cycle grid, then move everyone waiting in RED
+        reference = self.reference + math.floor((now - self.reference) / self.cycle) * self.cycle
+        self._set_cycle(target, reference)
+        self.cycle_changes += 1
+        for intersection in self.intersections:
+            if intersection.current_signal == "RED":
+                earliest = max(intersection.phase_start + self.min_cross_green, now)
+                intersection.phase_end = self._next_green_start(intersection, earliest)
+                self._schedule(intersection, intersection.phase_end)
+
+    def force_signal_change(self, intersection_id, signal):
+        """Manually start a phase at one intersection (for testing); coordination resumes after it"""
+        intersection = self.by_id.get(intersection_id)
+        if intersection is None or signal not in ("GREEN", "YELLOW", "RED"):
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if signal == "GREEN":
+                intersection.green = float(self.green_target[intersection.index])
+                self._enter(intersection, "GREEN", now, now + intersection.green)
+            elif signal == "YELLOW":
+                self._enter(intersection, "YELLOW", now, now + self.yellow)
+            else:
+                self._enter(intersection, "RED", now, self._next_green_start(intersection, now + self.min_cross_green))
+            self._notify(intersection, "manual")
+        return True
+
+    def get_plan(self):
+        """Cycle, offsets, splits and live state of every intersection"""
+        with self.lock:
+            return {
+                "cycle_length": self.cycle,
+                "progression_speed_kmh": round(self.speed * 3.6, 1),
+                "updates": self.updates,
+                "split_replans": self.split_replans,
+                "cycle_changes": self.cycle_changes,
+                "intersections": [intersection.get_signal_status() for intersection in self.intersections]
+            }
+
+    def stop(self):
+        """Stop all intersections"""
+        with self.lock:
+            self.running = False
+            for intersection in self.intersections:
+                self.scheduler.cancel((self, intersection.index))
@@ -1,13 +1,40 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
+from backends import shared_backend
+from tracking import VehicleTracker
+from zones import ZoneLayout, NO_ZONE
 import time
 from datetime import datetime
 
+# Compact per-frame detection record
+DETECTION_DTYPE = np.dtype([
+    ('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+    ('cls', np.int16), ('conf', np.float32),
+    ('zone', np.int8), ('row', np.int16), ('col', np.int16),
+    ('track_id', np.int64)
+])
+
 class VehicleDetector:
-    def __init__(self):
-        # Load YOLOv8 nano model
-        self.model = YOLO('yolov8n.pt')
+    def __init__(self, backend=None, motion_gate=None, tracker=None, zone_layout=None):
+        # Inference engine (YOLOv8 nano through ultralytics unless another backend is given;
+        # the shared default handle loads the weights on first use)
+        self.backend = backend if backend is not None else shared_backend('ultralytics', weights='yolov8n.pt')
+        
+        # Optional MotionGate that skips inference on unchanged frames
+        self.motion_gate = motion_gate
+        self.last_boxes = None
+        self.inference_calls = 0
+        self.inference_time = 0.0
+        
+        # Set by infer_batch when frames waited for a shared batch (not model time)
+        self.last_batch_wait = 0.0
+        self.batch_wait_time = 0.0
+        
+        # Optional callback(stage, seconds) for per-frame batch wait, inference and post-processing times
+        self.timing_hook = None
+        
+        # Optional VehicleTracker for persistent IDs, flow and queue length
+        self.tracker = tracker
         
         # Vehicle classes from COCO dataset
         self.vehicle_classes = {
@@ -16,43 +43,38 @@ class VehicleDetector:
             5: 'bus',
             7: 'truck'
         }
+        self.vehicle_class_ids = np.array(list(self.vehicle_classes.keys()), dtype=np.int32)
+        self.confidence_threshold = 0.3
         
         # Zone boundaries (as percentages of frame height)
         self.green_zone = 0.7  # Bottom 30%
         self.yellow_zone = 0.4  # Middle 30%
         self.red_zone = 0.1    # Top 30%
         
-        # Grid system (3x3)
-        self.grid_rows = 3
-        self.grid_cols = 3
+        # Zones, boundary lines and grid (the three bands with a 3x3 grid by default)
+        self.set_zone_layout(zone_layout or ZoneLayout.default(self.green_zone, self.yellow_zone, self.red_zone))
+        self.detections = np.empty(0, dtype=DETECTION_DTYPE)
+        
+    def set_zone_layout(self, zone_layout):
+        """Switch to a new zone layout and reset congestion state"""
+        self.zone_layout = zone_layout
+        self.grid_rows = zone_layout.grid_rows
+        self.grid_cols = zone_layout.grid_cols
         
         # Congestion data
-        self.zone_counts = {"green_zone": 0, "yellow_zone": 0, "red_zone": 0}
-        self.grid_occupancy = [[False for _ in range(self.grid_cols)] for _ in range(self.grid_rows)]
+        self.zone_counts = {name: 0 for name in zone_layout.zone_names}
+        self.total_vehicles = 0  # Vehicles in a primary-layer zone (lanes overlap the bands)
+        self.grid_density = np.zeros((self.grid_rows, self.grid_cols), dtype=np.int32)
         
+        # Static overlay (zone lines, labels, grid) cached per resolution
+        self.overlay_cache = {}
+    
     def draw_boundary_lines(self, frame):
-        """Draw virtual boundary lines on the frame"""
-        height, width = frame.shape[:2]
-        
-        # Green line (bottom)
-        green_y = int(height * self.green_zone)
-        cv2.line(frame, (0, green_y), (width, green_y), (0, 255, 0), 3)
-        cv2.putText(frame, "GREEN ZONE", (10, green_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        
-        # Yellow line (middle)
-        yellow_y = int(height * self.yellow_zone)
-        cv2.line(frame, (0, yellow_y), (width, yellow_y), (0, 255, 255), 3)
-        cv2.putText(frame, "YELLOW ZONE", (10, yellow_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-        
-        # Red line (top)
-        red_y = int(height * self.red_zone)
-        cv2.line(frame, (0, red_y), (width, red_y), (0, 0, 255), 3)
-        cv2.putText(frame, "RED ZONE", (10, red_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        
-        return frame
+        """Draw virtual boundary lines and lane zones on the frame"""
+        return self.zone_layout.draw(frame)
     
     def draw_grid(self, frame):
-        """Draw 3x3 grid overlay"""
+        """Draw grid overlay"""
         height, width = frame.shape[:2]
         
         # Vertical lines
@@ -67,90 +89,180 @@ class VehicleDetector:
         
         return frame
     
-    def get_zone(self, y_center, frame_height):
-        """Determine which zone a vehicle is in based on y-coordinate"""
-        y_ratio = y_center / frame_height
-        
-        if y_ratio >= self.green_zone:
-            return "green_zone"
-        elif y_ratio >= self.yellow_zone:
-            return "yellow_zone"
-        else:
-            return "red_zone"
+    def process_detections(self, boxes, frame_width, frame_height):
+        """Filter, zone and grid-bin raw detections in one vectorized pass"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        conf = boxes[:, 4]
+        cls = boxes[:, 5].astype(np.int32)
+        
+        # Only keep vehicle classes with good confidence
+        keep = np.isin(cls, self.vehicle_class_ids) & (conf > self.confidence_threshold)
+        coords = np.trunc(boxes[keep, :4]).astype(np.int32)
+        
+        detections = np.empty(len(coords), dtype=DETECTION_DTYPE)
+        detections['x1'] = coords[:, 0]
+        detections['y1'] = coords[:, 1]
+        detections['x2'] = coords[:, 2]
+        detections['y2'] = coords[:, 3]
+        detections['cls'] = cls[keep]
+        detections['conf'] = conf[keep]
+        detections['track_id'] = -1
+        
+        # Center points (floor division matches the integer box coordinates)
+        x_center = (coords[:, 0] + coords[:, 2]) // 2
+        y_center = (coords[:, 1] + coords[:, 3]) // 2
+        
+        # Zones (one row per layer) and grid cell from the precompiled label maps
+        zones, cells = self.zone_layout.lookup(x_center, y_center, frame_width, frame_height)
+        detections['zone'] = zones[0]  # Primary (signal) layer
+        detections['row'] = cells // self.grid_cols
+        detections['col'] = cells % self.grid_cols
+        
+        # Aggregate zone counts and grid density
+        zone_names = self.zone_layout.zone_names
+        zone_totals = self.zone_layout.count(zones)
+        self.zone_counts = {name: int(zone_totals[i]) for i, name in enumerate(zone_names)}
+        self.total_vehicles = int(np.count_nonzero(zones[0] != NO_ZONE))
+        self.grid_density = np.bincount(cells, minlength=self.grid_rows * self.grid_cols).reshape(
+            self.grid_rows, self.grid_cols).astype(np.int32)
+        
+        self.detections = detections
+        return detections
     
-    def get_grid_cell(self, x_center, y_center, frame_width, frame_height):
-        """Get grid cell coordinates for a point"""
-        col = min(int(x_center / frame_width * self.grid_cols), self.grid_cols - 1)
-        row = min(int(y_center / frame_height * self.grid_rows), self.grid_rows - 1)
-        return row, col
+    def infer_batch(self, frames):
+        """Run the backend once on a list of frames and return raw boxes per frame"""
+        return self.backend.predict(frames)
     
-    def detect_vehicles(self, frame):
-        """Detect vehicles in the frame and return annotated frame with data"""
+    def detect(self, frame):
+        """Detect vehicles and update zone, grid and tracking state without drawing"""
         height, width = frame.shape[:2]
         
-        # Reset counts and grid
-        self.zone_counts = {"green_zone": 0, "yellow_zone": 0, "red_zone": 0}
-        self.grid_occupancy = [[False for _ in range(self.grid_cols)] for _ in range(self.grid_rows)]
-        
-        # Run YOLO detection
-        results = self.model(frame, verbose=False)
-        
-        # Process detections
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    # Get class and confidence
-                    cls = int(box.cls[0])
-                    conf = float(box.conf[0])
-                    
-                    # Only process vehicle classes with good confidence
-                    if cls in self.vehicle_classes and conf > 0.3:
-                        # Get bounding box coordinates
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                        
-                        # Calculate center point
-                        x_center = (x1 + x2) // 2
-                        y_center = (y1 + y2) // 2
-                        
-                        # Determine zone
-                        zone = self.get_zone(y_center, height)
-                        self.zone_counts[zone] += 1
-                        
-                        # Mark grid cell as occupied
-                        row, col = self.get_grid_cell(x_center, y_center, width, height)
-                        self.grid_occupancy[row][col] = True
-                        
-                        # Draw bounding box
-                        color = (0, 255, 0) if zone == "green_zone" else (0, 255, 255) if zone == "yellow_zone" else (0, 0, 255)
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Draw label
-                        label = f"{self.vehicle_classes[cls]} {conf:.2f}"
-                        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-        
-        # Draw boundary lines and grid
-        frame = self.draw_boundary_lines(frame)
-        frame = self.draw_grid(frame)
+        # Reuse the previous detections when the motion gate sees no change
+        if self.motion_gate is not None:
+            infer = self.motion_gate.should_infer(frame, self.zone_counts)
+            if not infer and self.last_boxes is not None:
+                return self._timed_apply(self.last_boxes, width, height, fresh=False)
+        
+        # Run vehicle detection
+        started = time.perf_counter()
+        self.last_batch_wait = 0.0
+        boxes = self.infer_batch([frame])[0]
+        batch_wait = self.last_batch_wait
+        elapsed = time.perf_counter() - started - batch_wait
+        self.inference_time += elapsed
+        self.batch_wait_time += batch_wait
+        self.inference_calls += 1
+        if self.timing_hook is not None:
+            if batch_wait:
+                self.timing_hook("batch_wait", batch_wait)
+            self.timing_hook("inference", elapsed)
+        
+        self.last_boxes = boxes
+        return self._timed_apply(boxes, width, height)
+    
+    def _timed_apply(self, boxes, frame_width, frame_height, fresh=True):
+        """apply_detections, reporting its time as the post-processing stage"""
+        if self.timing_hook is None:
+            return self.apply_detections(boxes, frame_width, frame_height, fresh)
+        started = time.perf_counter()
+        detections = self.apply_detections(boxes, frame_width, frame_height, fresh)
+        self.timing_hook("postprocess", time.perf_counter() - started)
+        return detections
+    
+    def apply_detections(self, boxes, frame_width, frame_height, fresh=True, now=None):
+        """Update zone, grid and tracking state from raw boxes (now: clock for the tracker, e.g. video time)"""
+        previous = self.detections
+        detections = self.process_detections(boxes, frame_width, frame_height)
+        
+        # Only fresh inferences move the tracker; reused boxes keep their IDs
+        if self.tracker is not None:
+            if fresh:
+                detections['track_id'] = self.tracker.update(detections, frame_width, frame_height, now)
+            elif len(previous) == len(detections):
+                detections['track_id'] = previous['track_id']
+        
+        return detections
+    
+    def get_static_overlay(self, width, height):
+        """Zone lines, labels and grid rendered once per resolution as (image, mask)"""
+        key = (width, height)
+        if key not in self.overlay_cache:
+            overlay = np.zeros((height, width, 3), dtype=np.uint8)
+            self.draw_grid(overlay)
+            self.draw_boundary_lines(overlay)
+            mask = overlay.any(axis=2, keepdims=True)
+            self.overlay_cache[key] = (overlay, mask)
+        return self.overlay_cache[key]
+    
+    def annotate(self, frame, detections=None, zone_counts=None):
+        """Return an annotated copy of the frame; the input frame is left untouched"""
+        height, width = frame.shape[:2]
+        detections = self.detections if detections is None else detections
+        zone_counts = self.zone_counts if zone_counts is None else zone_counts
+        
+        # Composite the precomputed static overlay with one masked copy
+        overlay, mask = self.get_static_overlay(width, height)
+        annotated = frame.copy()
+        np.copyto(annotated, overlay, where=mask)
+        
+        # Draw bounding boxes and labels
+        zone_colors = self.zone_layout.zone_colors
+        for det in detections:
+            x1, y1, x2, y2 = int(det['x1']), int(det['y1']), int(det['x2']), int(det['y2'])
+            color = zone_colors[det['zone']] if det['zone'] != NO_ZONE else (200, 200, 200)
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+            
+            label = f"{self.vehicle_classes[int(det['cls'])]} {float(det['conf']):.2f}"
+            if det['track_id'] >= 0:
+                label = f"#{int(det['track_id'])} {label}"
+            cv2.putText(annotated, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
         
         # Add zone counts to frame
-        cv2.putText(frame, f"Green: {self.zone_counts['green_zone']}", (width - 150, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        cv2.putText(frame, f"Yellow: {self.zone_counts['yellow_zone']}", (width - 150, 60), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-        cv2.putText(frame, f"Red: {self.zone_counts['red_zone']}", (width - 150, 90), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        for i, (name, color) in enumerate(zip(self.zone_layout.zone_names, zone_colors)):
+            label = name[:-len("_zone")] if name.endswith("_zone") else name
+            cv2.putText(annotated, f"{label.capitalize()}: {zone_counts.get(name, 0)}", (width - 150, 30 + 30 * i), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
         
-        return frame
+        return annotated
+    
+    def detect_vehicles(self, frame):
+        """Detect vehicles in the frame and return annotated frame with data"""
+        detections = self.detect(frame)
+        return self.annotate(frame, detections)
+    
+    def get_inference_stats(self):
+        """Get inference counts, including the time saved by motion gating"""
+        avg_time = self.inference_time / self.inference_calls if self.inference_calls else 0.0
+        stats = {
+            "inference_calls": self.inference_calls,
+            "avg_inference_ms": round(avg_time * 1000, 2)
+        }
+        if self.batch_wait_time:
+            stats["avg_batch_wait_ms"] = round(self.batch_wait_time / self.inference_calls * 1000, 2)
+        if self.motion_gate is not None:
+            gate_stats = self.motion_gate.get_stats()
+            stats["motion_gate"] = gate_stats
+            stats["inference_time_saved_s"] = round(gate_stats["frames_gated"] * avg_time, 2)
+        return stats
     
     def get_congestion_data(self):
         """Get current congestion data"""
-        occupied_cells = sum(sum(row) for row in self.grid_occupancy)
+        occupied_cells = int(np.count_nonzero(self.grid_density))
         
-        return {
+        congestion_data = {
             "zone_counts": self.zone_counts,
             "occupied_grid_cells": occupied_cells,
-            "total_vehicles": sum(self.zone_counts.values()),
+            "grid_density": self.grid_density.tolist(),
+            "total_vehicles": self.total_vehicles,
             "timestamp": datetime.now().isoformat()
         }
+        if self.tracker is not None:
+            congestion_data["tracking"] = self.tracker.get_stats(self.zone_layout.zone_names)
+        return congestion_data
+    
+    def create_tracker(self, **options):
+        """Create a VehicleTracker that counts crossings of this detector's zone lines"""
+        boundaries = self.zone_layout.boundaries()
+        if boundaries and "counting_line" not in options:
+            options["counting_line"] = "green_line" if "green_line" in boundaries else next(iter(boundaries))
+        return VehicleTracker(boundaries, zone_count=len(self.zone_layout.zone_names), **options)
@@ -0,0 +1,238 @@
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+# Numeric columns kept for every reading
+FIELDS = ("green_zone", "yellow_zone", "red_zone", "total_vehicles", "occupied_grid_cells")
+SIGNAL_NAMES = ("GREEN", "YELLOW", "RED")
+SIGNAL_CODES = {name: code for code, name in enumerate(SIGNAL_NAMES)}
+
+# Rolling windows reported by /api/stats (seconds)
+DEFAULT_WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+class RollingWindow:
+    """Running sums over the readings of the last `seconds` seconds"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.tail = 0  # Sequence number of the oldest reading inside the window
+        self.count = 0
+        self.sums = np.zeros(len(FIELDS), dtype=np.float64)
+
+    def add(self, values):
+        self.count += 1
+        self.sums += values
+
+    def remove(self, values):
+        self.count -= 1
+        self.sums -= values
+        self.tail += 1
+
+class CongestionHistory:
+    """Fixed-capacity, array-backed ring buffer of congestion readings.
+
+    Appending is O(1) and keeps running sums for each rolling window (and the
+    whole buffer), so means are O(1). Min, max and percentiles are computed
+    with NumPy over just the window's slice of the ring. Queries by time use
+    binary search over the ring and only copy the rows they return.
+
+    Readers hold the lock only to look up sequence numbers; rows are copied
+    and aggregated outside it, so a slow query never stalls append() on the
+    pipeline thread.
+    """
+
+    def __init__(self, capacity=108000, windows=None):
+        self.capacity = capacity
+        self.values = np.zeros((capacity, len(FIELDS)), dtype=np.float64)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.signals = np.zeros(capacity, dtype=np.int8)
+        self.seq = 0  # Sequence number of the next reading
+
+        self.windows = {name: RollingWindow(seconds) for name, seconds in (windows or DEFAULT_WINDOWS).items()}
+        self.all_time = RollingWindow(float('inf'))  # Everything still in the buffer
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
+
+    def _oldest(self):
+        return self.seq - len(self)
+
+    def append(self, congestion_data, signal_status, timestamp=None):
+        """Add one reading"""
+        timestamp = time.time() if timestamp is None else timestamp
+        zone_counts = congestion_data.get('zone_counts', {})
+        row = np.array([
+            zone_counts.get('green_zone', 0),
+            zone_counts.get('yellow_zone', 0),
+            zone_counts.get('red_zone', 0),
+            congestion_data.get('total_vehicles', 0),
+            congestion_data.get('occupied_grid_cells', 0)
+        ], dtype=np.float64)
+
+        with self.lock:
+            # Evict the slot about to be overwritten from every window
+            if self.seq >= self.capacity:
+                evicted = self.seq - self.capacity
+                old_row = self.values[evicted % self.capacity]
+                for window in (*self.windows.values(), self.all_time):
+                    if window.tail <= evicted:
+                        window.remove(old_row)
+
+            index = self.seq % self.capacity
+            self.values[index] = row
+            self.timestamps[index] = timestamp
+            self.signals[index] = SIGNAL_CODES.get(signal_status, -1)
+            self.seq += 1
+
+            for window in (*self.windows.values(), self.all_time):
+                window.add(row)
+            self._expire(timestamp)
+
+    def _expire(self, now):
+        """Advance window tails past readings that are too old"""
+        for window in self.windows.values():
+            cutoff = now - window.seconds
+            while window.tail < self.seq and self.timestamps[window.tail % self.capacity] < cutoff:
+                window.remove(self.values[window.tail % self.capacity])
+
+    def _slice(self, start, end):
+        """Copy rows for sequence numbers [start, end) in time order"""
+        if start >= end:
+            return self.values[:0], self.timestamps[:0], self.signals[:0]
+        first, last = start % self.capacity, (end - 1) % self.capacity + 1
+        if first < last:
+            return (self.values[first:last].copy(), self.timestamps[first:last].copy(),
+                    self.signals[first:last].copy())
+        return (np.concatenate([self.values[first:], self.values[:last]]),
+                np.concatenate([self.timestamps[first:], self.timestamps[:last]]),
+                np.concatenate([self.signals[first:], self.signals[:last]]))
+
+    def _snapshot(self, start, end):
+        """Copy rows [start, end) without holding the lock during the copy.
+
+        append() only ever overwrites the oldest slot, so rows overwritten
+        while copying are at the head of the copy and are dropped. Returns
+        (first sequence number kept, values, timestamps, signals).
+        """
+        values, timestamps, signals = self._slice(start, end)
+        with self.lock:
+            overwritten = min(max(self.seq - self.capacity - start, 0), len(values))
+        return start + overwritten, values[overwritten:], timestamps[overwritten:], signals[overwritten:]
+
+    def _seq_since(self, timestamp):
+        """First sequence number with a timestamp strictly after `timestamp`"""
+        low, high = self._oldest(), self.seq
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[middle % self.capacity] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _field_stats(self, values, sums, count, percentiles):
+        """Mean from running sums, min/max/percentiles from the window slice"""
+        if count == 0:
+            return {}
+        quantiles = np.percentile(values, percentiles, axis=0) if len(percentiles) else None
+        stats = {}
+        for i, field in enumerate(FIELDS):
+            field_stats = {
+                'mean': round(float(sums[i] / count), 2),
+                'min': float(values[:, i].min()),
+                'max': float(values[:, i].max())
+            }
+            for j, percentile in enumerate(percentiles):
+                field_stats[f'p{percentile}'] = round(float(quantiles[j][i]), 2)
+            stats[field] = field_stats
+        return stats
+
+    def averages(self):
+        """O(1) averages over everything in the buffer"""
+        with self.lock:
+            if self.all_time.count == 0:
+                return {}
+            means = self.all_time.sums / self.all_time.count
+            return {field: round(float(means[i]), 2) for i, field in enumerate(FIELDS)}
+
+    def window_stats(self, percentiles=(50, 95)):
+        """Mean, min, max and percentiles for every rolling window"""
+        with self.lock:
+            self._expire(time.time())
+            end = self.seq
+            windows = {name: (window.tail, window.count, window.sums.copy())
+                       for name, window in self.windows.items()}
+        if not windows:
+            return {}
+
+        # Every window ends at the newest reading: copy the longest once
+        first, values, _, _ = self._snapshot(min(tail for tail, _, _ in windows.values()), end)
+        result = {}
+        for name, (tail, count, sums) in windows.items():
+            result[name] = {
+                'count': count,
+                'fields': self._field_stats(values[max(tail - first, 0):], sums, count, percentiles)
+            }
+        return result
+
+    def query(self, since=None, limit=50, max_points=None, until=None):
+        """Readings newer than `since` and up to `until` (epoch seconds), optionally downsampled.
+
+        Without max_points at most `limit` readings are returned: the newest
+        ones, or with `since` the oldest ones after it, so callers page forward
+        from the last timestamp they received. With max_points the readings
+        are averaged into at most that many buckets.
+        """
+        with self.lock:
+            start = self._oldest() if since is None else self._seq_since(since)
+            end = self.seq if until is None else self._seq_since(until)
+        if not max_points and limit:
+            if since is None:
+                start = max(start, end - limit)
+            else:
+                end = min(end, start + limit)
+        _, values, timestamps, signals = self._snapshot(start, end)
+
+        if max_points and len(values) > max_points:
+            # Equal-count buckets: average the counts, keep the last timestamp and signal
+            bounds = np.linspace(0, len(values), max_points + 1).astype(np.int64)
+            starts = bounds[:-1]
+            sizes = np.diff(bounds)
+            values = np.add.reduceat(values, starts, axis=0) / sizes[:, None]
+            timestamps = timestamps[bounds[1:] - 1]
+            signals = signals[bounds[1:] - 1]
+            values = np.round(values, 2)
+            as_number = float
+        else:
+            as_number = int
+
+        return [
+            {
+                'zone_counts': {
+                    'green_zone': as_number(row[0]),
+                    'yellow_zone': as_number(row[1]),
+                    'red_zone': as_number(row[2])
+                },
+                'total_vehicles': as_number(row[3]),
+                'occupied_grid_cells': as_number(row[4]),
+                'signal_status': SIGNAL_NAMES[signal] if signal >= 0 else None,
+                'timestamp': datetime.fromtimestamp(timestamp).isoformat()
+            }
+            for row, timestamp, signal in zip(values.tolist(), timestamps.tolist(), signals.tolist())
+        ]
+
+    def oldest_timestamp(self):
+        """Epoch timestamp of the oldest reading still in the buffer, or None"""
+        with self.lock:
+            if self.seq == 0:
+                return None
+            return float(self.timestamps[self._oldest() % self.capacity])
+
+    def latest_timestamp(self):
+        """Epoch timestamp of the newest reading, or None"""
+        with self.lock:
+            if self.seq == 0:
+                return None
+            return float(self.timestamps[(self.seq - 1) % self.capacity])
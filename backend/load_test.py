@@ -0,0 +1,167 @@
+"""Load test for the live feed: many concurrent MJPEG viewers.
+
+Usage:
+    python load_test.py --clients 200 --duration 30 --slow 20 --pid <server pid>
+
+Each client reads /api/live-feed and records frames received, frames
+skipped (gaps in X-Frame-Seq) and delivery latency (receive time minus the
+server's X-Timestamp; run on the server host for meaningful numbers).
+Slow clients pause between frames to show that they skip frames instead of
+building up backpressure. With --pid the server's resident memory is
+sampled before and after the clients connect to estimate memory per client.
+"""
+import argparse
+import asyncio
+import json
+import socket
+import time
+import numpy as np
+import aiohttp
+
+def rss_mb(pid):
+    """Resident memory of a process in MB (Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+class ClientResult:
+    """What one viewer saw"""
+
+    def __init__(self, index, slow):
+        self.index = index
+        self.slow = slow
+        self.frames = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.latencies = []
+        self.error = None
+
+async def read_part(reader):
+    """Read one multipart part; returns (headers, body)"""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("stream closed")
+        line = line.strip()
+        if not line:
+            if headers:
+                break
+            continue  # Blank line before the boundary
+        if line.startswith(b"--"):
+            continue
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    return headers, body
+
+async def run_client(session, url, result, deadline, slow_delay):
+    """Watch the feed until the deadline"""
+    last_seq = None
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=30)) as response:
+            while time.time() < deadline:
+                headers, body = await read_part(response.content)
+                received = time.time()
+                result.frames += 1
+                result.bytes += len(body)
+
+                seq = int(headers.get("x-frame-seq", 0))
+                if last_seq is not None and seq > last_seq + 1:
+                    result.skipped += seq - last_seq - 1
+                last_seq = seq
+                if "x-timestamp" in headers:
+                    result.latencies.append((received - float(headers["x-timestamp"])) * 1000)
+
+                if result.slow:
+                    await asyncio.sleep(slow_delay)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+
+def summarize(results, duration, memory_before, memory_after):
+    """Aggregate per-client numbers"""
+    def percentiles(values):
+        if not values:
+            return {}
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+    summary = {"clients": len(results), "duration_s": duration}
+    for label, group in (("fast", [r for r in results if not r.slow]), ("slow", [r for r in results if r.slow])):
+        if not group:
+            continue
+        fps = [r.frames / duration for r in group]
+        received = sum(r.frames for r in group)
+        skipped = sum(r.skipped for r in group)
+        summary[label] = {
+            "clients": len(group),
+            "errors": sum(1 for r in group if r.error),
+            "fps_per_client": {"mean": round(float(np.mean(fps)), 2), "min": round(float(np.min(fps)), 2)},
+            "skipped_ratio": round(skipped / max(received + skipped, 1), 3),
+            "latency_ms": percentiles([latency for r in group for latency in r.latencies]),
+            "mbytes_per_client": round(float(np.mean([r.bytes for r in group])) / 1024 / 1024, 2)
+        }
+
+    if memory_before is not None and memory_after is not None:
+        summary["server_memory_mb"] = {
+            "before": round(memory_before, 1),
+            "after": round(memory_after, 1),
+            "per_client_kb": round((memory_after - memory_before) * 1024 / max(len(results), 1), 1)
+        }
+    errors = [r.error for r in results if r.error]
+    if errors:
+        summary["first_error"] = errors[0]
+    return summary
+
+async def main(args):
+    url = args.url.rstrip("/") + "/api/live-feed" + (f"?camera={args.camera}" if args.camera else "")
+    memory_before = rss_mb(args.pid) if args.pid else None
+
+    results = [ClientResult(i, i < args.slow) for i in range(args.clients)]
+    connector_options = {}
+    if args.rcvbuf:
+        # Emulate viewers with small receive buffers (the OS default can hold seconds of video)
+        def socket_factory(addr_info):
+            family, sock_type, proto, _, _ = addr_info
+            sock = socket.socket(family, sock_type, proto)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+            return sock
+        connector_options['socket_factory'] = socket_factory
+    connector = aiohttp.TCPConnector(limit=0, **connector_options)
+    async with aiohttp.ClientSession(connector=connector, read_bufsize=args.rcvbuf or 2 ** 16) as session:
+        start = time.time()
+        deadline = start + args.ramp + args.duration
+        tasks = []
+        for result in results:
+            tasks.append(asyncio.create_task(run_client(session, url, result, deadline, args.slow_delay)))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / args.clients)
+
+        # Sample server memory once every client is connected
+        await asyncio.sleep(max(deadline - time.time(), 0) / 2)
+        memory_after = rss_mb(args.pid) if args.pid else None
+        await asyncio.gather(*tasks)
+
+    summary = summarize(results, args.duration, memory_before, memory_after)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent MJPEG viewer load test")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--camera", default=None)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to watch after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which clients connect")
+    parser.add_argument("--slow", type=int, default=0, help="Number of clients that read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Pause per frame for slow clients")
+    parser.add_argument("--rcvbuf", type=int, default=0, help="Client socket receive buffer in bytes (0 = OS default)")
+    parser.add_argument("--pid", type=int, default=None, help="Server process id for memory sampling")
+    args = parser.parse_args()
+    if args.rcvbuf and tuple(int(part) for part in aiohttp.__version__.split(".")[:2]) < (3, 10):
+        parser.error(f"--rcvbuf needs aiohttp >= 3.10 (installed: {aiohttp.__version__})")
+    asyncio.run(main(args))
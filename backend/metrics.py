@@ -0,0 +1,199 @@
+import bisect
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds: from a fast JPEG encode up to a stalled database write
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1,
+                   0.15, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def format_value(value):
+    """Sample value in the Prometheus text format"""
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def format_labels(names, values, extra=()):
+    """{name="value",...} with quotes, backslashes and newlines escaped"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metric:
+    """A named metric family with one value per combination of label values"""
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def add(self, value, *labels):
+        """Set the value for one label combination (used by scrape-time collectors)"""
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def render(self):
+        """Lines of the text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    type = "gauge"
+
+    def set(self, value, *labels):
+        self.add(value, *labels)
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count per label combination.
+
+    observe() is a bisect and three additions under a lock, so it is cheap
+    enough to call for every frame of every stage. Quantiles (e.g. p99 frame
+    latency per camera) are computed by Prometheus with histogram_quantile(),
+    or locally with quantile() using the same linear interpolation.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def quantile(self, q, *labels):
+        """Estimate a quantile from the buckets, or None without observations"""
+        with self.lock:
+            state = self.values.get(self._key(labels))
+            if state is None or state[2] == 0:
+                return None
+            counts = list(state[0])
+            total = state[2]
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # Beyond the last bound: report the bound
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted((labels, (list(state[0]), state[1], state[2])) for labels, state in self.values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = format_labels(self.labelnames, labels, [("le", format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics updated in place plus collectors that read existing stats at scrape time"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, callback):
+        """Register callback() -> iterable of Metric, called on every scrape"""
+        self.collectors.append(callback)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for callback in self.collectors:
+            try:
+                for metric in callback():
+                    lines.extend(metric.render())
+            except Exception:
+                logger.exception("Metrics collector error")
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry served on /metrics
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "traffic_stage_seconds", "Time spent in each pipeline stage per frame", ("camera", "stage"))
+FRAME_LATENCY_SECONDS = REGISTRY.histogram(
+    "traffic_frame_latency_seconds", "Capture-to-publish latency per frame", ("camera",))
+BATCH_INFERENCE_SECONDS = REGISTRY.histogram(
+    "traffic_batch_inference_seconds", "Time per batched model call across cameras")
+DB_WRITE_SECONDS = REGISTRY.histogram(
+    "traffic_db_write_seconds", "Time per history batch write", ("result",))
+VIEWERS = REGISTRY.gauge(
+    "traffic_viewers", "Connected live-feed and stream clients", ("kind", "camera"))
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    "traffic_model_load_seconds", "Time taken to load the detection model", ("backend",))
@@ -0,0 +1,106 @@
+import cv2
+import time
+
+class MotionGate:
+    """Cheap frame-differencing gate in front of vehicle detection.
+
+    Frames are compared with the last frame that went through inference on a
+    small grayscale copy split into regions. Inference is skipped (and the
+    previous detections reused) while no region has changed. In adaptive mode
+    the minimum interval between inferences also grows under low activity and
+    shrinks again when motion or the red-zone count rises. Detections are
+    never older than max_staleness seconds, so signal timing stays fresh.
+    """
+
+    def __init__(self, adaptive=True, resize=(160, 120), regions=(4, 4),
+                 pixel_threshold=25, region_threshold=0.02,
+                 min_interval=0.0, max_interval=0.5, max_staleness=1.0,
+                 motion_high=0.15, red_zone_high=8):
+        self.adaptive = adaptive
+        self.resize = resize                      # Size of the comparison image
+        self.regions = regions                    # Region grid (rows, cols)
+        self.pixel_threshold = pixel_threshold    # Gray-level change that counts as motion
+        self.region_threshold = region_threshold  # Changed-pixel fraction that marks a region as changed
+        self.min_interval = min_interval          # Fastest inference interval (seconds)
+        self.max_interval = max_interval          # Slowest inference interval under low activity
+        self.max_staleness = max_staleness        # Detections are refreshed at least this often
+        self.motion_high = motion_high            # Motion fraction treated as full activity
+        self.red_zone_high = red_zone_high        # Red-zone count treated as full activity
+
+        self.reference = None
+        self.last_inference_time = None
+        self.interval = min_interval
+        self.motion = 0.0
+
+        # Gate statistics
+        self.frames_seen = 0
+        self.frames_inferred = 0
+        self.frames_gated = 0
+
+    def _prepare(self, frame):
+        """Downscaled, blurred grayscale copy used for differencing"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, self.resize, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _region_motion(self, small):
+        """Fraction of changed pixels in the most active region"""
+        changed = cv2.absdiff(small, self.reference) > self.pixel_threshold
+        rows, cols = self.regions
+        height = changed.shape[0] // rows * rows
+        width = changed.shape[1] // cols * cols
+        blocks = changed[:height, :width].reshape(rows, height // rows, cols, width // cols)
+        return float(blocks.mean(axis=(1, 3)).max())
+
+    def _update_interval(self, zone_counts):
+        """Scale the inference interval with the current activity level"""
+        if not self.adaptive:
+            self.interval = self.min_interval
+            return
+        red_count = zone_counts.get("red_zone", 0) if zone_counts else 0
+        activity = max(self.motion / self.motion_high, red_count / self.red_zone_high)
+        activity = min(max(activity, 0.0), 1.0)
+        self.interval = self.max_interval - (self.max_interval - self.min_interval) * activity
+
+    def should_infer(self, frame, zone_counts=None):
+        """Decide whether this frame needs a fresh inference"""
+        self.frames_seen += 1
+        now = time.monotonic()
+        small = self._prepare(frame)
+
+        if self.reference is None or self.reference.shape != small.shape:
+            infer = True
+            self.motion = 1.0
+        else:
+            self.motion = self._region_motion(small)
+            age = now - self.last_inference_time
+            self._update_interval(zone_counts)
+
+            moved = self.motion >= self.region_threshold
+            infer = age >= self.max_staleness or (moved and age >= self.interval)
+
+        if infer:
+            self.reference = small
+            self.last_inference_time = now
+            self.frames_inferred += 1
+        else:
+            self.frames_gated += 1
+        return infer
+
+    def detection_age(self):
+        """Seconds since the detections were last refreshed"""
+        if self.last_inference_time is None:
+            return None
+        return time.monotonic() - self.last_inference_time
+
+    def get_stats(self):
+        """Get gating statistics"""
+        return {
+            "adaptive": self.adaptive,
+            "frames_seen": self.frames_seen,
+            "frames_inferred": self.frames_inferred,
+            "frames_gated": self.frames_gated,
+            "gated_ratio": round(self.frames_gated / self.frames_seen, 3) if self.frames_seen else 0.0,
+            "current_interval_ms": round(self.interval * 1000, 1),
+            "motion": round(self.motion, 4)
+        }
@@ -0,0 +1,362 @@
+import cv2
+import logging
+import threading
+import time
+from collections import deque
+from metrics import STAGE_SECONDS, FRAME_LATENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Queue overflow policies
+BLOCK = "block"              # Producer waits for space (frames are only lost on shutdown)
+DROP_OLDEST = "drop_oldest"  # Discard the oldest queued frame to make room
+DROP_NEWEST = "drop_newest"  # Discard the incoming frame when full
+LATEST = "latest"            # Keep only the most recent frame
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, LATEST)
+
+class FrameQueue:
+    """Bounded hand-off queue between pipeline stages with an overflow policy"""
+
+    def __init__(self, maxsize=2, policy=DROP_OLDEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = 1 if policy == LATEST else max(1, maxsize)
+        self.policy = policy
+        self.items = deque()
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, item, timeout=None):
+        """Add an item, applying the overflow policy when the queue is full.
+
+        With BLOCK the producer waits until there is room or the queue is
+        closed; an explicit timeout that expires counts the item as dropped.
+        """
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                if self.policy == BLOCK:
+                    self.condition.wait_for(lambda: len(self.items) < self.maxsize or self.closed, timeout)
+                    if self.closed:
+                        return False
+                    if len(self.items) >= self.maxsize:
+                        self.dropped += 1
+                        return False
+                elif self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                else:
+                    # DROP_OLDEST and LATEST evict stale frames
+                    while len(self.items) >= self.maxsize:
+                        self.items.popleft()
+                        self.dropped += 1
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, or None on timeout/close"""
+        with self.condition:
+            if not self.items:
+                self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        """Wake up any waiting producers and consumers"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def depth(self):
+        """Current number of queued items"""
+        return len(self.items)
+
+class PipelineStage:
+    """One pipeline step running in its own thread between two queues"""
+
+    def __init__(self, name, func, in_queue=None, out_queue=None, fps_window=30, error_log_interval=10.0):
+        self.name = name
+        self.func = func  # Takes an item (or None for source stages), returns an item or None
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+
+        # Stage statistics
+        self.processed = 0
+        self.errors = 0
+        self.last_error = None
+        self.error_log_interval = error_log_interval  # Repeated errors are logged at most this often
+        self.errors_logged = 0
+        self.next_error_log = 0.0
+        self.busy_time = 0.0
+        self.completion_times = deque(maxlen=fps_window)
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the stage thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """Pull items, process them and push results downstream"""
+        while self.running:
+            if self.in_queue is not None:
+                item = self.in_queue.get(timeout=0.5)
+                if item is None:
+                    continue
+            else:
+                item = None
+
+            started = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                # Counted like drops (traffic_stage_errors_total) and logged at a bounded rate
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._log_error(e)
+                continue
+            finished = time.perf_counter()
+
+            if result is None:
+                continue
+
+            self.busy_time += finished - started
+            self.processed += 1
+            self.completion_times.append(finished)
+
+            if self.out_queue is not None:
+                # Blocks only under the BLOCK policy; stop() closes the queue to release it
+                self.out_queue.put(result)
+
+    def _log_error(self, error):
+        now = time.monotonic()
+        if now < self.next_error_log:
+            return
+        suppressed = self.errors - self.errors_logged - 1
+        self.errors_logged = self.errors
+        self.next_error_log = now + self.error_log_interval
+        logger.warning("Pipeline stage '%s' error: %s%s", self.name, error,
+                       f" ({suppressed} more since the last report)" if suppressed else "", exc_info=error)
+
+    def fps(self):
+        """Throughput over the recent window of processed items"""
+        times = list(self.completion_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def get_stats(self):
+        """Get stage throughput and queue statistics"""
+        return {
+            "fps": round(self.fps(), 2),
+            "processed": self.processed,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "avg_latency_ms": round(self.busy_time / self.processed * 1000, 2) if self.processed else 0.0,
+            "queue_depth": self.in_queue.depth() if self.in_queue is not None else 0,
+            "dropped": self.in_queue.dropped if self.in_queue is not None else 0
+        }
+
+    def stop(self):
+        """Stop the stage thread"""
+        self.running = False
+
+class FramePipeline:
+    """Shared decode -> infer -> annotate -> encode pipeline for all viewers.
+
+    Each stage runs in its own thread and hands frames to the next stage
+    through a bounded FrameQueue, so a slow stage drops stale frames instead
+    of adding latency. With render=False (headless / API-only deployments)
+    only decode and infer run and no frames are drawn or encoded.
+
+    Capture, batch wait, inference, post-processing, annotation and encoding
+    times and the capture-to-publish latency are recorded in histograms labelled with
+    camera_id for the /metrics endpoint.
+    """
+
+    def __init__(self, camera, detector, on_result=None, queue_size=2,
+                 overflow_policy=LATEST, max_fps=None, jpeg_quality=80, render=True,
+                 camera_id="camera_0"):
+        self.camera = camera
+        self.camera_id = camera_id
+        self.detector = detector
+        self.detector.timing_hook = self.observe_stage  # Inference and post-processing times
+        self.on_result = on_result  # Called once per processed frame with congestion data
+        self.jpeg_quality = jpeg_quality
+        self.render = render
+
+        # Pace file playback to the source rate; live cameras block in read()
+        source_fps = camera.get(cv2.CAP_PROP_FPS) if camera is not None else 0
+        fps = max_fps or source_fps or 30
+        self.frame_interval = 1.0 / fps
+        self.next_capture_time = None
+
+        # Latest published output
+        self.latest_frame = None
+        self.latest_jpeg = None
+        self.latest_congestion = None
+        self.frame_seq = 0
+        self.capture_seq = 0
+        self.last_latency = 0.0  # Capture-to-publish latency of the latest frame
+
+        # Subscribers wait on this condition for the next frame
+        self.condition = threading.Condition()
+
+        # Bounded queues between stages
+        if render:
+            self.queues = [FrameQueue(queue_size, overflow_policy) for _ in range(3)]
+            self.stages = [
+                PipelineStage("decode", self._decode, None, self.queues[0]),
+                PipelineStage("infer", self._infer, self.queues[0], self.queues[1]),
+                PipelineStage("annotate", self._annotate, self.queues[1], self.queues[2]),
+                PipelineStage("encode", self._encode, self.queues[2], None)
+            ]
+        else:
+            self.queues = [FrameQueue(queue_size, overflow_policy)]
+            self.stages = [
+                PipelineStage("decode", self._decode, None, self.queues[0]),
+                PipelineStage("infer", self._infer, self.queues[0], None)
+            ]
+
+        self.running = False
+
+    def start(self):
+        """Start all pipeline stage threads"""
+        if self.running:
+            return
+        self.running = True
+        for stage in self.stages:
+            stage.start()
+
+    def observe_stage(self, stage, seconds):
+        """Record the time one frame spent in a stage"""
+        STAGE_SECONDS.observe(seconds, self.camera_id, stage)
+
+    def _decode(self, _):
+        """Read one frame from the camera, looping video files at the end"""
+        if self.camera is None or not self.camera.isOpened():
+            self.stop()
+            return None
+
+        # Sleep only for what is left of the frame interval
+        now = time.monotonic()
+        if self.next_capture_time is None or now - self.next_capture_time > self.frame_interval:
+            self.next_capture_time = now
+        elif self.next_capture_time > now:
+            time.sleep(self.next_capture_time - now)
+        self.next_capture_time += self.frame_interval
+
+        started = time.perf_counter()
+        success, frame = self.camera.read()
+        self.observe_stage("capture", time.perf_counter() - started)
+        if not success:
+            # If using video file, loop it
+            if self.camera.get(cv2.CAP_PROP_POS_FRAMES) == self.camera.get(cv2.CAP_PROP_FRAME_COUNT):
+                self.camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return None
+
+        self.capture_seq += 1
+        return {"seq": self.capture_seq, "captured_at": time.monotonic(), "frame": frame}
+
+    def _infer(self, item):
+        """Run vehicle detection once per frame for every viewer"""
+        item["detections"] = self.detector.detect(item["frame"])
+        item["zone_counts"] = self.detector.zone_counts
+        item["congestion"] = self.detector.get_congestion_data()
+
+        if self.on_result is not None:
+            self.on_result(item["congestion"])
+
+        if not self.render:
+            # Headless: publish the congestion snapshot only
+            self._publish(None, None, item["congestion"])
+            self._record_latency(item)
+        return item
+
+    def _annotate(self, item):
+        """Draw detections on a copy of the frame"""
+        started = time.perf_counter()
+        item["frame"] = self.detector.annotate(item["frame"], item["detections"], item["zone_counts"])
+        self.observe_stage("annotate", time.perf_counter() - started)
+        return item
+
+    def _encode(self, item):
+        """Encode the frame as JPEG once and publish the shared bytes"""
+        started = time.perf_counter()
+        ret, buffer = cv2.imencode('.jpg', item["frame"], [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        self.observe_stage("encode", time.perf_counter() - started)
+        if not ret:
+            return None
+        self._publish(item["frame"], buffer.tobytes(), item["congestion"])
+        self._record_latency(item)
+        return item
+
+    def _record_latency(self, item):
+        """Capture-to-publish latency of a published frame"""
+        self.last_latency = time.monotonic() - item["captured_at"]
+        FRAME_LATENCY_SECONDS.observe(self.last_latency, self.camera_id)
+
+    def _publish(self, frame, jpeg, congestion_data):
+        """Publish the latest output and wake up subscribers"""
+        with self.condition:
+            if jpeg is not None:
+                self.latest_frame = frame
+                self.latest_jpeg = jpeg
+            self.latest_congestion = congestion_data
+            self.frame_seq += 1
+            self.condition.notify_all()
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Block until a frame newer than last_seq is published.
+
+        Returns (jpeg_bytes, seq); jpeg_bytes is None on timeout or shutdown.
+        """
+        with self.condition:
+            if self.frame_seq == last_seq and self.running:
+                self.condition.wait(timeout)
+            if self.frame_seq == last_seq:
+                return None, last_seq
+            return self.latest_jpeg, self.frame_seq
+
+    def subscribe(self):
+        """Yield each newly published JPEG frame until the pipeline stops"""
+        last_seq = 0
+        while self.running:
+            jpeg, last_seq = self.wait_for_frame(last_seq)
+            if jpeg is not None:
+                yield jpeg
+
+    def get_stats(self):
+        """Get per-stage FPS, latency and queue depth"""
+        p50 = FRAME_LATENCY_SECONDS.quantile(0.5, self.camera_id)
+        p99 = FRAME_LATENCY_SECONDS.quantile(0.99, self.camera_id)
+        return {
+            "running": self.running,
+            "frames_captured": self.capture_seq,
+            "frames_published": self.frame_seq,
+            "end_to_end_latency_ms": round(self.last_latency * 1000, 2),
+            "latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "latency_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "stages": {stage.name: stage.get_stats() for stage in self.stages},
+            "inference": self.detector.get_inference_stats()
+        }
+
+    def stop(self):
+        """Stop all pipeline stages"""
+        self.running = False
+        for stage in self.stages:
+            stage.stop()
+        for queue in self.queues:
+            queue.close()
+        with self.condition:
+            self.condition.notify_all()
+        for stage in self.stages:
+            if stage.thread is not None and stage.thread is not threading.current_thread():
+                stage.thread.join(timeout=2)
@@ -1,32 +1,180 @@
+import heapq
+import itertools
+import logging
+import math
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 import threading
 
-class TrafficSignalController:
+logger = logging.getLogger(__name__)
+
+class SignalScheduler:
+    """Deadline scheduler shared by many signal controllers.
+
+    Pending timers live in a heap ordered by their monotonic deadline. A
+    single thread sleeps on a condition variable until the earliest one is
+    due, so phase changes fire at their deadline rather than on the next
+    polling tick. Scheduling a key again replaces its pending timer (the old
+    heap entry is skipped when it surfaces), and an earlier deadline wakes
+    the thread immediately. Callbacks run on the scheduler thread and must
+    be quick.
+    """
+
     def __init__(self):
+        self.heap = []
+        self.pending = {}  # key -> token of its live heap entry
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+        # Scheduler statistics
+        self.fired = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the scheduler thread"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="signal-scheduler", daemon=True)
+        self.thread.start()
+
+    def schedule(self, key, deadline, callback):
+        """Call callback() at the monotonic deadline, replacing any timer for key"""
+        with self.condition:
+            token = next(self.counter)
+            self.pending[key] = token
+            heapq.heappush(self.heap, (deadline, token, key, callback))
+            if len(self.heap) > 2 * len(self.pending) + 64:
+                self._compact()
+            if self.heap[0][1] == token:
+                self.condition.notify()  # New earliest deadline
+
+    def cancel(self, key):
+        """Drop the pending timer for key"""
+        with self.condition:
+            self.pending.pop(key, None)
+
+    def _compact(self):
+        """Remove replaced and cancelled entries"""
+        self.heap = [entry for entry in self.heap if self.pending.get(entry[2]) == entry[1]]
+        heapq.heapify(self.heap)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.running:
+                        return
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    deadline, token, key, callback = self.heap[0]
+                    if self.pending.get(key) != token:
+                        heapq.heappop(self.heap)  # Replaced or cancelled
+                        continue
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        self.condition.wait(delay)
+                        continue
+                    heapq.heappop(self.heap)
+                    del self.pending[key]
+                    break
+
+            lateness = -delay
+            self.fired += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            try:
+                callback()
+            except Exception:
+                logger.exception("Signal scheduler callback error")
+
+    def get_stats(self):
+        """Get timer counts and how late deadlines fired"""
+        return {
+            "timers": len(self.pending),
+            "fired": self.fired,
+            "avg_lateness_ms": round(self.total_lateness / self.fired * 1000, 3) if self.fired else 0.0,
+            "max_lateness_ms": round(self.max_lateness * 1000, 3)
+        }
+
+    def stop(self):
+        """Stop the scheduler thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+# Default phase durations in seconds (GREEN is replaced by the dynamic timing)
+DEFAULT_DURATIONS = {
+    "GREEN": 30,
+    "YELLOW": 5,
+    "RED": 25
+}
+
+# Green time chosen from the zone counts (tuned offline with simulator.py)
+DEFAULT_TIMING_POLICY = {
+    "red_threshold": 8,       # Red zone count above this...
+    "red_green": 60,          # ...gives this many seconds of green
+    "yellow_threshold": 5,    # Yellow zone count above this...
+    "yellow_green": 40,       # ...gives this many seconds of green
+    "base_green": 30          # Otherwise
+}
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def default_scheduler():
+    """Process-wide scheduler used by controllers that are not given one"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = SignalScheduler()
+            _default_scheduler.start()
+        return _default_scheduler
+
+class TrafficSignalController:
+    def __init__(self, scheduler=None, timing_policy=None):
         self.current_signal = "GREEN"
         self.signal_start_time = datetime.now()
         self.signal_duration = 30  # Default 30 seconds
-        self.time_remaining = self.signal_duration
         
         # Signal cycle: GREEN -> YELLOW -> RED -> GREEN
         self.signal_cycle = ["GREEN", "YELLOW", "RED"]
         self.current_cycle_index = 0
         
         # Default durations (in seconds)
-        self.default_durations = {
-            "GREEN": 30,
-            "YELLOW": 5,
-            "RED": 25
-        }
+        self.default_durations = dict(DEFAULT_DURATIONS)
         
         # Dynamic duration based on congestion
         self.dynamic_green_duration = 30
+        self.timing_policy = dict(DEFAULT_TIMING_POLICY, **(timing_policy or {}))
+        
+        # Callbacks notified on every signal change: callback(signal, duration, reason)
+        self.listeners = []
         
-        # Start the signal timer thread
+        # Phase timing uses the monotonic clock; the lock guards all phase state.
+        # Listeners run under it, so it is re-entrant for listeners that read
+        # the status back.
+        self.lock = threading.RLock()
+        self.phase_start = time.monotonic()
+        self.deadline = self.phase_start + self.signal_duration
+        
+        # Phase changes are fired by a shared deadline scheduler
+        self.scheduler = scheduler or default_scheduler()
         self.running = True
-        self.timer_thread = threading.Thread(target=self._signal_timer, daemon=True)
-        self.timer_thread.start()
+        self.scheduler.schedule(self, self.deadline, self._on_deadline)
+    
+    @property
+    def time_remaining(self):
+        """Seconds left in the current phase"""
+        return max(0.0, self.deadline - time.monotonic())
     
     def calculate_dynamic_timing(self, congestion_data):
         """Calculate dynamic signal timing based on congestion"""
@@ -35,73 +183,97 @@ class TrafficSignalController:
         yellow_zone_count = zone_counts.get("yellow_zone", 0)
         
         # Dynamic green signal timing logic
-        if red_zone_count > 8:
-            self.dynamic_green_duration = 60
-        elif yellow_zone_count > 5:
-            self.dynamic_green_duration = 40
+        policy = self.timing_policy
+        if red_zone_count > policy["red_threshold"]:
+            green_duration = policy["red_green"]
+        elif yellow_zone_count > policy["yellow_threshold"]:
+            green_duration = policy["yellow_green"]
         else:
-            self.dynamic_green_duration = 30
-    
-    def _signal_timer(self):
-        """Background timer for signal changes"""
-        while self.running:
-            current_time = datetime.now()
-            elapsed = (current_time - self.signal_start_time).total_seconds()
-            
-            # Calculate time remaining
-            if self.current_signal == "GREEN":
-                duration = self.dynamic_green_duration
-            else:
-                duration = self.default_durations[self.current_signal]
-            
-            self.time_remaining = max(0, duration - elapsed)
-            
-            # Check if signal should change
-            if elapsed >= duration:
-                self._change_signal()
+            green_duration = policy["base_green"]
+        
+        with self.lock:
+            if green_duration == self.dynamic_green_duration:
+                return
+            self.dynamic_green_duration = green_duration
             
-            time.sleep(1)  # Update every second
+            # Re-plan a running green phase right away
+            if self.current_signal == "GREEN" and self.running:
+                self.signal_duration = green_duration
+                self._plan()
     
-    def _change_signal(self):
-        """Change to the next signal in the cycle"""
-        self.current_cycle_index = (self.current_cycle_index + 1) % len(self.signal_cycle)
-        self.current_signal = self.signal_cycle[self.current_cycle_index]
+    def _plan(self):
+        """Schedule the end of the current phase (lock held)"""
+        self.deadline = self.phase_start + self.signal_duration
+        self.scheduler.schedule(self, self.deadline, self._on_deadline)
+    
+    def _start_phase(self, signal, phase_start):
+        """Switch to a signal and schedule its end (lock held)"""
+        self.current_signal = signal
+        self.current_cycle_index = self.signal_cycle.index(signal)
         self.signal_start_time = datetime.now()
         
         # Set duration for new signal
-        if self.current_signal == "GREEN":
+        if signal == "GREEN":
             self.signal_duration = self.dynamic_green_duration
         else:
-            self.signal_duration = self.default_durations[self.current_signal]
+            self.signal_duration = self.default_durations[signal]
         
-        self.time_remaining = self.signal_duration
+        self.phase_start = phase_start
+        self._plan()
+    
+    def _on_deadline(self):
+        """Scheduler callback at the end of a phase"""
+        with self.lock:
+            if not self.running:
+                return
+            self._change_signal()
+            logger.info("Signal changed to %s for %s seconds", self.current_signal, self.signal_duration)
+            self._notify_listeners("automatic")
+    
+    def _change_signal(self):
+        """Change to the next signal in the cycle (lock held)"""
+        next_index = (self.current_cycle_index + 1) % len(self.signal_cycle)
         
-        print(f"Signal changed to {self.current_signal} for {self.signal_duration} seconds")
+        # Start from the planned deadline so the cycle does not drift, unless
+        # it already passed (a re-plan shortened the phase below its elapsed time)
+        now = time.monotonic()
+        phase_start = self.deadline if now - self.deadline < 0.05 else now
+        self._start_phase(self.signal_cycle[next_index], phase_start)
+    
+    def add_listener(self, callback):
+        """Register a callback for signal changes"""
+        self.listeners.append(callback)
+    
+    def _notify_listeners(self, reason):
+        """Tell listeners about the current signal (lock held)"""
+        for callback in self.listeners:
+            try:
+                callback(self.current_signal, self.signal_duration, reason)
+            except Exception:
+                logger.exception("Signal listener error")
     
     def get_signal_status(self):
         """Get current signal status"""
-        return {
-            "current_signal": self.current_signal,
-            "time_remaining": int(self.time_remaining),
-            "signal_duration": self.signal_duration,
-            "dynamic_green_duration": self.dynamic_green_duration,
-            "timestamp": datetime.now().isoformat()
-        }
+        with self.lock:
+            time_remaining = self.time_remaining
+            return {
+                "current_signal": self.current_signal,
+                "time_remaining": math.ceil(time_remaining),
+                "time_remaining_ms": int(time_remaining * 1000),
+                "signal_duration": self.signal_duration,
+                "dynamic_green_duration": self.dynamic_green_duration,
+                "timestamp": datetime.now().isoformat()
+            }
     
     def force_signal_change(self, signal):
         """Manually force a signal change (for testing)"""
         if signal in self.signal_cycle:
-            self.current_signal = signal
-            self.current_cycle_index = self.signal_cycle.index(signal)
-            self.signal_start_time = datetime.now()
-            
-            if signal == "GREEN":
-                self.signal_duration = self.dynamic_green_duration
-            else:
-                self.signal_duration = self.default_durations[signal]
-            
-            self.time_remaining = self.signal_duration
+            with self.lock:
+                self._start_phase(signal, time.monotonic())
+                self._notify_listeners("manual")
     
     def stop(self):
         """Stop the signal controller"""
-        self.running = False
+        with self.lock:
+            self.running = False
+            self.scheduler.cancel(self)
@@ -0,0 +1,309 @@
+"""Offline signal-policy simulator.
+
+Replays a recorded congestion trace faster than real time and evaluates
+many dynamic-timing policies at once. Every candidate policy is one lane of
+a NumPy array, so a sweep over thousands of threshold combinations is one
+pass over the trace.
+
+Usage:
+    python simulator.py --csv trace.csv
+    python simulator.py --history sqlite --sqlite-path traffic_history.db --since 2025-01-01
+    python simulator.py --csv trace.csv --red-threshold 4:16:2 --red-green 40:90:10 --output sweep.csv
+
+Model: the approach is a point queue. Arrivals per step are reconstructed
+from the trace as the change in the total vehicle count plus the vehicles
+the recorded signal let through (saturation flow while it was green). Each
+policy then runs its own GREEN -> YELLOW -> RED cycle over those arrivals.
+Green time is chosen like TrafficSignalController.calculate_dynamic_timing,
+from zone counts estimated as the simulated queue split by the recorded
+zone shares. Departures happen only on green, at the saturation flow.
+"""
+import argparse
+import csv
+import time
+from datetime import datetime
+import numpy as np
+from history import SIGNAL_CODES
+from signal_logic import DEFAULT_DURATIONS, DEFAULT_TIMING_POLICY
+
+POLICY_FIELDS = ("red_threshold", "red_green", "yellow_threshold", "yellow_green", "base_green")
+METRICS = ("avg_queue", "max_queue", "avg_delay_s", "residual_queue", "throughput_per_hour",
+           "green_share", "green_utilization", "cycles")
+
+GREEN, YELLOW, RED = SIGNAL_CODES["GREEN"], SIGNAL_CODES["YELLOW"], SIGNAL_CODES["RED"]
+
+# Accepted CSV column names for each trace field
+CSV_COLUMNS = {
+    "green": ("green_zone_count", "green_zone"),
+    "yellow": ("yellow_zone_count", "yellow_zone"),
+    "red": ("red_zone_count", "red_zone"),
+    "signal": ("signal_status", "signal")
+}
+
+def parse_timestamp(value):
+    """Epoch seconds or an ISO timestamp"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+class Trace:
+    """Congestion readings as arrays: epoch seconds, (N, 3) green/yellow/red counts, signal codes"""
+
+    def __init__(self, timestamps, counts, signals=None):
+        order = np.argsort(timestamps, kind='stable')
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)[order]
+        self.counts = np.asarray(counts, dtype=np.float64).reshape(-1, 3)[order]
+        if signals is None:
+            signals = np.full(len(self.timestamps), -1, dtype=np.int8)
+        self.signals = np.asarray(signals, dtype=np.int8)[order]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Rows of (timestamp, green, yellow, red, occupied_grid_cells, signal_status)"""
+        rows = list(rows)
+        timestamps = [row[0].timestamp() if isinstance(row[0], datetime) else parse_timestamp(row[0])
+                      for row in rows]
+        counts = [row[1:4] for row in rows]
+        signals = [SIGNAL_CODES.get(row[5], -1) for row in rows]
+        return cls(timestamps, counts, signals)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a CSV with a timestamp column and zone count columns"""
+        with open(path, newline="") as csv_file:
+            reader = csv.DictReader(csv_file)
+            columns = {}
+            for field, names in CSV_COLUMNS.items():
+                columns[field] = next((name for name in names if name in reader.fieldnames), None)
+            missing = [field for field in ("green", "yellow", "red") if columns[field] is None]
+            if "timestamp" not in reader.fieldnames or missing:
+                raise ValueError(f"{path} needs a timestamp column and zone count columns")
+
+            timestamps, counts, signals = [], [], []
+            for row in reader:
+                timestamps.append(parse_timestamp(row["timestamp"]))
+                counts.append([float(row[columns[field]] or 0) for field in ("green", "yellow", "red")])
+                signal = row[columns["signal"]].upper() if columns["signal"] else ""
+                signals.append(SIGNAL_CODES.get(signal, -1))
+        return cls(timestamps, counts, signals)
+
+    @classmethod
+    def from_store(cls, store, since=None, until=None):
+        """Load congestion_data rows from a MySQLStore or SQLiteStore"""
+        return cls.from_rows(store.select_congestion(since, until))
+
+    def resample(self, step, max_gap=10.0):
+        """Readings on a regular step (last reading carried forward).
+
+        Steps more than max_gap seconds after the last reading (the system was
+        off) are dropped. Returns (times, counts, signals, segment_start),
+        where segment_start marks the first step after a gap.
+        """
+        if len(self) == 0:
+            raise ValueError("The trace is empty")
+        grid = np.arange(self.timestamps[0], self.timestamps[-1] + step / 2, step)
+        index = np.searchsorted(self.timestamps, grid, side='right') - 1
+        valid = grid - self.timestamps[index] <= max_gap
+        grid, index = grid[valid], index[valid]
+
+        segment_start = np.ones(len(grid), dtype=bool)
+        segment_start[1:] = np.diff(grid) > step * 1.5
+        return grid, self.counts[index], self.signals[index], segment_start
+
+def smooth(values, window):
+    """Trailing moving average over `window` steps (detector counts flicker frame to frame)"""
+    if window <= 1:
+        return values
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    index = np.arange(1, len(values) + 1)
+    start = np.maximum(index - window, 0)
+    return (cumulative[index] - cumulative[start]) / (index - start)
+
+def reconstruct_arrivals(totals, signals, segment_start, saturation_flow, step):
+    """Vehicles arriving per step: count change plus what the recorded green discharged"""
+    previous = np.concatenate([[totals[0]], totals[:-1]])
+    discharged = np.where(signals == GREEN, np.minimum(previous, saturation_flow * step), 0.0)
+    arrivals = np.maximum(totals - previous + discharged, 0.0)
+    arrivals[segment_start] = 0.0  # No information across gaps
+    return arrivals
+
+def parse_values(text):
+    """'a:b:step' (inclusive range) or 'a,b,c' into an array"""
+    if ":" in text:
+        start, stop, step = (float(part) for part in text.split(":"))
+        return np.arange(start, stop + step / 2, step)
+    return np.array([float(part) for part in text.split(",")])
+
+def policy_grid(**values):
+    """Every combination of the given per-field values as flat (P,) arrays.
+
+    Fields that are not given use DEFAULT_TIMING_POLICY.
+    """
+    axes = [np.atleast_1d(np.asarray(values.get(field, DEFAULT_TIMING_POLICY[field]), dtype=np.float64))
+            for field in POLICY_FIELDS]
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return {field: grid.ravel() for field, grid in zip(POLICY_FIELDS, mesh)}
+
+def simulate(trace, policies, step=1.0, saturation_flow=0.5, yellow=None, red=None, max_gap=10.0,
+             smoothing=5.0):
+    """Run every policy over the trace and return a dict of (P,) metric arrays"""
+    yellow = DEFAULT_DURATIONS["YELLOW"] if yellow is None else yellow
+    red = DEFAULT_DURATIONS["RED"] if red is None else red
+
+    times, counts, signals, segment_start = trace.resample(step, max_gap)
+    counts = np.stack([smooth(counts[:, i], int(round(smoothing / step))) for i in range(3)], axis=1)
+    totals = counts.sum(axis=1)
+    arrivals = reconstruct_arrivals(totals, signals, segment_start, saturation_flow, step)
+
+    # Share of the vehicles seen in the red and yellow zones, used to estimate
+    # what the camera would count given each policy's simulated queue
+    safe_totals = np.maximum(totals, 1.0)
+    red_share = counts[:, 2] / safe_totals
+    yellow_share = counts[:, 1] / safe_totals
+
+    red_threshold = policies["red_threshold"]
+    red_green = policies["red_green"]
+    yellow_threshold = policies["yellow_threshold"]
+    yellow_green = policies["yellow_green"]
+    base_green = policies["base_green"]
+    size = len(red_threshold)
+
+    queue = np.full(size, totals[0])
+    phase = np.zeros(size, dtype=np.int8)  # Everyone starts on green
+    elapsed = np.zeros(size)
+    queue_sum = np.zeros(size)
+    max_queue = queue.copy()
+    departed = np.zeros(size)
+    green_steps = np.zeros(size)
+    cycles = np.zeros(size)
+    discharge = saturation_flow * step
+
+    for t in range(len(times)):
+        queue += arrivals[t]
+
+        # Green time re-planned every step, as the live controller does
+        green_target = np.where(queue * red_share[t] > red_threshold, red_green,
+                                np.where(queue * yellow_share[t] > yellow_threshold, yellow_green, base_green))
+        is_green = phase == GREEN
+        duration = np.where(is_green, green_target, np.where(phase == YELLOW, yellow, red))
+
+        leaving = np.where(is_green, np.minimum(queue, discharge), 0.0)
+        queue -= leaving
+        departed += leaving
+        green_steps += is_green
+
+        queue_sum += queue
+        np.maximum(max_queue, queue, out=max_queue)
+
+        elapsed += step
+        done = elapsed >= duration
+        phase = np.where(done, (phase + 1) % 3, phase).astype(np.int8)
+        elapsed[done] = 0.0
+        cycles += done & (phase == GREEN)
+
+    steps = len(times)
+    total_arrivals = totals[0] + arrivals.sum()
+    green_seconds = green_steps * step
+    return {
+        "avg_queue": queue_sum / steps,
+        "max_queue": max_queue,
+        "avg_delay_s": queue_sum * step / max(total_arrivals, 1.0),  # Little's law
+        "residual_queue": queue,
+        "throughput_per_hour": departed / (steps * step) * 3600,
+        "green_share": green_steps / steps,
+        "green_utilization": np.divide(departed, green_seconds * saturation_flow,
+                                       out=np.zeros(size), where=green_seconds > 0),
+        "cycles": cycles
+    }
+
+def rank(policies, results, metric="avg_delay_s", top=10):
+    """Indexes of the best policies by a metric (lower is better, except utilization and throughput)"""
+    values = results[metric]
+    if metric in ("green_utilization", "throughput_per_hour"):
+        values = -values
+    return np.argsort(values, kind='stable')[:top]
+
+def write_results(path, policies, results):
+    """Write one CSV row per policy"""
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(POLICY_FIELDS + METRICS)
+        columns = [policies[field] for field in POLICY_FIELDS] + [results[metric] for metric in METRICS]
+        for row in zip(*columns):
+            writer.writerow([round(float(value), 4) for value in row])
+
+def format_row(label, policies, results, index):
+    policy = " ".join(f"{field}={policies[field][index]:g}" for field in POLICY_FIELDS)
+    metrics = " ".join(f"{metric}={results[metric][index]:.2f}" for metric in METRICS)
+    return f"{label:>8}  {policy}\n          {metrics}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay congestion traces against candidate signal policies")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="Trace CSV (timestamp, green/yellow/red zone counts, signal_status)")
+    source.add_argument("--history", choices=("sqlite", "mysql"), help="Read congestion_data from the history store")
+    parser.add_argument("--sqlite-path", default="traffic_history.db")
+    parser.add_argument("--mysql", default="localhost,root,password,traffic_management",
+                        help="host,user,password,database")
+    parser.add_argument("--since", help="Start of the replay (ISO timestamp)")
+    parser.add_argument("--until", help="End of the replay (ISO timestamp)")
+
+    parser.add_argument("--step", type=float, default=1.0, help="Simulation step in seconds")
+    parser.add_argument("--saturation-flow", type=float, default=0.5, help="Vehicles per second discharged on green")
+    parser.add_argument("--smoothing", type=float, default=5.0, help="Seconds of count smoothing before differencing")
+    parser.add_argument("--yellow", type=float, default=DEFAULT_DURATIONS["YELLOW"])
+    parser.add_argument("--red", type=float, default=DEFAULT_DURATIONS["RED"])
+
+    parser.add_argument("--red-threshold", default="4:16:2")
+    parser.add_argument("--red-green", default="40:90:10")
+    parser.add_argument("--yellow-threshold", default="2:12:2")
+    parser.add_argument("--yellow-green", default="30:60:10")
+    parser.add_argument("--base-green", default="20:40:5")
+
+    parser.add_argument("--rank-by", default="avg_delay_s", choices=METRICS)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="Write every policy's metrics to this CSV")
+    args = parser.parse_args()
+
+    if args.csv:
+        trace = Trace.from_csv(args.csv)
+    else:
+        from storage import MySQLStore, SQLiteStore
+        if args.history == "sqlite":
+            store = SQLiteStore(args.sqlite_path)
+        else:
+            host, user, password, database = args.mysql.split(",")
+            store = MySQLStore({'host': host, 'user': user, 'password': password, 'database': database}, pool_size=1)
+        since = datetime.fromisoformat(args.since) if args.since else None
+        until = datetime.fromisoformat(args.until) if args.until else None
+        trace = Trace.from_store(store, since, until)
+        store.close()
+
+    policies = policy_grid(**{field: parse_values(getattr(args, field)) for field in POLICY_FIELDS})
+    baseline = policy_grid()
+    for field in POLICY_FIELDS:
+        policies[field] = np.concatenate([baseline[field], policies[field]])  # Index 0 is the live policy
+
+    start = time.perf_counter()
+    results = simulate(trace, policies, step=args.step, saturation_flow=args.saturation_flow,
+                       yellow=args.yellow, red=args.red, smoothing=args.smoothing)
+    elapsed = time.perf_counter() - start
+
+    span = trace.timestamps[-1] - trace.timestamps[0]
+    print(f"Replayed {len(trace)} readings ({span / 3600:.2f} h) against {len(policies['red_threshold'])} policies "
+          f"in {elapsed:.2f} s ({span / max(elapsed, 1e-9):.0f}x real time)")
+    print(format_row("current", policies, results, 0))
+    print(f"Top {args.top} by {args.rank_by}:")
+    for position, index in enumerate(rank(policies, results, args.rank_by, args.top), 1):
+        print(format_row(f"#{position}", policies, results, index))
+
+    if args.output:
+        write_results(args.output, policies, results)
+        print(f"Wrote {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,691 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time
+from metrics import DB_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Columns read back for replay and analytics
+CONGESTION_SELECT = ("SELECT timestamp, green_zone_count, yellow_zone_count, red_zone_count, "
+                     "occupied_grid_cells, signal_status FROM congestion_data")
+
+def congestion_query(placeholder, since=None, until=None):
+    """SELECT for congestion rows in a time range, oldest first"""
+    conditions, params = [], []
+    if since is not None:
+        conditions.append(f"timestamp >= {placeholder}")
+        params.append(since)
+    if until is not None:
+        conditions.append(f"timestamp < {placeholder}")
+        params.append(until)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return CONGESTION_SELECT + where + " ORDER BY timestamp", params
+
+# Columns written for each table (total_vehicles is generated by the database)
+TABLE_COLUMNS = {
+    "congestion_data": ("timestamp", "green_zone_count", "yellow_zone_count", "red_zone_count",
+                        "occupied_grid_cells", "signal_status"),
+    "signal_history": ("timestamp", "signal_type", "duration_seconds", "reason", "intersection_id")
+}
+
+def insert_query(table, count, placeholder):
+    """Multi-row INSERT for count rows of a table"""
+    columns = TABLE_COLUMNS[table]
+    values = ", ".join(["(" + ", ".join([placeholder] * len(columns)) + ")"] * count)
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}"
+
+# Rollup resolutions: bucket start of a timestamp and bucket length in seconds
+ROLLUP_BUCKETS = {
+    "minute": lambda timestamp: timestamp.replace(second=0, microsecond=0),
+    "hour": lambda timestamp: timestamp.replace(minute=0, second=0, microsecond=0),
+    "day": lambda timestamp: timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+}
+ROLLUP_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Additive rollup columns; merging two partial rollups adds these
+ROLLUP_SUMS = ("readings", "green_zone_sum", "yellow_zone_sum", "red_zone_sum", "total_vehicles_sum",
+               "occupied_grid_cells_sum", "green_signal_readings")
+ROLLUP_COLUMNS = ("resolution", "bucket_start") + ROLLUP_SUMS + ("total_vehicles_max", "total_vehicles_min", "peak_time")
+ROLLUP_SELECT = "SELECT " + ", ".join(ROLLUP_COLUMNS[1:]) + " FROM congestion_rollup"
+
+SYSTEM_STATS_COLUMNS = ("date", "total_vehicles_detected", "avg_congestion_level", "peak_congestion_time",
+                        "total_signal_changes", "system_uptime_minutes")
+
+def build_rollups(rows):
+    """Per-minute, per-hour and per-day partial rollups of congestion_data rows"""
+    buckets = {}
+    for timestamp, green, yellow, red, occupied, signal in rows:
+        total = green + yellow + red
+        for resolution, bucket in ROLLUP_BUCKETS.items():
+            key = (resolution, bucket(timestamp))
+            entry = buckets.get(key)
+            if entry is None:
+                buckets[key] = [1, green, yellow, red, total, occupied or 0, int(signal == "GREEN"),
+                                total, total, timestamp]
+                continue
+            entry[0] += 1
+            entry[1] += green
+            entry[2] += yellow
+            entry[3] += red
+            entry[4] += total
+            entry[5] += occupied or 0
+            entry[6] += signal == "GREEN"
+            if total > entry[7]:
+                entry[7] = total
+                entry[9] = timestamp
+            entry[8] = min(entry[8], total)
+    return [key + tuple(entry) for key, entry in buckets.items()]
+
+def rollup_query(placeholder, resolution, since=None, until=None):
+    """SELECT for one resolution's rollups in a time range (primary key range scan)"""
+    conditions, params = [f"resolution = {placeholder}"], [resolution]
+    if since is not None:
+        conditions.append(f"bucket_start >= {placeholder}")
+        params.append(ROLLUP_BUCKETS[resolution](since))  # Include the bucket containing `since`
+    if until is not None:
+        conditions.append(f"bucket_start < {placeholder}")
+        params.append(until)
+    return f"{ROLLUP_SELECT} WHERE {' AND '.join(conditions)} ORDER BY bucket_start", params
+
+def rollup_points(rows):
+    """Rollup rows as history points with averages over each bucket"""
+    points = []
+    for (bucket_start, readings, green, yellow, red, total, occupied, green_readings,
+         total_max, total_min, peak_time) in rows:
+        points.append({
+            'zone_counts': {
+                'green_zone': round(green / readings, 2),
+                'yellow_zone': round(yellow / readings, 2),
+                'red_zone': round(red / readings, 2)
+            },
+            'total_vehicles': round(total / readings, 2),
+            'occupied_grid_cells': round(occupied / readings, 2),
+            'max_vehicles': total_max,
+            'min_vehicles': total_min,
+            'peak_time': peak_time.isoformat() if peak_time else None,
+            'green_share': round(green_readings / readings, 3),
+            'readings': readings,
+            'timestamp': bucket_start.isoformat()
+        })
+    return points
+
+class RollupStore:
+    """Transactional batch writes with rollup and system_stats maintenance.
+
+    Subclasses provide the placeholder, the two upsert statements and
+    _transaction(), a context manager yielding a cursor that commits on
+    success and rolls back on error.
+    """
+
+    placeholder = "?"
+    ROLLUP_UPSERT = None
+    SYSTEM_STATS_UPSERT = None
+
+    def _param(self, value):
+        return value
+
+    def _execute(self, cursor, query, params=()):
+        cursor.execute(query, [self._param(value) for value in params])
+
+    def insert_many(self, table, rows):
+        """Insert rows into a table and commit"""
+        self.write_batch({table: rows})
+
+    def _insert(self, cursor, table, rows):
+        """One multi-row INSERT"""
+        self._execute(cursor, insert_query(table, len(rows), self.placeholder),
+                      [value for row in rows for value in row])
+
+    def write_batch(self, tables, rollups=(), daily=None):
+        """Insert raw rows, merge partial rollups and refresh system_stats in one transaction.
+
+        tables: table -> rows, rollups: rows from build_rollups(),
+        daily: date -> (new vehicles, signal changes) to add to system_stats.
+        """
+        days = set(daily or ())
+        days.update(rollup[1].date() for rollup in rollups if rollup[0] == "day")
+        with self._transaction() as cursor:
+            for table, rows in tables.items():
+                if rows:
+                    self._insert(cursor, table, rows)
+            new_minutes = self._new_minutes(cursor, [rollup[1] for rollup in rollups if rollup[0] == "minute"])
+            for rollup in rollups:
+                self._execute(cursor, self.ROLLUP_UPSERT, rollup)
+            for day in sorted(days):
+                vehicles, signal_changes = (daily or {}).get(day, (0, 0))
+                self._update_system_stats(cursor, day, vehicles, signal_changes, new_minutes.get(day, 0))
+
+    def _new_minutes(self, cursor, minutes):
+        """Per day, how many of these minute buckets have no rollup yet (uptime is added up
+        from these, so it survives CleanOldData pruning the minute rollups)"""
+        if not minutes:
+            return {}
+        self._execute(cursor, f"SELECT bucket_start FROM congestion_rollup WHERE resolution = {self.placeholder} "
+                              f"AND bucket_start >= {self.placeholder} AND bucket_start <= {self.placeholder}",
+                      ("minute", min(minutes), max(minutes)))
+        existing = {self._datetime(row[0]) for row in cursor.fetchall()}
+        new_minutes = {}
+        for minute in minutes:
+            if minute not in existing:
+                new_minutes[minute.date()] = new_minutes.get(minute.date(), 0) + 1
+        return new_minutes
+
+    def _update_system_stats(self, cursor, day, vehicles, signal_changes, uptime_minutes):
+        """Upsert one day of system_stats: add the counts, refresh average and peak from the day rollup"""
+        start = datetime.combine(day, datetime.min.time())
+        self._execute(cursor, f"SELECT readings, total_vehicles_sum, peak_time FROM congestion_rollup "
+                              f"WHERE resolution = {self.placeholder} AND bucket_start = {self.placeholder}",
+                      ("day", start))
+        day_rollup = cursor.fetchone()
+
+        average, peak = None, None
+        if day_rollup is not None and day_rollup[0]:
+            average = round(day_rollup[1] / day_rollup[0], 2)
+            peak = self._datetime(day_rollup[2]).time().replace(microsecond=0) if day_rollup[2] else None
+        self._execute(cursor, self.SYSTEM_STATS_UPSERT,
+                      (day, vehicles, average, peak, signal_changes, uptime_minutes))
+
+    def _datetime(self, value):
+        return value
+
+    def select_rollups(self, resolution, since=None, until=None):
+        """Rollup rows (datetimes) of one resolution in a time range, oldest first"""
+        query, params = rollup_query(self.placeholder, resolution, since, until)
+        with self._transaction() as cursor:
+            self._execute(cursor, query, params)
+            rows = cursor.fetchall()
+        return [(self._datetime(row[0]),) + tuple(row[1:-1]) + (self._datetime(row[-1]),) for row in rows]
+
+    def select_system_stats(self, since=None):
+        """system_stats rows from a date on, oldest first"""
+        query = f"SELECT {', '.join(SYSTEM_STATS_COLUMNS)} FROM system_stats"
+        params = []
+        if since is not None:
+            query += f" WHERE date >= {self.placeholder}"
+            params.append(since)
+        with self._transaction() as cursor:
+            self._execute(cursor, query + " ORDER BY date", params)
+            return cursor.fetchall()
+
+def _merge_clause(excluded, greatest="GREATEST", least="LEAST"):
+    """SET expressions merging an incoming partial rollup into the stored row.
+
+    peak_time is listed first because MySQL applies assignments left to right.
+    """
+    return ", ".join(
+        [f"peak_time = CASE WHEN {excluded('total_vehicles_max')} > total_vehicles_max "
+         f"THEN {excluded('peak_time')} ELSE peak_time END"] +
+        [f"{column} = {column} + {excluded(column)}" for column in ROLLUP_SUMS] +
+        [f"total_vehicles_max = {greatest}(total_vehicles_max, {excluded('total_vehicles_max')})",
+         f"total_vehicles_min = {least}(total_vehicles_min, {excluded('total_vehicles_min')})"])
+
+def _stats_clause(excluded):
+    """SET expressions adding counts to a system_stats row and replacing the derived values"""
+    return ", ".join([
+        f"total_vehicles_detected = total_vehicles_detected + {excluded('total_vehicles_detected')}",
+        f"avg_congestion_level = COALESCE({excluded('avg_congestion_level')}, avg_congestion_level)",
+        f"peak_congestion_time = COALESCE({excluded('peak_congestion_time')}, peak_congestion_time)",
+        f"total_signal_changes = total_signal_changes + {excluded('total_signal_changes')}",
+        f"system_uptime_minutes = system_uptime_minutes + {excluded('system_uptime_minutes')}"
+    ])
+
+class MySQLStore(RollupStore):
+    """Pooled MySQL connections with multi-row inserts"""
+
+    placeholder = "%s"
+
+    ROLLUP_UPSERT = (f"INSERT INTO congestion_rollup ({', '.join(ROLLUP_COLUMNS)}) "
+                     f"VALUES ({', '.join(['%s'] * len(ROLLUP_COLUMNS))}) "
+                     f"ON DUPLICATE KEY UPDATE {_merge_clause(lambda column: f'VALUES({column})')}")
+    SYSTEM_STATS_UPSERT = (f"INSERT INTO system_stats ({', '.join(SYSTEM_STATS_COLUMNS)}) "
+                           f"VALUES ({', '.join(['%s'] * len(SYSTEM_STATS_COLUMNS))}) "
+                           f"ON DUPLICATE KEY UPDATE {_stats_clause(lambda column: f'VALUES({column})')}")
+
+    # Tables and columns added after the original database/setup.sql
+    ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS congestion_rollup (
+        resolution VARCHAR(10) NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        readings INT NOT NULL DEFAULT 0,
+        green_zone_sum INT NOT NULL DEFAULT 0,
+        yellow_zone_sum INT NOT NULL DEFAULT 0,
+        red_zone_sum INT NOT NULL DEFAULT 0,
+        total_vehicles_sum INT NOT NULL DEFAULT 0,
+        occupied_grid_cells_sum INT NOT NULL DEFAULT 0,
+        green_signal_readings INT NOT NULL DEFAULT 0,
+        total_vehicles_max INT NOT NULL DEFAULT 0,
+        total_vehicles_min INT NOT NULL DEFAULT 0,
+        peak_time DATETIME,
+        PRIMARY KEY (resolution, bucket_start)
+    )
+    """
+    INTERSECTION_COLUMN = ("ALTER TABLE signal_history ADD COLUMN intersection_id VARCHAR(50) DEFAULT NULL AFTER reason, "
+                           "ADD INDEX idx_intersection (intersection_id, timestamp)")
+
+    def __init__(self, config, pool_size=4):
+        import mysql.connector.pooling
+
+        self.pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name="traffic_history", pool_size=pool_size, **config)
+        self._migrate()
+
+    def _migrate(self):
+        """Bring a database created by an older setup.sql up to the current schema"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(self.ROLLUP_SCHEMA)
+                cursor.execute("SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() "
+                               "AND table_name = 'signal_history' AND column_name = 'intersection_id'")
+                if not cursor.fetchone()[0]:
+                    cursor.execute(self.INTERSECTION_COLUMN)
+        except Exception as e:
+            raise RuntimeError(f"Could not migrate the MySQL schema (run database/setup.sql or grant "
+                               f"CREATE/ALTER on the database): {e}") from e
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        finally:
+            conn.close()  # Returns the connection to the pool
+
+    def select_congestion(self, since=None, until=None):
+        """Congestion rows (datetimes) in a time range, oldest first"""
+        query, params = congestion_query(self.placeholder, since, until)
+        with self._transaction() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def close(self):
+        pass
+
+class SQLiteStore(RollupStore):
+    """Local SQLite database with the same tables as database/setup.sql"""
+
+    placeholder = "?"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS congestion_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        green_zone_count INTEGER NOT NULL DEFAULT 0,
+        yellow_zone_count INTEGER NOT NULL DEFAULT 0,
+        red_zone_count INTEGER NOT NULL DEFAULT 0,
+        total_vehicles INTEGER GENERATED ALWAYS AS (green_zone_count + yellow_zone_count + red_zone_count) STORED,
+        occupied_grid_cells INTEGER DEFAULT 0,
+        signal_status TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_congestion_timestamp ON congestion_data (timestamp);
+    CREATE TABLE IF NOT EXISTS signal_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        signal_type TEXT NOT NULL,
+        duration_seconds INTEGER NOT NULL,
+        reason TEXT DEFAULT 'automatic',
+        intersection_id TEXT DEFAULT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_signal_timestamp ON signal_history (timestamp);
+    CREATE TABLE IF NOT EXISTS congestion_rollup (
+        resolution TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        readings INTEGER NOT NULL DEFAULT 0,
+        green_zone_sum INTEGER NOT NULL DEFAULT 0,
+        yellow_zone_sum INTEGER NOT NULL DEFAULT 0,
+        red_zone_sum INTEGER NOT NULL DEFAULT 0,
+        total_vehicles_sum INTEGER NOT NULL DEFAULT 0,
+        occupied_grid_cells_sum INTEGER NOT NULL DEFAULT 0,
+        green_signal_readings INTEGER NOT NULL DEFAULT 0,
+        total_vehicles_max INTEGER NOT NULL DEFAULT 0,
+        total_vehicles_min INTEGER NOT NULL DEFAULT 0,
+        peak_time TEXT,
+        PRIMARY KEY (resolution, bucket_start)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS system_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL UNIQUE,
+        total_vehicles_detected INTEGER DEFAULT 0,
+        avg_congestion_level REAL DEFAULT 0.00,
+        peak_congestion_time TEXT,
+        total_signal_changes INTEGER DEFAULT 0,
+        system_uptime_minutes INTEGER DEFAULT 0,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+
+    # SQLite has scalar MAX/MIN instead of GREATEST/LEAST
+    ROLLUP_UPSERT = (f"INSERT INTO congestion_rollup ({', '.join(ROLLUP_COLUMNS)}) "
+                     f"VALUES ({', '.join(['?'] * len(ROLLUP_COLUMNS))}) "
+                     f"ON CONFLICT (resolution, bucket_start) DO UPDATE SET "
+                     f"{_merge_clause(lambda column: f'excluded.{column}', 'MAX', 'MIN')}")
+    SYSTEM_STATS_UPSERT = (f"INSERT INTO system_stats ({', '.join(SYSTEM_STATS_COLUMNS)}) "
+                           f"VALUES ({', '.join(['?'] * len(SYSTEM_STATS_COLUMNS))}) "
+                           f"ON CONFLICT (date) DO UPDATE SET {_stats_clause(lambda column: f'excluded.{column}')}, "
+                           f"updated_at = CURRENT_TIMESTAMP")
+
+    def __init__(self, path="traffic_history.db"):
+        # Each thread that reads or writes opens its own store
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+        # Databases created before signal_history had an intersection_id column
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(signal_history)")}
+        if "intersection_id" not in columns:
+            self.conn.execute("ALTER TABLE signal_history ADD COLUMN intersection_id TEXT DEFAULT NULL")
+
+    def _param(self, value):
+        """Datetimes, dates and times are stored as ISO text"""
+        if isinstance(value, datetime):
+            return value.isoformat(sep=' ')
+        if isinstance(value, (date, dt_time)):
+            return value.isoformat()
+        return value
+
+    def _datetime(self, value):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+    @contextmanager
+    def _transaction(self):
+        with self.conn:
+            yield self.conn.cursor()
+
+    def _insert(self, cursor, table, rows):
+        """executemany keeps each statement under SQLite's bound-variable limit"""
+        columns = TABLE_COLUMNS[table]
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([self.placeholder] * len(columns))})"
+        cursor.executemany(query, [tuple(self._param(value) for value in row) for row in rows])
+
+    def select_congestion(self, since=None, until=None):
+        """Congestion rows (datetimes) in a time range, oldest first"""
+        query, params = congestion_query(self.placeholder, self._param(since), self._param(until))
+        return [(datetime.fromisoformat(row[0]),) + tuple(row[1:])
+                for row in self.conn.execute(query, params)]
+
+    def close(self):
+        self.conn.close()
+
+class HistoryWriter:
+    """Asynchronous write-behind persistence for congestion and signal history.
+
+    Rows are buffered in a bounded queue and flushed by a background thread
+    with multi-row inserts whenever batch_size rows are waiting or
+    flush_interval seconds have passed. Recording never blocks the caller:
+    a row that finds the queue full is counted as dropped. If the database
+    is unavailable, the writer thread spills rows to a local JSON-lines file
+    (up to max_spill_bytes) and replays them once the database is reachable
+    again. A replay interrupted by a crash is resumed on the next start.
+
+    With rollups enabled, each flush also merges its congestion rows into
+    the per-minute, per-hour and per-day congestion_rollup rows and updates
+    system_stats for the affected days, in the same transaction as the raw
+    insert. Spilled rows are rolled up when they are replayed.
+    """
+
+    def __init__(self, store_factory, batch_size=200, flush_interval=2.0, max_queue=10000,
+                 spill_path="history_spill.jsonl", max_spill_bytes=50 * 1024 * 1024,
+                 retry_interval=30.0, rollups=True):
+        self.store_factory = store_factory  # Called on the writer thread to (re)connect
+        self.rollups = rollups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+        self.retry_interval = retry_interval
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.store = None
+        self.next_connect_time = 0.0
+        self.spill_lock = threading.Lock()
+
+        # Newly tracked vehicles per day, added to system_stats on the next flush
+        self.new_vehicles = {}
+        self.last_unique_vehicles = None
+        self.vehicles_lock = threading.Lock()
+
+        # Writer statistics
+        self.rows_written = 0
+        self.rows_spilled = 0
+        self.rows_dropped = 0
+        self.rows_dropped_queue_full = 0  # Only updated by callers of record()
+        self.rollups_merged = 0
+        self.flushes = 0
+        self.last_error = None
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the background writer thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, table, row):
+        """Queue a row for writing without ever blocking"""
+        try:
+            self.queue.put_nowait((table, row))
+        except queue.Full:
+            # No file I/O on the caller's (pipeline) thread
+            self.rows_dropped_queue_full += 1
+
+    def record_congestion(self, congestion_data, signal_status):
+        """Queue one congestion_data row"""
+        now = datetime.now()
+        zone_counts = congestion_data.get('zone_counts', {})
+        tracking = congestion_data.get('tracking')
+        if tracking is not None:
+            self._count_vehicles(now.date(), tracking.get('unique_vehicles', 0))
+        self.record("congestion_data", (
+            now,
+            zone_counts.get('green_zone', 0),
+            zone_counts.get('yellow_zone', 0),
+            zone_counts.get('red_zone', 0),
+            congestion_data.get('occupied_grid_cells', 0),
+            signal_status
+        ))
+
+    def record_signal_change(self, signal, duration, reason="automatic", intersection_id=None):
+        """Queue one signal_history row (intersection_id for corridor intersections)"""
+        self.record("signal_history", (datetime.now(), signal, int(duration), reason, intersection_id))
+
+    def _count_vehicles(self, day, unique_vehicles):
+        """Turn the tracker's running unique count into new vehicles per day"""
+        with self.vehicles_lock:
+            last = self.last_unique_vehicles
+            self.last_unique_vehicles = unique_vehicles
+            if last is not None and unique_vehicles > last:
+                self.new_vehicles[day] = self.new_vehicles.get(day, 0) + unique_vehicles - last
+
+    def _take_new_vehicles(self):
+        with self.vehicles_lock:
+            new_vehicles, self.new_vehicles = self.new_vehicles, {}
+        return new_vehicles
+
+    def _return_new_vehicles(self, new_vehicles):
+        """Keep vehicle counts from a failed flush for the next one"""
+        with self.vehicles_lock:
+            for day, count in new_vehicles.items():
+                self.new_vehicles[day] = self.new_vehicles.get(day, 0) + count
+
+    def _connect(self):
+        """Open the store if needed, backing off after failures"""
+        if self.store is not None:
+            return True
+        if time.monotonic() < self.next_connect_time:
+            return False
+        try:
+            self.store = self.store_factory()
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            self.next_connect_time = time.monotonic() + self.retry_interval
+            logger.warning("Database unavailable, spilling history to %s: %s", self.spill_path, e)
+            return False
+
+    def _write(self, rows):
+        """Write a batch grouped by table; spill it if the database fails"""
+        if not self._connect():
+            self._spill(rows)
+            return False
+
+        tables = {}
+        for table, row in rows:
+            tables.setdefault(table, []).append(row)
+
+        rollups, daily, new_vehicles = [], {}, {}
+        if self.rollups:
+            rollups = build_rollups(tables.get("congestion_data", ()))
+            new_vehicles = self._take_new_vehicles()
+            signal_changes = {}
+            for row in tables.get("signal_history", ()):
+                signal_changes[row[0].date()] = signal_changes.get(row[0].date(), 0) + 1
+            daily = {day: (new_vehicles.get(day, 0), signal_changes.get(day, 0))
+                     for day in set(new_vehicles) | set(signal_changes)}
+
+        started = time.perf_counter()
+        try:
+            self.store.write_batch(tables, rollups, daily)
+        except Exception as e:
+            DB_WRITE_SECONDS.observe(time.perf_counter() - started, "error")
+            self._return_new_vehicles(new_vehicles)
+            logger.warning("Database error: %s", e)
+            self.last_error = str(e)
+            self._spill(rows)
+            try:
+                self.store.close()
+            except Exception:
+                pass
+            self.store = None
+            self.next_connect_time = time.monotonic() + self.retry_interval
+            return False
+
+        DB_WRITE_SECONDS.observe(time.perf_counter() - started, "ok")
+        self.rollups_merged += len(rollups)
+        self.rows_written += len(rows)
+        self.flushes += 1
+        return True
+
+    def _spill(self, rows):
+        """Append rows to the local spill file"""
+        with self.spill_lock:
+            try:
+                size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+                if size >= self.max_spill_bytes:
+                    self.rows_dropped += len(rows)
+                    return
+                with open(self.spill_path, "a") as spill_file:
+                    for table, row in rows:
+                        spill_file.write(json.dumps({"table": table, "row": row}, default=str) + "\n")
+                self.rows_spilled += len(rows)
+            except OSError as e:
+                logger.error("Error spilling history: %s", e)
+                self.rows_dropped += len(rows)
+
+    def _replay_spill(self):
+        """Write spilled rows back once the database is reachable.
+
+        A .replay file left by a crash mid-replay is finished first; its rows
+        written before the crash may be written again.
+        """
+        replay_path = self.spill_path + ".replay"
+        with self.spill_lock:
+            if self.store is None:
+                return
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+
+        rows = []
+        with open(replay_path) as replay_file:
+            for line in replay_file:
+                entry = json.loads(line)
+                row = list(entry["row"])
+                row[0] = datetime.fromisoformat(row[0])
+                # Rows spilled before a column was added get NULL for it
+                row += [None] * (len(TABLE_COLUMNS[entry["table"]]) - len(row))
+                rows.append((entry["table"], tuple(row)))
+
+        for start in range(0, len(rows), self.batch_size):
+            if not self._write(rows[start:start + self.batch_size]):
+                # The failed batch was spilled again; keep the rest for later too
+                self._spill(rows[start + self.batch_size:])
+                break
+        os.remove(replay_path)
+
+    def _run(self):
+        """Flush batches on a size or time threshold"""
+        # Rows spilled (or left mid-replay) by a previous run
+        if self._connect():
+            self._replay_spill()
+
+        while self.running or not self.queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                if not self.running:
+                    # Drain whatever is left on shutdown
+                    while len(batch) < self.batch_size and not self.queue.empty():
+                        batch.append(self.queue.get_nowait())
+                    break
+
+            if batch and self._write(batch):
+                self._replay_spill()
+
+        if self.store is not None:
+            self.store.close()
+
+    def get_stats(self):
+        """Get writer statistics"""
+        return {
+            "connected": self.store is not None,
+            "queued": self.queue.qsize(),
+            "rows_written": self.rows_written,
+            "rows_spilled": self.rows_spilled,
+            "rows_dropped": self.rows_dropped + self.rows_dropped_queue_full,
+            "rollups_merged": self.rollups_merged,
+            "flushes": self.flushes,
+            "last_error": self.last_error
+        }
+
+    def stop(self):
+        """Flush remaining rows and stop the writer thread"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_interval + 5)
+
+def create_store_factory(backend, mysql_config=None, sqlite_path="traffic_history.db", pool_size=4):
+    """Return a callable that opens the configured history store"""
+    if backend == "sqlite":
+        return lambda: SQLiteStore(sqlite_path)
+    if backend == "mysql":
+        return lambda: MySQLStore(mysql_config, pool_size)
+    raise ValueError(f"Unknown history backend: {backend}")
@@ -0,0 +1,43 @@
+from history import CongestionHistory
+
+def reading(total):
+    return {'zone_counts': {'green_zone': total, 'yellow_zone': 0, 'red_zone': 0},
+            'total_vehicles': total, 'occupied_grid_cells': 1}
+
+def filled(count, capacity=100):
+    history = CongestionHistory(capacity=capacity)
+    for i in range(count):
+        history.append(reading(i), "GREEN", timestamp=1000.0 + i)
+    return history
+
+def totals(points):
+    return [point['total_vehicles'] for point in points]
+
+def test_limit_returns_newest():
+    assert totals(filled(10).query(limit=3)) == [7, 8, 9]
+
+def test_since_returns_oldest_after_it():
+    history = filled(10)
+    assert totals(history.query(since=1003.0, limit=3)) == [4, 5, 6]
+    assert totals(history.query(since=1003.5, limit=50)) == [4, 5, 6, 7, 8, 9]
+    assert history.query(since=1009.0) == []
+
+def test_until_bounds_the_range():
+    assert totals(filled(10).query(since=1001.0, until=1004.0, limit=50)) == [2, 3, 4]
+
+def test_max_points_averages_equal_buckets():
+    points = filled(10).query(limit=None, max_points=5)
+    assert totals(points) == [0.5, 2.5, 4.5, 6.5, 8.5]
+    # Each bucket keeps its last reading's timestamp
+    assert points[-1]['timestamp'] == filled(10).query(limit=1)[0]['timestamp']
+
+def test_max_points_larger_than_data_is_not_averaged():
+    assert totals(filled(4).query(limit=None, max_points=10)) == [0, 1, 2, 3]
+
+def test_ring_wraps_around():
+    history = filled(25, capacity=10)
+    assert len(history) == 10
+    assert totals(history.query(limit=50)) == list(range(15, 25))
+    assert totals(history.query(since=1000.0, limit=3)) == [15, 16, 17]
+    assert history.oldest_timestamp() == 1015.0
+    assert history.averages()['total_vehicles'] == 19.5
@@ -0,0 +1,56 @@
+import threading
+import time
+import pytest
+from pipeline import FrameQueue, BLOCK, DROP_OLDEST, DROP_NEWEST, LATEST
+
+def test_drop_oldest_evicts_stale_items():
+    queue = FrameQueue(maxsize=2, policy=DROP_OLDEST)
+    for item in range(4):
+        assert queue.put(item)
+    assert queue.dropped == 2
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == [2, 3]
+
+def test_drop_newest_rejects_new_items():
+    queue = FrameQueue(maxsize=2, policy=DROP_NEWEST)
+    assert queue.put(0) and queue.put(1)
+    assert not queue.put(2)
+    assert queue.dropped == 1
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == [0, 1]
+
+def test_latest_keeps_one_item():
+    queue = FrameQueue(maxsize=5, policy=LATEST)
+    for item in range(3):
+        queue.put(item)
+    assert queue.depth() == 1
+    assert queue.get(timeout=0) == 2
+
+def test_block_waits_for_room():
+    queue = FrameQueue(maxsize=1, policy=BLOCK)
+    queue.put(0)
+    threading.Timer(0.05, queue.get).start()
+    started = time.monotonic()
+    assert queue.put(1)
+    assert time.monotonic() - started >= 0.04
+    assert queue.dropped == 0
+
+def test_block_timeout_counts_a_drop():
+    queue = FrameQueue(maxsize=1, policy=BLOCK)
+    queue.put(0)
+    assert not queue.put(1, timeout=0.01)
+    assert queue.dropped == 1
+
+def test_block_close_releases_producer_without_a_drop():
+    queue = FrameQueue(maxsize=1, policy=BLOCK)
+    queue.put(0)
+    threading.Timer(0.02, queue.close).start()
+    assert not queue.put(1)
+    assert queue.dropped == 0
+
+def test_get_returns_none_when_closed():
+    queue = FrameQueue()
+    queue.close()
+    assert queue.get() is None
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        FrameQueue(policy="spill")
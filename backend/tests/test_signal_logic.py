@@ -0,0 +1,66 @@
+import threading
+import time
+from signal_logic import SignalScheduler
+
+def wait_for(event, timeout=1.0):
+    return event.wait(timeout)
+
+def test_schedule_fires_at_deadline():
+    scheduler = SignalScheduler()
+    scheduler.start()
+    fired = threading.Event()
+    try:
+        scheduler.schedule("a", time.monotonic() + 0.02, fired.set)
+        assert wait_for(fired)
+        assert scheduler.get_stats()["fired"] == 1
+    finally:
+        scheduler.stop()
+
+def test_rescheduling_replaces_the_pending_timer():
+    scheduler = SignalScheduler()
+    scheduler.start()
+    calls = []
+    done = threading.Event()
+    try:
+        scheduler.schedule("a", time.monotonic() + 0.02, lambda: calls.append("old"))
+        scheduler.schedule("a", time.monotonic() + 0.05, lambda: (calls.append("new"), done.set()))
+        assert wait_for(done)
+        time.sleep(0.03)
+        assert calls == ["new"]
+    finally:
+        scheduler.stop()
+
+def test_earlier_deadline_wakes_the_scheduler():
+    scheduler = SignalScheduler()
+    scheduler.start()
+    fired = threading.Event()
+    try:
+        scheduler.schedule("slow", time.monotonic() + 10, lambda: None)
+        time.sleep(0.01)  # Scheduler is now sleeping until the slow deadline
+        started = time.monotonic()
+        scheduler.schedule("fast", started + 0.02, fired.set)
+        assert wait_for(fired)
+        assert time.monotonic() - started < 0.5
+    finally:
+        scheduler.stop()
+
+def test_cancel_drops_the_timer():
+    scheduler = SignalScheduler()
+    scheduler.start()
+    calls = []
+    try:
+        scheduler.schedule("a", time.monotonic() + 0.02, lambda: calls.append("a"))
+        scheduler.cancel("a")
+        time.sleep(0.06)
+        assert calls == []
+        assert scheduler.get_stats()["timers"] == 0
+    finally:
+        scheduler.stop()
+
+def test_replaced_entries_are_compacted():
+    scheduler = SignalScheduler()
+    deadline = time.monotonic() + 60
+    for i in range(500):
+        scheduler.schedule("a", deadline + i, lambda: None)
+    assert len(scheduler.pending) == 1
+    assert len(scheduler.heap) <= 2 * len(scheduler.pending) + 65
@@ -0,0 +1,50 @@
+from datetime import date, datetime, time
+from storage import SQLiteStore, build_rollups
+
+def congestion_row(timestamp, green, yellow, red, signal="GREEN"):
+    return (timestamp, green, yellow, red, 1, signal)
+
+def write(store, rows, daily=None):
+    store.write_batch({"congestion_data": rows}, build_rollups(rows), daily)
+
+def test_rollups_merge_across_batches(tmp_path):
+    store = SQLiteStore(str(tmp_path / "history.db"))
+    write(store, [congestion_row(datetime(2024, 5, 1, 8, 0, 10), 1, 1, 1),
+                  congestion_row(datetime(2024, 5, 1, 8, 0, 40), 2, 2, 2, "RED")])
+    write(store, [congestion_row(datetime(2024, 5, 1, 8, 0, 50), 5, 5, 5),
+                  congestion_row(datetime(2024, 5, 1, 8, 1, 5), 0, 0, 1)])
+
+    minutes = store.select_rollups("minute")
+    assert [row[0] for row in minutes] == [datetime(2024, 5, 1, 8, 0), datetime(2024, 5, 1, 8, 1)]
+    (bucket, readings, green, yellow, red, total, occupied, green_readings,
+     total_max, total_min, peak_time) = minutes[0]
+    assert (readings, green, total, occupied, green_readings) == (3, 8, 24, 3, 2)
+    assert (total_max, total_min) == (15, 3)
+    assert peak_time == datetime(2024, 5, 1, 8, 0, 50)
+
+    (hour,) = store.select_rollups("hour")
+    assert hour[1] == 4 and hour[5] == 25 and hour[9] == 1
+    store.close()
+
+def test_system_stats_add_up_per_flush(tmp_path):
+    store = SQLiteStore(str(tmp_path / "history.db"))
+    day = date(2024, 5, 1)
+    write(store, [congestion_row(datetime(2024, 5, 1, 8, 0, 10), 1, 1, 1)], {day: (4, 2)})
+    write(store, [congestion_row(datetime(2024, 5, 1, 8, 0, 20), 3, 3, 3),
+                  congestion_row(datetime(2024, 5, 1, 8, 2, 0), 0, 0, 0)], {day: (1, 1)})
+
+    ((stat_day, vehicles, average, peak, signal_changes, uptime),) = store.select_system_stats()
+    assert stat_day == "2024-05-01"
+    assert (vehicles, signal_changes) == (5, 3)
+    assert average == 4.0
+    assert peak == time(8, 0, 20).isoformat()
+    # Minutes 08:00 and 08:02 have readings; 08:00 is counted once
+    assert uptime == 2
+    store.close()
+
+def test_signal_history_has_intersection_column(tmp_path):
+    store = SQLiteStore(str(tmp_path / "history.db"))
+    store.insert_many("signal_history", [(datetime(2024, 5, 1, 8), "GREEN", 30, "automatic", "main_1")])
+    row = store.conn.execute("SELECT signal_type, intersection_id FROM signal_history").fetchone()
+    assert row == ("GREEN", "main_1")
+    store.close()
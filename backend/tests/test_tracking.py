@@ -0,0 +1,56 @@
+import numpy as np
+from tracking import iou_matrix, greedy_match
+
+def reference_greedy(score, threshold, higher_is_better=True):
+    """Walk the sorted candidates one by one"""
+    order = np.argsort(-score if higher_is_better else score, axis=None, kind="stable")
+    rows, cols, used_rows, used_cols = [], [], set(), set()
+    for flat in order:
+        row, col = np.unravel_index(flat, score.shape)
+        value = score[row, col]
+        if (value < threshold) if higher_is_better else (value > threshold):
+            break
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        rows.append(row)
+        cols.append(col)
+    return sorted(zip(rows, cols))
+
+def test_iou_matrix():
+    boxes_a = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=np.float64)
+    boxes_b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [40, 40, 50, 50]], dtype=np.float64)
+    iou = iou_matrix(boxes_a, boxes_b)
+    assert iou.shape == (2, 3)
+    assert np.allclose(iou[0], [1.0, 50 / 150, 0.0])
+    assert np.allclose(iou[1], 0.0)
+
+def test_iou_matrix_degenerate_boxes():
+    point = np.array([[5, 5, 5, 5]], dtype=np.float64)
+    assert iou_matrix(point, point)[0, 0] == 0.0
+
+def test_greedy_match_takes_best_pairs_first():
+    score = np.array([[0.9, 0.8],
+                      [0.85, 0.1]])
+    rows, cols = greedy_match(score, 0.3)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 0)]
+
+def test_greedy_match_distance_mode():
+    distance = np.array([[1.0, 5.0],
+                         [2.0, 3.0]])
+    rows, cols = greedy_match(distance, 4.0, higher_is_better=False)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 0), (1, 1)]
+
+def test_greedy_match_empty():
+    rows, cols = greedy_match(np.empty((0, 3)), 0.5)
+    assert len(rows) == 0 and len(cols) == 0
+
+def test_greedy_match_matches_sequential_walk():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        shape = tuple(rng.integers(1, 12, size=2))
+        # Coarse values produce ties, which must break the same way
+        score = rng.integers(0, 6, size=shape) / 5.0
+        rows, cols = greedy_match(score, 0.4)
+        assert sorted(zip(rows.tolist(), cols.tolist())) == reference_greedy(score, 0.4)
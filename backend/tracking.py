@@ -0,0 +1,239 @@
+import time
+import numpy as np
+from collections import deque
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes"""
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+def greedy_match(score, threshold, higher_is_better=True):
+    """Greedily pair rows and columns of a score matrix, best pairs first.
+
+    Gives the same pairs as walking the sorted candidates one by one, but in
+    vectorized rounds: a candidate that comes first for both its row and its
+    column among the remaining ones would be taken by that walk, so every
+    such pair is taken at once and the rows and columns it uses are masked
+    out. The best remaining pair always qualifies, so each round makes progress.
+    """
+    if score.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    valid = score >= threshold if higher_is_better else score <= threshold
+    rows, cols = np.nonzero(valid)
+    values = score[rows, cols]
+    order = np.argsort(-values if higher_is_better else values, kind='stable')
+    rows, cols = rows[order], cols[order]
+
+    used_rows = np.zeros(score.shape[0], dtype=bool)
+    used_cols = np.zeros(score.shape[1], dtype=bool)
+    matched_rows, matched_cols = [], []
+    while len(rows):
+        # Rank of the first remaining candidate of every row and column
+        rank = np.arange(len(rows))
+        first_in_row = np.full(score.shape[0], len(rows))
+        np.minimum.at(first_in_row, rows, rank)
+        first_in_col = np.full(score.shape[1], len(rows))
+        np.minimum.at(first_in_col, cols, rank)
+        take = (first_in_row[rows] == rank) & (first_in_col[cols] == rank)
+
+        matched_rows.append(rows[take])
+        matched_cols.append(cols[take])
+        used_rows[rows[take]] = True
+        used_cols[cols[take]] = True
+        remaining = ~(used_rows[rows] | used_cols[cols])
+        rows, cols = rows[remaining], cols[remaining]
+
+    if not matched_rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(matched_rows).astype(np.int64), np.concatenate(matched_cols).astype(np.int64)
+
+class VehicleTracker:
+    """Lightweight IoU/centroid tracker with persistent vehicle IDs.
+
+    Detections are matched to constant-velocity predictions of the live
+    tracks with an IoU cost matrix, then by normalized centroid distance for
+    anything left over. Track state lives in parallel NumPy arrays so each
+    update stays cheap with 100+ vehicles per frame.
+    """
+
+    def __init__(self, boundaries, counting_line="green_line", iou_threshold=0.3,
+                 max_distance=0.08, max_age=1.0, min_hits=3, stationary_speed=0.03,
+                 flow_window=60.0, zone_count=3):
+        self.boundaries = boundaries            # Line name -> y position as a fraction of frame height
+        self.counting_line = counting_line      # Line whose crossings define the flow rate
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance        # Centroid fallback, fraction of the frame diagonal
+        self.max_age = max_age                  # Seconds a track survives without a match
+        self.min_hits = min_hits                # Matches before a track counts as a vehicle
+        self.stationary_speed = stationary_speed  # Frame heights per second treated as queued
+        self.flow_window = flow_window          # Seconds of crossings used for vehicles per minute
+        self.zone_count = zone_count
+
+        self.next_id = 1
+        self.ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float64)
+        self.velocity = np.empty((0, 2), dtype=np.float64)  # Center velocity in px/s
+        self.last_seen = np.empty(0, dtype=np.float64)
+        self.hits = np.empty(0, dtype=np.int32)
+        self.zone = np.empty(0, dtype=np.int8)
+        self.zone_enter = np.empty(0, dtype=np.float64)
+
+        # Counters
+        self.unique_vehicles = 0
+        self.line_crossings = {name: 0 for name in boundaries}
+        self.crossing_times = deque()
+        self.dwell_total = np.zeros(zone_count, dtype=np.float64)
+        self.dwell_count = np.zeros(zone_count, dtype=np.int64)
+        self.frame_height = 1
+
+    @staticmethod
+    def _centers(boxes):
+        return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+    def _record_dwell(self, zones, durations):
+        """Accumulate finished zone dwell times (tracks outside every zone are skipped)"""
+        inside = zones >= 0
+        zones, durations = zones[inside], durations[inside]
+        if len(zones):
+            zones = zones.astype(np.int64)
+            self.dwell_total += np.bincount(zones, weights=durations, minlength=self.zone_count)
+            self.dwell_count += np.bincount(zones, minlength=self.zone_count)
+
+    def update(self, detections, frame_width, frame_height, now=None):
+        """Match a structured detection array to tracks and return a track id per detection"""
+        now = time.monotonic() if now is None else now
+        self.frame_height = frame_height
+
+        det_boxes = np.stack([detections['x1'], detections['y1'], detections['x2'], detections['y2']],
+                             axis=1).astype(np.float64) if len(detections) else np.empty((0, 4))
+        det_zones = detections['zone'].astype(np.int8)
+        det_centers = self._centers(det_boxes)
+
+        # Predict where each track is now
+        dt = (now - self.last_seen)[:, None]
+        old_centers = self._centers(self.boxes)
+        predicted = self.boxes + np.tile(self.velocity * dt, 2)
+
+        # Stage 1: IoU against predicted boxes
+        track_idx, det_idx = greedy_match(iou_matrix(predicted, det_boxes), self.iou_threshold)
+
+        # Stage 2: centroid distance for whatever is left
+        free_tracks = np.setdiff1d(np.arange(len(self.ids)), track_idx)
+        free_dets = np.setdiff1d(np.arange(len(det_boxes)), det_idx)
+        if len(free_tracks) and len(free_dets):
+            diagonal = np.hypot(frame_width, frame_height)
+            predicted_centers = self._centers(predicted[free_tracks])
+            distance = np.linalg.norm(predicted_centers[:, None, :] - det_centers[None, free_dets, :], axis=2) / diagonal
+            rows, cols = greedy_match(distance, self.max_distance, higher_is_better=False)
+            track_idx = np.concatenate([track_idx, free_tracks[rows]])
+            det_idx = np.concatenate([det_idx, free_dets[cols]])
+
+        # Update matched tracks
+        if len(track_idx):
+            new_centers = det_centers[det_idx]
+            elapsed = np.maximum(now - self.last_seen[track_idx], 1e-3)[:, None]
+            measured = (new_centers - old_centers[track_idx]) / elapsed
+            self.velocity[track_idx] = 0.5 * self.velocity[track_idx] + 0.5 * measured
+
+            # Boundary line crossings by confirmed vehicles
+            confirmed = self.hits[track_idx] + 1 >= self.min_hits
+            old_y = old_centers[track_idx, 1]
+            new_y = new_centers[:, 1]
+            for name, ratio in self.boundaries.items():
+                line_y = ratio * frame_height
+                crossed = int(np.count_nonzero(confirmed & ((old_y - line_y) * (new_y - line_y) < 0)))
+                self.line_crossings[name] += crossed
+                if name == self.counting_line and crossed:
+                    self.crossing_times.extend([now] * crossed)
+
+            # Zone changes end a dwell period
+            new_zones = det_zones[det_idx]
+            changed = self.zone[track_idx] != new_zones
+            changed_idx = track_idx[changed]
+            self._record_dwell(self.zone[changed_idx], now - self.zone_enter[changed_idx])
+            self.zone_enter[changed_idx] = now
+            self.zone[track_idx] = new_zones
+
+            self.boxes[track_idx] = det_boxes[det_idx]
+            self.last_seen[track_idx] = now
+            self.hits[track_idx] += 1
+            self.unique_vehicles += int(np.count_nonzero(self.hits[track_idx] == self.min_hits))
+
+        track_ids = np.full(len(det_boxes), -1, dtype=np.int64)
+        track_ids[det_idx] = self.ids[track_idx]
+
+        # Drop tracks that have not been matched for too long (matched ones were just seen)
+        expired = (now - self.last_seen) > self.max_age
+        if np.any(expired):
+            confirmed = expired & (self.hits >= self.min_hits)
+            self._record_dwell(self.zone[confirmed], self.last_seen[confirmed] - self.zone_enter[confirmed])
+            self._keep(~expired)
+
+        # Start new tracks for unmatched detections
+        new_dets = np.setdiff1d(np.arange(len(det_boxes)), det_idx)
+        if len(new_dets):
+            new_ids = np.arange(self.next_id, self.next_id + len(new_dets), dtype=np.int64)
+            self.next_id += len(new_dets)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.boxes = np.concatenate([self.boxes, det_boxes[new_dets]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new_dets), 2))])
+            self.last_seen = np.concatenate([self.last_seen, np.full(len(new_dets), now)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new_dets), dtype=np.int32)])
+            self.zone = np.concatenate([self.zone, det_zones[new_dets]])
+            self.zone_enter = np.concatenate([self.zone_enter, np.full(len(new_dets), now)])
+            track_ids[new_dets] = new_ids
+
+        # Forget crossings outside the flow window
+        while self.crossing_times and now - self.crossing_times[0] > self.flow_window:
+            self.crossing_times.popleft()
+
+        return track_ids
+
+    def _keep(self, mask):
+        """Keep only the tracks selected by mask"""
+        self.ids = self.ids[mask]
+        self.boxes = self.boxes[mask]
+        self.velocity = self.velocity[mask]
+        self.last_seen = self.last_seen[mask]
+        self.hits = self.hits[mask]
+        self.zone = self.zone[mask]
+        self.zone_enter = self.zone_enter[mask]
+
+    def get_stats(self, zone_names, now=None):
+        """Get unique counts, flow rate, dwell times and queue length"""
+        now = time.monotonic() if now is None else now
+        confirmed = self.hits >= self.min_hits
+
+        # Vehicles that are barely moving are queued
+        speed = np.linalg.norm(self.velocity, axis=1) / max(self.frame_height, 1)
+        queued = confirmed & (speed < self.stationary_speed)
+        queue_by_zone = np.bincount(self.zone[queued & (self.zone >= 0)].astype(np.int64), minlength=self.zone_count)
+
+        # Average dwell over finished periods and for vehicles still in each zone
+        avg_dwell = np.divide(self.dwell_total, self.dwell_count,
+                              out=np.zeros(self.zone_count), where=self.dwell_count > 0)
+        in_zone = confirmed & (self.zone >= 0)
+        current_zones = self.zone[in_zone].astype(np.int64)
+        current_dwell = np.bincount(current_zones, weights=now - self.zone_enter[in_zone], minlength=self.zone_count)
+        current_count = np.bincount(current_zones, minlength=self.zone_count)
+        current_avg = np.divide(current_dwell, current_count, out=np.zeros(self.zone_count), where=current_count > 0)
+
+        return {
+            "active_tracks": int(np.count_nonzero(confirmed)),
+            "unique_vehicles": self.unique_vehicles,
+            "line_crossings": dict(self.line_crossings),
+            "vehicles_per_minute": round(len(self.crossing_times) * 60.0 / self.flow_window, 2),
+            "queue_length": int(np.count_nonzero(queued)),
+            "queue_by_zone": {name: int(queue_by_zone[i]) for i, name in enumerate(zone_names)},
+            "avg_dwell_seconds": {name: round(float(avg_dwell[i]), 2) for i, name in enumerate(zone_names)},
+            "current_dwell_seconds": {name: round(float(current_avg[i]), 2) for i, name in enumerate(zone_names)}
+        }
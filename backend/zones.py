@@ -0,0 +1,159 @@
+import json
+import cv2
+import numpy as np
+
+# Zone ids are stored as int8 in detections; -1 means "outside every zone"
+NO_ZONE = -1
+
+# Zones read by the signal controller; their layer is the primary one
+SIGNAL_ZONES = ("green_zone", "yellow_zone", "red_zone")
+
+def zone_layer(zone):
+    """Layer of a zone: explicit "layer", else "bands" for bands and "lanes" for polygons"""
+    return zone.get('layer', 'bands' if 'band' in zone else 'lanes')
+
+class ZoneLayout:
+    """Zone, boundary line and grid definition for one camera.
+
+    Zones are horizontal bands or lane polygons given as fractions of the
+    frame size. For each frame resolution the layout is compiled once into
+    integer label maps, so looking up the zones and grid cell of a detection
+    is a single array index. The signal controller reads the zones named
+    green_zone, yellow_zone and red_zone; other zones are reported as well.
+
+    Zones are grouped into layers, each compiled into its own label map, so
+    a vehicle is counted once per layer: a car in lane_1 still counts
+    towards green_zone. By default bands form the "bands" layer and
+    polygons the "lanes" layer; set "layer" on a zone to group otherwise.
+    The layer holding the signal zones is the primary one; its zone is
+    stored on each detection and used for tracking and total counts.
+
+    Config format (JSON)::
+
+        {
+            "zones": [
+                {"name": "lane_1", "color": [0, 255, 0],
+                 "polygon": [[0.1, 1.0], [0.45, 0.3], [0.5, 0.3], [0.4, 1.0]]},
+                {"name": "red_zone", "color": [0, 0, 255], "band": [0.0, 0.4]}
+            ],
+            "lines": [{"name": "stop_line", "y": 0.7, "label": "STOP", "color": [0, 255, 0]}],
+            "grid": {"rows": 16, "cols": 16}
+        }
+
+    Where zones of the same layer overlap, the one listed first wins.
+    """
+
+    def __init__(self, zones, lines=None, grid_rows=3, grid_cols=3):
+        self.zones = zones
+        self.lines = lines or []
+        self.grid_rows = grid_rows
+        self.grid_cols = grid_cols
+        self.zone_names = tuple(zone['name'] for zone in zones)
+        self.zone_colors = tuple(tuple(zone.get('color', (200, 200, 200))) for zone in zones)
+
+        # Primary layer first, then the others in order of appearance
+        layers = list(dict.fromkeys(zone_layer(zone) for zone in zones))
+        signal_layers = [zone_layer(zone) for zone in zones if zone['name'] in SIGNAL_ZONES]
+        if signal_layers:
+            layers.remove(signal_layers[0])
+            layers.insert(0, signal_layers[0])
+        self.layers = tuple(layers)
+        self.zone_layers = tuple(self.layers.index(zone_layer(zone)) for zone in zones)
+        self.primary_zones = np.array([layer == 0 for layer in self.zone_layers], dtype=bool)
+        self.compiled = {}
+
+    @classmethod
+    def default(cls, green_zone=0.7, yellow_zone=0.4, red_zone=0.1, grid_rows=3, grid_cols=3):
+        """The original three horizontal bands with a 3x3 grid"""
+        zones = [
+            {"name": "green_zone", "color": (0, 255, 0), "band": (green_zone, float('inf'))},
+            {"name": "yellow_zone", "color": (0, 255, 255), "band": (yellow_zone, green_zone)},
+            {"name": "red_zone", "color": (0, 0, 255), "band": (float('-inf'), yellow_zone)}
+        ]
+        lines = [
+            {"name": "green_line", "y": green_zone, "label": "GREEN ZONE", "color": (0, 255, 0)},
+            {"name": "yellow_line", "y": yellow_zone, "label": "YELLOW ZONE", "color": (0, 255, 255)},
+            {"name": "red_line", "y": red_zone, "label": "RED ZONE", "color": (0, 0, 255)}
+        ]
+        return cls(zones, lines, grid_rows, grid_cols)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a layout from a config dict"""
+        grid = config.get('grid', {})
+        return cls(config['zones'], config.get('lines', []),
+                   grid.get('rows', 3), grid.get('cols', 3))
+
+    @classmethod
+    def load(cls, path):
+        """Load a layout from a JSON config file"""
+        with open(path) as config_file:
+            return cls.from_config(json.load(config_file))
+
+    def compile(self, width, height):
+        """Return (zone_maps, cell_map) label maps for a frame size, built once per resolution.
+
+        zone_maps has one (height, width) map per layer, primary layer first.
+        """
+        key = (width, height)
+        if key in self.compiled:
+            return self.compiled[key]
+
+        zone_maps = np.full((len(self.layers), height, width), NO_ZONE, dtype=np.int8)
+        row_ratio = np.arange(height) / height
+
+        # Paint in reverse so that zones listed first take priority within a layer
+        for index in reversed(range(len(self.zones))):
+            zone = self.zones[index]
+            zone_map = zone_maps[self.zone_layers[index]]
+            if 'band' in zone:
+                start, end = zone['band']
+                zone_map[(row_ratio >= start) & (row_ratio < end), :] = index
+            else:
+                points = np.array(zone['polygon'], dtype=np.float64) * [width, height]
+                cv2.fillPoly(zone_map, [np.round(points).astype(np.int32)], int(index))
+
+        # Same cell rule as before: min(int(x / width * cols), cols - 1)
+        cols = np.minimum((np.arange(width) / width * self.grid_cols).astype(np.int32), self.grid_cols - 1)
+        rows = np.minimum((np.arange(height) / height * self.grid_rows).astype(np.int32), self.grid_rows - 1)
+        cell_map = (rows[:, None] * self.grid_cols + cols[None, :]).astype(np.int32)
+
+        self.compiled[key] = (zone_maps, cell_map)
+        return self.compiled[key]
+
+    def lookup(self, x, y, width, height):
+        """Zone ids (one row per layer) and grid cells for arrays of integer pixel coordinates"""
+        zone_maps, cell_map = self.compile(width, height)
+        x = np.clip(x, 0, width - 1)
+        y = np.clip(y, 0, height - 1)
+        return zone_maps[:, y, x], cell_map[y, x]
+
+    def count(self, zones):
+        """Vehicles per zone from lookup() zone ids, counting each layer separately"""
+        zones = zones[zones != NO_ZONE]
+        return np.bincount(zones.astype(np.int64), minlength=len(self.zones))
+
+    def boundaries(self):
+        """Line name -> y position fraction, used for crossing counts"""
+        return {line['name']: line['y'] for line in self.lines}
+
+    def draw(self, frame):
+        """Draw zone polygons, boundary lines and their labels"""
+        height, width = frame.shape[:2]
+
+        for zone, color in zip(self.zones, self.zone_colors):
+            if 'polygon' in zone:
+                points = np.round(np.array(zone['polygon'], dtype=np.float64) * [width, height]).astype(np.int32)
+                cv2.polylines(frame, [points], True, color, 2)
+                x, y = points.min(axis=0)
+                cv2.putText(frame, zone['name'].upper(), (int(x) + 5, int(y) + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        for line in self.lines:
+            color = tuple(line.get('color', (255, 255, 255)))
+            y = int(height * line['y'])
+            cv2.line(frame, (0, y), (width, y), color, 3)
+            cv2.putText(frame, line.get('label', line['name']), (10, y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+        return frame
@@ -27,9 +27,31 @@ CREATE TABLE IF NOT EXISTS signal_history (
     signal_type VARCHAR(10) NOT NULL,
     duration_seconds INT NOT NULL,
     reason VARCHAR(100) DEFAULT 'automatic',
+    intersection_id VARCHAR(50) DEFAULT NULL,  -- Corridor intersection; NULL for the single controller
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_timestamp (timestamp),
-    INDEX idx_signal_type (signal_type)
+    INDEX idx_signal_type (signal_type),
+    INDEX idx_intersection (intersection_id, timestamp)
+);
+-- Databases created before intersection_id existed get the column from the
+-- backend at startup (MySQLStore._migrate)
+
+-- Create congestion_rollup table: per-minute, per-hour and per-day aggregates
+-- merged in by the history writer, so long time ranges never scan congestion_data
+CREATE TABLE IF NOT EXISTS congestion_rollup (
+    resolution VARCHAR(10) NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    readings INT NOT NULL DEFAULT 0,
+    green_zone_sum INT NOT NULL DEFAULT 0,
+    yellow_zone_sum INT NOT NULL DEFAULT 0,
+    red_zone_sum INT NOT NULL DEFAULT 0,
+    total_vehicles_sum INT NOT NULL DEFAULT 0,
+    occupied_grid_cells_sum INT NOT NULL DEFAULT 0,
+    green_signal_readings INT NOT NULL DEFAULT 0,
+    total_vehicles_max INT NOT NULL DEFAULT 0,
+    total_vehicles_min INT NOT NULL DEFAULT 0,
+    peak_time DATETIME,
+    PRIMARY KEY (resolution, bucket_start)
 );
 
 -- Create system_stats table for analytics
@@ -58,44 +80,49 @@ INSERT INTO congestion_data (timestamp, green_zone_count, yellow_zone_count, red
 (NOW() - INTERVAL 2 MINUTE, 5, 8, 4, 'YELLOW'),
 (NOW() - INTERVAL 1 MINUTE, 6, 9, 5, 'RED');
 
--- Create views for analytics
-CREATE VIEW daily_congestion_summary AS
+-- Create views for analytics (read from the rollups, not the raw readings)
+CREATE OR REPLACE VIEW daily_congestion_summary AS
 SELECT 
-    DATE(timestamp) as date,
-    AVG(total_vehicles) as avg_vehicles,
-    MAX(total_vehicles) as peak_vehicles,
-    MIN(total_vehicles) as min_vehicles,
-    COUNT(*) as total_readings
-FROM congestion_data 
-GROUP BY DATE(timestamp)
+    DATE(bucket_start) as date,
+    total_vehicles_sum / readings as avg_vehicles,
+    total_vehicles_max as peak_vehicles,
+    total_vehicles_min as min_vehicles,
+    readings as total_readings
+FROM congestion_rollup 
+WHERE resolution = 'day'
 ORDER BY date DESC;
 
-CREATE VIEW hourly_congestion_pattern AS
+CREATE OR REPLACE VIEW hourly_congestion_pattern AS
 SELECT 
-    HOUR(timestamp) as hour,
-    AVG(total_vehicles) as avg_vehicles,
-    AVG(green_zone_count) as avg_green,
-    AVG(yellow_zone_count) as avg_yellow,
-    AVG(red_zone_count) as avg_red,
-    COUNT(*) as readings_count
-FROM congestion_data 
-GROUP BY HOUR(timestamp)
+    HOUR(bucket_start) as hour,
+    SUM(total_vehicles_sum) / SUM(readings) as avg_vehicles,
+    SUM(green_zone_sum) / SUM(readings) as avg_green,
+    SUM(yellow_zone_sum) / SUM(readings) as avg_yellow,
+    SUM(red_zone_sum) / SUM(readings) as avg_red,
+    SUM(readings) as readings_count
+FROM congestion_rollup 
+WHERE resolution = 'hour'
+GROUP BY HOUR(bucket_start)
 ORDER BY hour;
 
--- Create stored procedures
+-- Create stored procedures (dropped first so the script can be re-run on an existing install)
+DROP PROCEDURE IF EXISTS GetCongestionStats;
+DROP PROCEDURE IF EXISTS CleanOldData;
+DROP PROCEDURE IF EXISTS RebuildRollups;
+
 DELIMITER //
 
 CREATE PROCEDURE GetCongestionStats(IN days_back INT)
 BEGIN
     SELECT 
-        DATE(timestamp) as date,
-        AVG(total_vehicles) as avg_vehicles,
-        MAX(total_vehicles) as peak_vehicles,
-        COUNT(*) as total_readings,
-        AVG(CASE WHEN signal_status = 'GREEN' THEN 1 ELSE 0 END) * 100 as green_percentage
-    FROM congestion_data 
-    WHERE timestamp >= DATE_SUB(NOW(), INTERVAL days_back DAY)
-    GROUP BY DATE(timestamp)
+        DATE(bucket_start) as date,
+        total_vehicles_sum / readings as avg_vehicles,
+        total_vehicles_max as peak_vehicles,
+        readings as total_readings,
+        green_signal_readings / readings * 100 as green_percentage
+    FROM congestion_rollup 
+    WHERE resolution = 'day'
+      AND bucket_start >= DATE_SUB(CURDATE(), INTERVAL days_back DAY)
     ORDER BY date DESC;
 END //
 
@@ -106,10 +133,48 @@ BEGIN
     
     DELETE FROM signal_history 
     WHERE timestamp < DATE_SUB(NOW(), INTERVAL days_to_keep DAY);
+    
+    -- Hour and day rollups are small and kept for long-range charts
+    DELETE FROM congestion_rollup 
+    WHERE resolution = 'minute' AND bucket_start < DATE_SUB(NOW(), INTERVAL days_to_keep DAY);
+END //
+
+-- Rebuild all rollups from congestion_data (for data loaded outside the application)
+CREATE PROCEDURE RebuildRollups()
+BEGIN
+    DELETE FROM congestion_rollup;
+    
+    INSERT INTO congestion_rollup (resolution, bucket_start, readings, green_zone_sum, yellow_zone_sum,
+                                   red_zone_sum, total_vehicles_sum, occupied_grid_cells_sum,
+                                   green_signal_readings, total_vehicles_max, total_vehicles_min, peak_time)
+    SELECT 
+        buckets.resolution,
+        buckets.bucket_start,
+        COUNT(*),
+        SUM(green_zone_count),
+        SUM(yellow_zone_count),
+        SUM(red_zone_count),
+        SUM(total_vehicles),
+        SUM(COALESCE(occupied_grid_cells, 0)),
+        SUM(signal_status = 'GREEN'),
+        MAX(total_vehicles),
+        MIN(total_vehicles),
+        SUBSTRING_INDEX(GROUP_CONCAT(timestamp ORDER BY total_vehicles DESC, timestamp), ',', 1)
+    FROM (
+        SELECT 'minute' as resolution, DATE_FORMAT(timestamp, '%Y-%m-%d %H:%i:00') as bucket_start, c.* FROM congestion_data c
+        UNION ALL
+        SELECT 'hour', DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), c.* FROM congestion_data c
+        UNION ALL
+        SELECT 'day', DATE(timestamp), c.* FROM congestion_data c
+    ) buckets
+    GROUP BY buckets.resolution, buckets.bucket_start;
 END //
 
 DELIMITER ;
 
+-- Roll up the sample data
+CALL RebuildRollups();
+
 -- Create user for the application (optional)
 -- CREATE USER 'traffic_user'@'localhost' IDENTIFIED BY 'traffic_password';
 -- GRANT SELECT, INSERT, UPDATE, DELETE ON traffic_management.* TO 'traffic_user'@'localhost';
@@ -118,4 +183,5 @@ DELIMITER ;
 -- Show table structure
 DESCRIBE congestion_data;
 DESCRIBE signal_history;
+DESCRIBE congestion_rollup;
 DESCRIBE system_stats;
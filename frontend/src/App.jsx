@@ -5,10 +5,13 @@ import SignalStatus from './components/SignalStatus';
 import VehicleCount from './components/VehicleCount';
 import CongestionChart from './components/CongestionChart';
 import MockDemo from './MockDemo';
+import useLiveStream from './useLiveStream';
 import './index.css';
 
 function App() {
   const [demoMode, setDemoMode] = useState(false);
+  const snapshot = useLiveStream();
+  const streaming = snapshot !== null;
   const [systemHealth, setSystemHealth] = useState({
     status: 'unknown',
     camera_active: false,
@@ -16,6 +19,18 @@ function App() {
   });
 
   useEffect(() => {
+    // Health arrives with every pushed snapshot
+    if (streaming) {
+      setSystemHealth(snapshot.health);
+      setDemoMode(false);
+    }
+  }, [streaming, snapshot]);
+
+  useEffect(() => {
+    if (streaming) {
+      return undefined;
+    }
+
     const checkSystemHealth = async () => {
       try {
         const response = await axios.get('/api/health');
@@ -36,7 +51,7 @@ function App() {
     const interval = setInterval(checkSystemHealth, 10000);
 
     return () => clearInterval(interval);
-  }, []);
+  }, [streaming]);
 
   // If demo mode is enabled, show the mock demo
   if (demoMode) {
@@ -69,14 +84,14 @@ function App() {
 
       <main className="dashboard">
         <LiveFeed />
-        <SignalStatus />
+        <SignalStatus snapshot={snapshot} />
         
         <div className="stats-container">
-          <VehicleCount />
+          <VehicleCount snapshot={snapshot} />
           
           <div style={{ marginTop: '30px' }}>
             <h2 className="card-title">📈 Congestion Trends</h2>
-            <CongestionChart />
+            <CongestionChart snapshot={snapshot} />
           </div>
         </div>
       </main>
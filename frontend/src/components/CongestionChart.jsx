@@ -2,11 +2,33 @@ import React, { useState, useEffect } from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import axios from 'axios';
 
-const CongestionChart = () => {
+// Points kept on the chart (matches the /api/history default limit)
+const MAX_POINTS = 50;
+
+// Format a history entry for the chart
+const toChartPoint = (entry) => ({
+  time: new Date(entry.timestamp).toLocaleTimeString(),
+  green: entry.zone_counts.green_zone,
+  yellow: entry.zone_counts.yellow_zone,
+  red: entry.zone_counts.red_zone,
+  total: entry.total_vehicles,
+  signal: entry.signal_status
+});
+
+const CongestionChart = ({ snapshot }) => {
   const [historyData, setHistoryData] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
+  const streaming = Boolean(snapshot);
+
+  // While streaming, each snapshot carries only the readings since the previous one
+  useEffect(() => {
+    if (streaming && snapshot.history_delta.length > 0) {
+      setHistoryData((current) => current.concat(snapshot.history_delta.map(toChartPoint)).slice(-MAX_POINTS));
+    }
+  }, [streaming, snapshot]);
+
   useEffect(() => {
     const fetchHistoryData = async () => {
       try {
@@ -14,16 +36,7 @@ const CongestionChart = () => {
         const history = response.data.history || [];
         
         // Format data for the chart
-        const chartData = history.map((entry, index) => ({
-          time: new Date(entry.timestamp).toLocaleTimeString(),
-          green: entry.zone_counts.green_zone,
-          yellow: entry.zone_counts.yellow_zone,
-          red: entry.zone_counts.red_zone,
-          total: entry.total_vehicles,
-          signal: entry.signal_status
-        }));
-        
-        setHistoryData(chartData);
+        setHistoryData(history.map(toChartPoint));
         setError(null);
       } catch (err) {
         setError('Failed to fetch history data');
@@ -33,14 +46,18 @@ const CongestionChart = () => {
       }
     };
 
-    // Fetch immediately
+    // Fetch immediately (also the starting point for streamed deltas)
     fetchHistoryData();
 
+    if (streaming) {
+      return undefined;
+    }
+
     // Update every 5 seconds
     const interval = setInterval(fetchHistoryData, 5000);
 
     return () => clearInterval(interval);
-  }, []);
+  }, [streaming]);
 
   const CustomTooltip = ({ active, payload, label }) => {
     if (active && payload && payload.length) {
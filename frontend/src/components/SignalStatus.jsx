@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 
-const SignalStatus = () => {
+const SignalStatus = ({ snapshot }) => {
   const [signalData, setSignalData] = useState({
     current_signal: 'GREEN',
     time_remaining: 30,
@@ -11,7 +11,22 @@ const SignalStatus = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
+  const streaming = Boolean(snapshot);
+
+  // Pushed snapshots replace polling while the stream is connected
+  useEffect(() => {
+    if (streaming) {
+      setSignalData(snapshot.signal);
+      setError(null);
+      setLoading(false);
+    }
+  }, [streaming, snapshot]);
+
   useEffect(() => {
+    if (streaming) {
+      return undefined;
+    }
+
     const fetchSignalStatus = async () => {
       try {
         const response = await axios.get('/api/signal-status');
@@ -32,7 +47,7 @@ const SignalStatus = () => {
     const interval = setInterval(fetchSignalStatus, 1000);
 
     return () => clearInterval(interval);
-  }, []);
+  }, [streaming]);
 
   const forceSignalChange = async (signal) => {
     try {
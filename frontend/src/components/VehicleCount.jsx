@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 
-const VehicleCount = () => {
+const VehicleCount = ({ snapshot }) => {
   const [congestionData, setCongestionData] = useState({
     zone_counts: {
       green_zone: 0,
@@ -14,7 +14,22 @@ const VehicleCount = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
+  const streaming = Boolean(snapshot);
+
+  // Pushed snapshots replace polling while the stream is connected
+  useEffect(() => {
+    if (streaming) {
+      setCongestionData(snapshot.congestion);
+      setError(null);
+      setLoading(false);
+    }
+  }, [streaming, snapshot]);
+
   useEffect(() => {
+    if (streaming) {
+      return undefined;
+    }
+
     const fetchCongestionData = async () => {
       try {
         const response = await axios.get('/api/congestion');
@@ -35,7 +50,13 @@ const VehicleCount = () => {
     const interval = setInterval(fetchCongestionData, 2000);
 
     return () => clearInterval(interval);
-  }, []);
+  }, [streaming]);
+
+  // Grid size follows the camera's zone layout (3x3 unless configured)
+  const gridDensity = congestionData.grid_density || [];
+  const gridRows = gridDensity.length || 3;
+  const gridCols = (gridDensity[0] && gridDensity[0].length) || 3;
+  const gridCells = gridRows * gridCols;
 
   if (loading) {
     return (
@@ -97,7 +118,7 @@ const VehicleCount = () => {
         <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
           <span style={{ fontSize: '0.9rem' }}>Grid Occupancy:</span>
           <span style={{ fontSize: '1.2rem', fontWeight: 'bold', color: '#9b59b6' }}>
-            {congestionData.occupied_grid_cells}/9
+            {congestionData.occupied_grid_cells}/{gridCells}
           </span>
         </div>
         
@@ -110,7 +131,7 @@ const VehicleCount = () => {
           overflow: 'hidden'
         }}>
           <div style={{ 
-            width: `${(congestionData.occupied_grid_cells / 9) * 100}%`, 
+            width: `${(congestionData.occupied_grid_cells / gridCells) * 100}%`, 
             height: '100%', 
             background: 'linear-gradient(90deg, #3498db, #9b59b6)',
             borderRadius: '4px',
@@ -121,8 +142,8 @@ const VehicleCount = () => {
       
       <div style={{ marginTop: '20px', fontSize: '0.8rem', color: '#95a5a6' }}>
         <p>🎯 Detection includes: Cars, Buses, Trucks, Motorcycles</p>
-        <p>📐 Grid system: 3×3 cells for congestion analysis</p>
-        <p>⏱️ Updates every 2 seconds</p>
+        <p>📐 Grid system: {gridRows}×{gridCols} cells for congestion analysis</p>
+        <p>⏱️ {streaming ? 'Live updates via server push' : 'Updates every 2 seconds'}</p>
       </div>
     </div>
   );
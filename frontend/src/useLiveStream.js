@@ -0,0 +1,32 @@
+import { useState, useEffect } from 'react';
+
+// Subscribe to /api/stream (server-sent events). Returns the latest snapshot,
+// or null while the stream is unavailable so components can fall back to polling.
+const useLiveStream = () => {
+  const [snapshot, setSnapshot] = useState(null);
+
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') {
+      return undefined;
+    }
+
+    const source = new EventSource('/api/stream');
+
+    source.addEventListener('snapshot', (event) => {
+      try {
+        setSnapshot(JSON.parse(event.data));
+      } catch (err) {
+        console.error('Stream snapshot error:', err);
+      }
+    });
+
+    // EventSource reconnects by itself; poll in the meantime
+    source.onerror = () => setSnapshot(null);
+
+    return () => source.close();
+  }, []);
+
+  return snapshot;
+};
+
+export default useLiveStream;